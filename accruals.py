@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+Accrual policies: hours earned per pay period instead of one static
+allotment.
+
+A policy grants hours_per_period of a PTO type on a weekly, biweekly,
+semimonthly, monthly or annual schedule, optionally limited to one
+employment_type and to employees with at least min_years_service (counted
+from hire_date; employees without one count as new). When several policies
+match a balance, the most senior one wins, then one specific to the
+employee's type over one for anyone.
+
+Hours are posted at the end of each period as 'accrual' ledger rows keyed
+by period ("monthly:2025-06-01"), so running the same period twice posts
+nothing new. A policy accrues for the periods that start on or after its
+start_date; a run posts every one of those that has ended since the
+policy's posted_through, oldest first, so a missed run (or a cron less
+frequent than a policy) is made up on the next one. A run works a batch of employees per transaction with a few
+set-based statements, whatever the number of balances:
+
+    INSERT OR IGNORE INTO balance_ledger ... SELECT    -- one row per balance
+    UPDATE pto_balances ... FROM balance_ledger        -- apply what was posted
+
+max_balance stops accruing once remaining hours reach it. carry_over_cap
+is applied by rollover(): the year's remaining hours, capped, become the
+next year's opening allotment, recorded as an 'adjustment' dated January 1.
+
+Usage:
+    python accruals.py policies
+    python accruals.py add-policy --type VAC --hours 6.67 --frequency semimonthly
+        [--employment-type salaried] [--min-years 5] [--max-balance 240]
+        [--carry-over-cap 40] [--start 2025-07-01]
+    python accruals.py deactivate-policy POLICY_ID
+    python accruals.py run [--date 2025-06-30]
+    python accruals.py rollover 2025
+"""
+import argparse
+import calendar
+from datetime import date, timedelta
+from pathlib import Path
+
+import db
+
+BASE_DIR = Path(__file__).resolve().parent
+DB_PATH = BASE_DIR / "pto_tracker.db"
+
+FREQUENCIES = ("weekly", "biweekly", "semimonthly", "monthly", "annual")
+ACCRUAL_BATCH_SIZE = 2000  # employees per transaction
+BIWEEKLY_ANCHOR = date(2024, 1, 1)  # a Monday; biweekly periods start every 14 days from it
+
+
+# --- Periods ---
+
+def period_for(frequency, day):
+    """(start, end) of the period of this frequency containing day."""
+    if frequency == "weekly":
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=6)
+    if frequency == "biweekly":
+        start = day - timedelta(days=(day - BIWEEKLY_ANCHOR).days % 14)
+        return start, start + timedelta(days=13)
+    if frequency == "semimonthly":
+        if day.day <= 15:
+            return day.replace(day=1), day.replace(day=15)
+        last = calendar.monthrange(day.year, day.month)[1]
+        return day.replace(day=16), day.replace(day=last)
+    if frequency == "monthly":
+        last = calendar.monthrange(day.year, day.month)[1]
+        return day.replace(day=1), day.replace(day=last)
+    if frequency == "annual":
+        return date(day.year, 1, 1), date(day.year, 12, 31)
+    raise ValueError(f"unknown frequency {frequency!r}")
+
+
+def periods_between(frequency, first_day, on):
+    """(period key, start, end) of each period of this frequency starting on or after first_day and ending by on."""
+    start, end = period_for(frequency, first_day)
+    if start < first_day:
+        start, end = period_for(frequency, end + timedelta(days=1))
+    while end <= on:
+        yield f"{frequency}:{start.isoformat()}", start, end
+        start, end = period_for(frequency, end + timedelta(days=1))
+
+
+# --- Policy matching ---
+
+# One row per (employee, type): the policy that applies as of :as_of, or as
+# of the end of the policy's period when {periods_join} supplies one.
+_MATCHED_POLICIES = """
+    ranked AS (
+        SELECT
+            e.id AS employee_id, p.id AS policy_id, p.pto_type_id, p.hours_per_period,
+            p.max_balance, p.carry_over_cap, {as_of} AS as_of{period_columns},
+            ROW_NUMBER() OVER (
+                PARTITION BY e.id, p.pto_type_id
+                ORDER BY p.min_years_service DESC, p.employment_type IS NULL, p.id
+            ) AS rank
+        FROM employees e
+        JOIN accrual_policies p
+            ON p.is_active = 1
+            AND (p.employment_type IS NULL OR p.employment_type = e.employment_type)
+        JOIN pto_types t ON t.id = p.pto_type_id AND t.is_active = 1
+        {periods_join}
+        WHERE e.status = 'active'
+            AND e.id BETWEEN :first AND :last
+            AND (e.hire_date IS NULL OR e.hire_date <= {as_of})
+            AND COALESCE((julianday({as_of}) - julianday(e.hire_date)) / 365.25, 0)
+                >= p.min_years_service
+    ),
+    matched AS (
+        SELECT * FROM ranked WHERE rank = 1
+    )
+"""
+
+
+def _employee_batches(conn):
+    """(first, last) employee id ranges of ACCRUAL_BATCH_SIZE active employees."""
+    last_id = 0
+    while True:
+        ids = [
+            row[0] for row in conn.execute(
+                """
+                SELECT id FROM employees
+                WHERE status = 'active' AND id > ?
+                ORDER BY id
+                LIMIT ?
+                """,
+                (last_id, ACCRUAL_BATCH_SIZE),
+            )
+        ]
+        if not ids:
+            return
+        yield ids[0], ids[-1]
+        last_id = ids[-1]
+
+
+def _apply_posted(conn, before_id):
+    """Add ledger rows posted after before_id to pto_balances and drop the snapshots they invalidate."""
+    conn.execute(
+        """
+        UPDATE pto_balances
+        SET hours_allotted = pto_balances.hours_allotted + posted.allotted,
+            hours_used = pto_balances.hours_used + posted.used
+        FROM (
+            SELECT employee_id, pto_type_id,
+                   SUM(allotted_delta) AS allotted, SUM(used_delta) AS used
+            FROM balance_ledger
+            WHERE id > ?
+            GROUP BY employee_id, pto_type_id
+        ) AS posted
+        WHERE pto_balances.employee_id = posted.employee_id
+            AND pto_balances.pto_type_id = posted.pto_type_id
+        """,
+        (before_id,),
+    )
+    conn.execute(
+        """
+        DELETE FROM balance_snapshots
+        WHERE EXISTS (
+            SELECT 1 FROM balance_ledger l
+            WHERE l.id > ?
+                AND l.employee_id = balance_snapshots.employee_id
+                AND l.pto_type_id = balance_snapshots.pto_type_id
+                AND l.effective_date <= balance_snapshots.as_of
+        )
+        """,
+        (before_id,),
+    )
+
+
+def _max_ledger_id(conn):
+    return conn.execute("SELECT COALESCE(MAX(id), 0) FROM balance_ledger").fetchone()[0]
+
+
+# --- Runs ---
+
+def due_periods(conn, on):
+    """{end date: [(frequency, period key, start), ...]} of periods active policies haven't posted by on."""
+    due = {}
+    for policy in conn.execute(
+        "SELECT frequency, start_date, posted_through FROM accrual_policies WHERE is_active = 1"
+    ):
+        first_day = date.fromisoformat(policy["start_date"])
+        if policy["posted_through"]:
+            first_day = max(first_day, date.fromisoformat(policy["posted_through"]) + timedelta(days=1))
+        for period, start, end in periods_between(policy["frequency"], first_day, on):
+            due.setdefault(end, set()).add((policy["frequency"], period, start))
+    return {end: sorted(periods) for end, periods in due.items()}
+
+
+def run(conn, on=None, verbose=False):
+    """
+    Post accruals for every period that ended on or before on (default
+    today) and that an active policy hasn't posted yet, oldest first, so
+    max_balance sees each period's postings before the next. Periods already
+    posted are skipped, so a repeated or overlapping run is harmless.
+    Returns the number of ledger rows posted.
+    """
+    on = on or date.today()
+    total = 0
+    for end, periods in sorted(due_periods(conn, on).items()):
+        params = {"end": end.isoformat()}
+        values = []
+        for n, (frequency, period, start) in enumerate(periods):
+            params.update({f"frequency{n}": frequency, f"period{n}": period, f"start{n}": start.isoformat()})
+            values.append(f"(:frequency{n}, :period{n}, :start{n}, :end)")
+        sql = f"""
+            WITH periods (frequency, period, start_date, end_date) AS (VALUES {", ".join(values)}),
+            {_MATCHED_POLICIES.format(
+                as_of="pr.end_date",
+                period_columns=", pr.period",
+                periods_join="JOIN periods pr ON pr.frequency = p.frequency AND pr.start_date >= p.start_date",
+            )}
+            INSERT OR IGNORE INTO balance_ledger
+                (employee_id, pto_type_id, kind, allotted_delta, effective_date, period, note)
+            SELECT
+                m.employee_id, m.pto_type_id, 'accrual',
+                CASE
+                    WHEN m.max_balance IS NULL THEN m.hours_per_period
+                    ELSE MIN(m.hours_per_period, m.max_balance - (b.hours_allotted - b.hours_used))
+                END AS accrued,
+                m.as_of, m.period, 'policy #' || m.policy_id
+            FROM matched m
+            JOIN pto_balances b ON b.employee_id = m.employee_id AND b.pto_type_id = m.pto_type_id
+            WHERE accrued > 0
+        """
+        if verbose:
+            print(f"Periods ending {end.isoformat()}:")
+        total += _run_batches(conn, sql, params, "Accrued", verbose)
+
+        def mark_posted(conn):
+            conn.executemany(
+                """
+                UPDATE accrual_policies
+                SET posted_through = ?
+                WHERE is_active = 1 AND frequency = ? AND start_date <= ?
+                    AND (posted_through IS NULL OR posted_through < ?)
+                """,
+                [(end.isoformat(), frequency, start.isoformat(), end.isoformat())
+                 for frequency, _, start in periods],
+            )
+
+        db.run_write(conn, mark_posted)
+    return total
+
+
+def rollover(conn, year, verbose=False):
+    """
+    Close out a year for balances whose policy has a carry_over_cap: the
+    year's remaining hours, up to the cap, become the allotment from
+    January 1 and used hours start again at zero. Entries booked into the
+    new year keep counting against it. Safe to repeat. Returns the number of
+    balances rolled over.
+    """
+    import ledger
+
+    params = {
+        "as_of": date(year, 12, 31).isoformat(),
+        "new_year": date(year + 1, 1, 1).isoformat(),
+        "period": f"rollover:{year}",
+    }
+    sql = f"""
+        WITH {_MATCHED_POLICIES.format(as_of=":as_of", period_columns="", periods_join="")}
+        INSERT OR IGNORE INTO balance_ledger
+            (employee_id, pto_type_id, kind, allotted_delta, used_delta, effective_date, period, note)
+        SELECT
+            m.employee_id, m.pto_type_id, 'adjustment',
+            MIN(y.hours_allotted - y.hours_used, m.carry_over_cap) - y.hours_allotted AS allotted_change,
+            -y.hours_used AS used_change,
+            :new_year, :period, 'rollover, policy #' || m.policy_id
+        FROM matched m
+        JOIN ({ledger._balances_query("employee_id BETWEEN :first AND :last")}) y
+            ON y.employee_id = m.employee_id AND y.pto_type_id = m.pto_type_id
+        JOIN pto_balances b ON b.employee_id = m.employee_id AND b.pto_type_id = m.pto_type_id
+        WHERE m.carry_over_cap IS NOT NULL
+            AND (abs(allotted_change) > {ledger.EPSILON} OR abs(used_change) > {ledger.EPSILON})
+    """
+    return _run_batches(conn, sql, params, "Rolled over", verbose)
+
+
+def _run_batches(conn, sql, params, label, verbose):
+    """Run an INSERT ... SELECT into the ledger per employee batch and apply what it posted."""
+    import balance_cache
+
+    total = 0
+    for first, last in _employee_batches(conn):
+
+        def post_batch(conn):
+            before_id = _max_ledger_id(conn)
+            with balance_cache.invalidating(conn):
+                conn.execute(sql, {**params, "first": first, "last": last})
+                # rowcount isn't reported for statements starting with WITH.
+                posted = conn.execute(
+                    "SELECT COUNT(*) FROM balance_ledger WHERE id > ?", (before_id,)
+                ).fetchone()[0]
+                if posted:
+                    _apply_posted(conn, before_id)
+            return posted
+
+        total += db.run_write(conn, post_batch)
+        if verbose:
+            print(f"{label} balances for employees up to #{last}...")
+    return total
+
+
+# --- Policies ---
+
+def list_policies(conn):
+    return conn.execute(
+        """
+        SELECT p.*, t.code AS pto_type_code
+        FROM accrual_policies p
+        JOIN pto_types t ON t.id = p.pto_type_id
+        ORDER BY p.is_active DESC, t.code, p.min_years_service, p.id
+        """
+    ).fetchall()
+
+
+def add_policy(conn, pto_type_id, hours_per_period, frequency, employment_type=None,
+               min_years_service=0.0, max_balance=None, carry_over_cap=None, start_date=None):
+    """Create a policy accruing for periods from start_date (default today) and return its id."""
+    if frequency not in FREQUENCIES:
+        raise ValueError(f"frequency must be one of {', '.join(FREQUENCIES)}")
+    start_date = start_date or date.today()
+    return db.run_write(
+        conn,
+        lambda conn: conn.execute(
+            """
+            INSERT INTO accrual_policies
+                (pto_type_id, employment_type, min_years_service, frequency,
+                 hours_per_period, max_balance, carry_over_cap, start_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (pto_type_id, employment_type, min_years_service, frequency,
+             hours_per_period, max_balance, carry_over_cap, start_date.isoformat()),
+        ).lastrowid,
+    )
+
+
+def deactivate_policy(conn, policy_id):
+    """Stop a policy from accruing; hours it already posted stay. Returns False if it doesn't exist."""
+    return db.run_write(
+        conn,
+        lambda conn: conn.execute(
+            "UPDATE accrual_policies SET is_active = 0 WHERE id = ?", (policy_id,)
+        ).rowcount > 0,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accrual policies and runs.")
+    parser.add_argument("--db", default=str(DB_PATH), help="path to the SQLite database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("policies", help="list accrual policies")
+    add_cmd = commands.add_parser("add-policy", help="create an accrual policy")
+    add_cmd.add_argument("--type", required=True, help="PTO type code")
+    add_cmd.add_argument("--hours", type=float, required=True, help="hours per period")
+    add_cmd.add_argument("--frequency", required=True, choices=FREQUENCIES)
+    add_cmd.add_argument("--employment-type", choices=("hourly", "salaried"), help="default: anyone")
+    add_cmd.add_argument("--min-years", type=float, default=0.0, help="minimum years of service")
+    add_cmd.add_argument("--max-balance", type=float, help="stop accruing at this many remaining hours")
+    add_cmd.add_argument("--carry-over-cap", type=float, help="hours kept at year-end rollover")
+    add_cmd.add_argument("--start", help="accrue for periods from YYYY-MM-DD (default today)")
+    deactivate_cmd = commands.add_parser("deactivate-policy", help="stop a policy from accruing")
+    deactivate_cmd.add_argument("policy_id", type=int)
+    run_cmd = commands.add_parser("run", help="post accruals for periods ended by a date")
+    run_cmd.add_argument("--date", help="YYYY-MM-DD (default today)")
+    rollover_cmd = commands.add_parser("rollover", help="carry balances over into the next year")
+    rollover_cmd.add_argument("year", type=int)
+    args = parser.parse_args()
+
+    conn = db.connect(args.db)
+    try:
+        if args.command == "policies":
+            for p in list_policies(conn):
+                line = (
+                    f"#{p['id']} {p['pto_type_code']}: {p['hours_per_period']:g}h {p['frequency']}, "
+                    f"{p['employment_type'] or 'any employment type'}, {p['min_years_service']:g}+ years, "
+                    f"from {p['start_date']}"
+                )
+                if p["max_balance"] is not None:
+                    line += f", max balance {p['max_balance']:g}"
+                if p["carry_over_cap"] is not None:
+                    line += f", carry over {p['carry_over_cap']:g}"
+                print(line if p["is_active"] else f"{line} (inactive)")
+        elif args.command == "add-policy":
+            row = conn.execute("SELECT id FROM pto_types WHERE code = ?", (args.type,)).fetchone()
+            if row is None:
+                print(f"No PTO type with code {args.type!r}.")
+                return 1
+            policy_id = add_policy(
+                conn, row["id"], args.hours, args.frequency, args.employment_type,
+                args.min_years, args.max_balance, args.carry_over_cap,
+                date.fromisoformat(args.start) if args.start else None,
+            )
+            print(f"Created policy #{policy_id}.")
+        elif args.command == "deactivate-policy":
+            if not deactivate_policy(conn, args.policy_id):
+                print(f"No policy #{args.policy_id}.")
+                return 1
+            print(f"Deactivated policy #{args.policy_id}.")
+        elif args.command == "run":
+            on = date.fromisoformat(args.date) if args.date else None
+            print(f"Posted {run(conn, on, verbose=True)} accrual(s).")
+        else:
+            print(f"Rolled over {rollover(conn, args.year, verbose=True)} balance(s).")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,479 @@
+"""
+JSON API, version 1, mounted at /api/v1.
+
+Covers what the employee list, employee detail, PTO entry form and
+calendar pages do, with the same rules, for integrations that don't want
+HTML:
+
+    GET  /api/v1/pto-types
+    GET  /api/v1/employees?q=&after=&before=&per_page=
+    GET  /api/v1/employees/<id>
+    GET  /api/v1/employees/<id>/balances?as_of=YYYY-MM-DD
+    GET  /api/v1/employees/<id>/entries
+    POST /api/v1/employees/<id>/entries
+    POST /api/v1/entries/batch
+    GET  /api/v1/calendar?month=YYYY-MM&employee_id=
+
+?fields=a,b,c trims each returned object to those fields. GET responses
+carry an ETag and Last-Modified built from the change counters of the
+tables they read. A matching If-None-Match (or an If-Modified-Since no
+older than the data) gets a 304 before any query runs. JSON is written
+without whitespace.
+
+Authentication is the same session login as the HTML pages; requests
+without one get a 401 instead of a redirect.
+"""
+import calendar as cal
+import json
+from datetime import date
+from functools import wraps
+
+from flask import Blueprint, Response, current_app, request, session, url_for
+
+import balances
+import db
+import employees as employee_directory
+import entries
+import holiday_calendar
+import http_cache
+import importer
+import ledger
+import occupancy
+import pto_catalog
+import validation
+from db import get_db_connection
+
+bp = Blueprint("api", __name__, url_prefix="/api/v1")
+
+EMPLOYEE_FIELDS = tuple(c.strip() for c in employee_directory.EMPLOYEE_COLUMNS.split(","))
+ENTRY_FIELDS = (
+    "id", "employee_id", "pto_type_id", "pto_type", "start_date", "end_date", "hours", "notes",
+    "created_by", "created_at",
+)
+PTO_TYPE_FIELDS = ("id", "code", "display_name", "default_hours")
+BATCH_MODES = ("partial", "all_or_nothing")
+BATCH_LIMIT = 1000
+
+
+class ApiError(Exception):
+    def __init__(self, status, message, errors=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.errors = errors or []
+
+
+@bp.errorhandler(ApiError)
+def handle_api_error(error):
+    body = {"error": error.message}
+    if error.errors:
+        body["errors"] = error.errors
+    return json_response(body, error.status)
+
+
+def api_login_required(f):
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if "user_id" not in session:
+            raise ApiError(401, "Login required.")
+        return f(*args, **kwargs)
+    return wrapper
+
+
+def json_response(data, status=200):
+    return Response(
+        json.dumps(data, separators=(",", ":"), ensure_ascii=False),
+        status=status,
+        mimetype="application/json",
+    )
+
+
+def selected_fields(allowed):
+    """Fields named in ?fields=, or None for all of them."""
+    raw = request.args.get("fields", "").strip()
+    if not raw:
+        return None
+    fields = [f.strip() for f in raw.split(",") if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ApiError(400, "Unknown fields.", [f"Unknown field '{f}'." for f in unknown])
+    return fields
+
+
+def pick(obj, fields):
+    if fields is None:
+        return obj
+    return {f: obj[f] for f in fields if f in obj}
+
+
+def conditional_get(conn, counters, build, extra=(), exists=None):
+    """
+    Serve build() with validators derived from the given change counters,
+    or a bare 304 if the client already has this version.
+
+    Last-Modified comes from the counters alone, whatever resource was
+    asked for, so exists() (e.g. raising a 404) runs first: a missing
+    resource is never "not modified".
+    """
+    etag, last_modified = http_cache.validators(conn, counters, extra)
+    if exists is not None:
+        exists()
+    not_modified = http_cache.is_fresh(etag, last_modified)
+
+    response = Response(status=304) if not_modified else json_response(build())
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def entry_json(row):
+    return {
+        "id": row["id"],
+        "employee_id": row["employee_id"],
+        "pto_type_id": row["pto_type_id"],
+        "pto_type": row["pto_name"],
+        "start_date": row["start_date"],
+        "end_date": row["end_date"],
+        "hours": row["hours"],
+        "notes": row["notes"],
+        "created_by": row["manager_name"],
+        "created_at": row["created_at"],
+    }
+
+
+ENTRY_SELECT = """
+    SELECT
+        e.id, e.employee_id, e.pto_type_id, pt.display_name AS pto_name,
+        e.start_date, e.end_date, e.hours, e.notes,
+        m.full_name AS manager_name, e.created_at
+    FROM pto_entries e
+    JOIN pto_types pt ON pt.id = e.pto_type_id
+    LEFT JOIN managers m ON m.id = e.created_by_manager_id
+"""
+
+
+def get_employee_or_404(conn, employee_id):
+    employee = conn.execute(
+        f"SELECT {employee_directory.EMPLOYEE_COLUMNS} FROM employees WHERE id = ?",
+        (employee_id,),
+    ).fetchone()
+    if employee is None:
+        raise ApiError(404, "Employee not found.")
+    return employee
+
+
+# --- Routes ---
+
+@bp.route("/pto-types")
+@api_login_required
+def pto_types():
+    conn = get_db_connection()
+    fields = selected_fields(PTO_TYPE_FIELDS)
+
+    def build():
+        return {
+            "pto_types": [
+                pick({f: t[f] for f in PTO_TYPE_FIELDS}, fields)
+                for t in pto_catalog.active_types(conn)
+            ]
+        }
+
+    return conditional_get(conn, ("pto_types",), build)
+
+
+@bp.route("/employees")
+@api_login_required
+def employee_list():
+    conn = get_db_connection()
+    fields = selected_fields(EMPLOYEE_FIELDS)
+
+    def build():
+        page = employee_directory.fetch_employee_page(
+            conn,
+            search=request.args.get("q", "").strip(),
+            after=request.args.get("after") or None,
+            before=request.args.get("before") or None,
+            page_size=employee_directory.parse_page_size(request.args.get("per_page")),
+        )
+        return {
+            "employees": [pick(dict(row), fields) for row in page["employees"]],
+            "next_cursor": page["next_cursor"],
+            "prev_cursor": page["prev_cursor"],
+        }
+
+    return conditional_get(conn, ("employees",), build)
+
+
+@bp.route("/employees/<int:employee_id>")
+@api_login_required
+def employee_detail(employee_id):
+    conn = get_db_connection()
+    fields = selected_fields(EMPLOYEE_FIELDS + ("balances",))
+
+    def build():
+        employee = dict(get_employee_or_404(conn, employee_id))
+        if fields is None or "balances" in fields:
+            employee["balances"] = [
+                {
+                    "pto_type_id": row["pto_type_id"],
+                    "pto_type": row["display_name"],
+                    "hours_allotted": row["hours_allotted"],
+                    "hours_used": row["hours_used"],
+                    "hours_remaining": row["remaining"],
+                }
+                for row in balances.employee_summary(conn, employee_id)["balance_rows"]
+            ]
+        return pick(employee, fields)
+
+    return conditional_get(
+        conn, ("employees", "pto_balances", "pto_types"), build,
+        exists=lambda: get_employee_or_404(conn, employee_id),
+    )
+
+
+@bp.route("/employees/<int:employee_id>/balances")
+@api_login_required
+def employee_balances(employee_id):
+    """Balances from the ledger, as of a date (default: everything booked so far)."""
+    conn = get_db_connection()
+    as_of = request.args.get("as_of", "").strip() or None
+    if as_of:
+        try:
+            date.fromisoformat(as_of)
+        except ValueError:
+            raise ApiError(400, "as_of must be YYYY-MM-DD.")
+
+    def build():
+        totals = ledger.balances_as_of(conn, employee_id, as_of)
+        catalog = pto_catalog.get_catalog(conn)
+        return {
+            "as_of": as_of,
+            "balances": [
+                {
+                    "pto_type_id": pto_type_id,
+                    "pto_type": catalog.by_id[pto_type_id]["display_name"] if pto_type_id in catalog.by_id else None,
+                    "hours_allotted": allotted,
+                    "hours_used": used,
+                    "hours_remaining": allotted - used,
+                }
+                for pto_type_id, (allotted, used) in sorted(totals.items())
+            ],
+        }
+
+    return conditional_get(
+        conn, ("employees", "pto_balances", "pto_types"), build,
+        exists=lambda: get_employee_or_404(conn, employee_id),
+    )
+
+
+@bp.route("/employees/<int:employee_id>/entries", methods=["GET"])
+@api_login_required
+def employee_entries(employee_id):
+    conn = get_db_connection()
+    fields = selected_fields(ENTRY_FIELDS)
+
+    def build():
+        rows = conn.execute(
+            ENTRY_SELECT + "WHERE e.employee_id = ? ORDER BY e.start_date DESC",
+            (employee_id,),
+        ).fetchall()
+        return {"entries": [pick(entry_json(row), fields) for row in rows]}
+
+    return conditional_get(
+        conn, ("employees", "pto_entries", "pto_types"), build,
+        exists=lambda: get_employee_or_404(conn, employee_id),
+    )
+
+
+@bp.route("/employees/<int:employee_id>/entries", methods=["POST"])
+@api_login_required
+def employee_entry_new(employee_id):
+    """Book PTO with the same checks as the PTO entry form."""
+    conn = get_db_connection()
+    get_employee_or_404(conn, employee_id)
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise ApiError(400, "Expected a JSON object.")
+
+    def text(key):
+        value = data.get(key)
+        return "" if value is None else str(value).strip()
+
+    pto_type_id = text("pto_type_id")
+    if not pto_type_id and text("pto_type"):
+        pto_type = pto_catalog.get_catalog(conn).by_code.get(text("pto_type").upper())
+        pto_type_id = str(pto_type["id"]) if pto_type and pto_type["is_active"] else ""
+    start_date = text("start_date")
+    end_date = text("end_date")
+    notes = text("notes")
+
+    holidays = holiday_calendar.load_calendar(conn)
+    errors, pto_type_id_int, hours = validation.validate_pto_entry(
+        pto_type_id, start_date, end_date, text("hours"), holidays
+    )
+    if pto_type_id_int and pto_type_id_int not in {t["id"] for t in pto_catalog.active_types(conn)}:
+        errors.append("Unknown or inactive PTO type.")
+    if not errors:
+        balance = conn.execute(
+            """
+            SELECT hours_allotted, hours_used
+            FROM pto_balances
+            WHERE employee_id = ? AND pto_type_id = ?
+            """,
+            (employee_id, pto_type_id_int),
+        ).fetchone()
+        remaining = None if balance is None else balance["hours_allotted"] - balance["hours_used"]
+        error = validation.balance_error(remaining, hours)
+        if error:
+            errors.append(error)
+    if errors:
+        raise ApiError(422, "Invalid PTO entry.", errors)
+
+    manager_id = session.get("user_id")
+
+    def insert_entry(conn):
+        entries.check_conflicts(
+            conn, employee_id, start_date, end_date,
+            max_people_out=current_app.config["MAX_PEOPLE_OUT_PER_DAY"],
+            allow_overlap=current_app.config["ALLOW_OVERLAPPING_PTO"],
+        )
+        return entries.insert_entry(
+            conn, employee_id, pto_type_id_int, start_date, end_date, hours, notes,
+            manager_id, holidays,
+        )
+
+    try:
+        entry_id = db.run_write(conn, insert_entry)
+    except entries.BookingConflict as conflict:
+        raise ApiError(409, "PTO conflicts with existing bookings.", conflict.errors)
+
+    row = conn.execute(ENTRY_SELECT + "WHERE e.id = ?", (entry_id,)).fetchone()
+    response = json_response(entry_json(row), 201)
+    response.headers["Location"] = url_for(".employee_entries", employee_id=employee_id)
+    return response
+
+
+@bp.route("/entries/batch", methods=["POST"])
+@api_login_required
+def entries_batch():
+    """
+    Book many entries in one transaction.
+
+    Body: {"mode": "partial" | "all_or_nothing", "entries": [...]}, where
+    each item has the fields of the import file (employee_id or
+    employee_email, pto_type or pto_type_id, start_date, end_date, hours,
+    notes). In partial mode the items that pass are booked and the rest
+    are reported; in all_or_nothing mode one failure books nothing.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("entries"), list):
+        raise ApiError(400, 'Expected a JSON object with an "entries" list.')
+    mode = data.get("mode", "partial")
+    if mode not in BATCH_MODES:
+        raise ApiError(400, "mode must be partial or all_or_nothing.")
+    items = data["entries"]
+    if not items:
+        raise ApiError(400, "No entries given.")
+    if len(items) > BATCH_LIMIT:
+        raise ApiError(400, f"At most {BATCH_LIMIT} entries per batch.")
+
+    conn = get_db_connection()
+    holidays = holiday_calendar.load_calendar(conn)
+    candidates, rejected = importer.prepare_entries(
+        conn,
+        [
+            (index, item, None if isinstance(item, dict) else "Each entry must be a JSON object.")
+            for index, item in enumerate(items)
+        ],
+        holidays,
+    )
+
+    accepted = []
+    if candidates and not (mode == "all_or_nothing" and rejected):
+        manager_id = session.get("user_id")
+
+        def insert_batch(conn):
+            return entries.insert_entries(
+                conn, candidates, manager_id, holidays,
+                max_people_out=current_app.config["MAX_PEOPLE_OUT_PER_DAY"],
+                allow_overlap=current_app.config["ALLOW_OVERLAPPING_PTO"],
+                atomic=mode == "all_or_nothing",
+            )
+
+        try:
+            accepted, write_rejected = db.run_write(conn, insert_batch)
+        except entries.BatchRejected as failure:
+            write_rejected = failure.rejected
+        rejected.extend(write_rejected)
+
+    results = [{"index": index, "status": "skipped"} for index in range(len(items))]
+    for c in accepted:
+        results[c["key"]] = {"index": c["key"], "status": "created", "id": c["id"], "hours": c["hours"]}
+    for index, messages in rejected:
+        results[index] = {"index": index, "status": "rejected", "errors": messages}
+
+    if not rejected:
+        status = 201
+    elif mode == "all_or_nothing":
+        status = 422
+    else:
+        status = 200
+    return json_response(
+        {"mode": mode, "created": len(accepted), "rejected": len(rejected), "results": results},
+        status,
+    )
+
+
+@bp.route("/calendar")
+@api_login_required
+def calendar():
+    conn = get_db_connection()
+    fields = selected_fields(ENTRY_FIELDS)
+
+    month_str = request.args.get("month", "").strip()
+    if month_str:
+        try:
+            year, month = (int(part) for part in month_str.split("-"))
+            month_start = date(year, month, 1)
+        except ValueError:
+            raise ApiError(400, "month must be YYYY-MM.")
+    else:
+        month_start = date.today().replace(day=1)
+    month_end = month_start.replace(day=cal.monthrange(month_start.year, month_start.month)[1])
+
+    employee_id = None
+    if request.args.get("employee_id", "all") != "all":
+        try:
+            employee_id = int(request.args["employee_id"])
+        except ValueError:
+            raise ApiError(400, "employee_id must be a number or 'all'.")
+
+    def build():
+        params = [month_end.isoformat(), month_start.isoformat()]
+        employee_sql = ""
+        if employee_id is not None:
+            employee_sql = "AND e.employee_id = ?"
+            params.append(employee_id)
+        rows = conn.execute(
+            ENTRY_SELECT
+            + f"""
+            WHERE e.start_date <= ? AND e.end_date >= ?
+                {employee_sql}
+            ORDER BY e.start_date, e.id
+            """,
+            params,
+        ).fetchall()
+        return {
+            "month": f"{month_start.year:04d}-{month_start.month:02d}",
+            "people_out": occupancy.daily_counts(conn, month_start, month_end, employee_id),
+            "entries": [pick(entry_json(row), fields) for row in rows],
+        }
+
+    # Holiday edits re-expand pto_days, so the default calendar's version
+    # is part of the validator too.
+    holidays = holiday_calendar.load_calendar(conn)
+    extra = (holidays.id, holidays.version) if holidays is not None else ()
+    return conditional_get(conn, ("pto_entries", "pto_days", "employees", "pto_types"), build, extra)
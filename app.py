@@ -7,131 +7,167 @@ from flask import (
     session,
     abort,
     flash,
+    jsonify,
+    Response,
+    stream_with_context,
 )
 from werkzeug.security import check_password_hash
 import sqlite3
 import re
-from datetime import date, datetime, timedelta
+from datetime import date, datetime
 import calendar as cal
+import io
+import asyncio
+import inspect
 
 
 from functools import wraps
 
 from pathlib import Path
 
-
+import api
+import async_db
+import balance_cache
+import balances
+import change_counters
+import change_feed
+import db
+import employees as employee_directory
+import entries
+import exports
+import fragment_cache
+import holiday_calendar
+import http_cache
+import importer
+import instrumentation
+import jobs
+import ledger
+import occupancy
+import pto_catalog
+import read_replica
+import validation
+from balances import build_balance_rows
+from business_days import calculate_pto_hours
+from db import get_db_connection
 
 
 BASE_DIR = Path(__file__).resolve().parent
 DB_PATH = BASE_DIR / "pto_tracker.db"
 
-# PTO calculation constants
-HOURS_PER_DAY = 8
-SKIP_WEEKENDS = True
-
-
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("PRAGMA foreign_keys = ON;")
-    conn.row_factory = sqlite3.Row  # access columns by name
-    return conn
-
-
-def calculate_pto_hours(start_date, end_date, hours_per_day=HOURS_PER_DAY, skip_weekends=SKIP_WEEKENDS):
-    """
-    Calculate PTO hours between start_date and end_date (inclusive).
-    
-    Args:
-        start_date: date object or string in YYYY-MM-DD format
-        end_date: date object or string in YYYY-MM-DD format
-        hours_per_day: hours per work day (default: HOURS_PER_DAY constant)
-        skip_weekends: if True, exclude Saturday/Sunday (default: SKIP_WEEKENDS constant)
-    
-    Returns:
-        float: Total hours, or None if dates are invalid
-    """
-    # Parse dates if strings
-    if isinstance(start_date, str):
-        try:
-            start_date = datetime.strptime(start_date, "%Y-%m-%d").date()
-        except (ValueError, TypeError):
-            return None
-    
-    if isinstance(end_date, str):
-        try:
-            end_date = datetime.strptime(end_date, "%Y-%m-%d").date()
-        except (ValueError, TypeError):
-            return None
-    
-    # Validate date range
-    if start_date is None or end_date is None or end_date < start_date:
-        return None
-    
-    # Count business days
-    total_days = 0
-    current = start_date
-    
-    while current <= end_date:
-        # If skip_weekends is True, exclude weekends (Monday=0, ..., Saturday=5, Sunday=6)
-        if not skip_weekends or current.weekday() < 5:
-            total_days += 1
-        current += timedelta(days=1)
-    
-    return total_days * hours_per_day
-
-
 app = Flask(__name__)
 app.secret_key = "CHANGE_THIS_TO_SOMETHING_RANDOM_LATER"  # required for sessions
+app.config["DATABASE"] = DB_PATH
+# Booking rules: most people (per team) out on any one day, None for no limit,
+# and whether an employee may have PTO entries that overlap each other.
+app.config["MAX_PEOPLE_OUT_PER_DAY"] = None
+app.config["ALLOW_OVERLAPPING_PTO"] = False
+db.init_app(app)
+read_replica.init_app(app)
+async_db.init_app(app)
+instrumentation.init_app(app)
+balance_cache.init_app(app)
+jobs.init_app(app)
+fragment_cache.init_app(app)
+change_feed.init_app(app)
+app.register_blueprint(api.bp)
 
 
 # --- Authentication helpers ---
-def login_required(f):
+def _guarded(f, check):
+    """Wrap view f (sync or async) so check()'s response, if any, is returned instead."""
+    if inspect.iscoroutinefunction(f):
+        @wraps(f)
+        async def async_wrapper(*args, **kwargs):
+            response = check()
+            if response is not None:
+                return response
+            return await f(*args, **kwargs)
+        return async_wrapper
+
     @wraps(f)
     def wrapper(*args, **kwargs):
-        if "user_id" not in session:
-            return redirect(url_for("login"))
+        response = check()
+        if response is not None:
+            return response
         return f(*args, **kwargs)
     return wrapper
 
+def _check_login():
+    if "user_id" not in session:
+        return redirect(url_for("login"))
+    return None
+
+def _check_admin():
+    if "user_id" not in session:
+        return redirect(url_for("login"))
+    if session.get("role") != "admin":
+        flash("Admin access required.", "error")
+        return redirect(url_for("dashboard"))
+    return None
+
+def _check_admin_or_manager():
+    if "user_id" not in session:
+        return redirect(url_for("login"))
+    if session.get("role") not in ("admin", "manager"):
+        flash("Access denied.", "error")
+        return redirect(url_for("dashboard"))
+    return None
+
+def login_required(f):
+    return _guarded(f, _check_login)
+
 def admin_required(f):
-    @wraps(f)
-    def wrapper(*args, **kwargs):
-        if "user_id" not in session:
-            return redirect(url_for("login"))
-        if session.get("role") != "admin":
-            flash("Admin access required.", "error")
-            return redirect(url_for("dashboard"))
-        return f(*args, **kwargs)
-    return wrapper
+    return _guarded(f, _check_admin)
 
 def admin_or_manager_required(f):
-    @wraps(f)
-    def wrapper(*args, **kwargs):
-        if "user_id" not in session:
-            return redirect(url_for("login"))
-        if session.get("role") not in ("admin", "manager"):
-            flash("Access denied.", "error")
-            return redirect(url_for("dashboard"))
-        return f(*args, **kwargs)
-    return wrapper
+    return _guarded(f, _check_admin_or_manager)
+
+
+# Async versions of read-only pages, by endpoint. asgi.py serves GET and
+# HEAD for these endpoints from here; everything else, and every request
+# under gunicorn, goes to the ordinary view.
+ASYNC_VIEWS = {}
+
+def twin_decorators(*decorators):
+    """
+    Apply decorators (outermost first) to a view that has an async twin,
+    and remember them so async_twin wraps the twin in exactly the same
+    guard and conditional-GET counters.
+    """
+    def apply(view):
+        for decorator in reversed(decorators):
+            view = decorator(view)
+        view.twin_decorators = decorators
+        return view
+    return apply
+
+def async_twin(sync_view):
+    """Register an async version of sync_view, behind sync_view's twin_decorators."""
+    def register(view):
+        for decorator in reversed(sync_view.twin_decorators):
+            view = decorator(view)
+        ASYNC_VIEWS[sync_view.__name__] = view
+        return view
+    return register
 
 
 def ensure_default_pto_types(conn):
     """Ensure the default PTO types exist in the database."""
 
-    existing_count = conn.execute("SELECT COUNT(*) FROM pto_types").fetchone()[0]
-
-    if existing_count == 0:
+    if not pto_catalog.all_types(conn):
         default_types = [
             ("PERSONAL", "Personal Time", 1, 40),
             ("SICK", "Sick Time", 1, 40),
             ("VACATION", "Vacation Time", 1, 40),
         ]
-        conn.executemany(
-            "INSERT OR IGNORE INTO pto_types (code, display_name, is_active, default_hours) VALUES (?, ?, ?, ?)",
-            default_types,
+        db.run_write(
+            conn,
+            lambda conn: conn.executemany(
+                "INSERT OR IGNORE INTO pto_types (code, display_name, is_active, default_hours) VALUES (?, ?, ?, ?)",
+                default_types,
+            ),
         )
-        conn.commit()
+        pto_catalog.invalidate()
 
 
 # --- Routes ---
@@ -152,7 +188,6 @@ def login():
             (username,),
         )
         user = cur.fetchone()
-        conn.close()
 
         if user is None or not check_password_hash(user["password_hash"], password):
             return render_template("login.html", error="Invalid username or password")
@@ -185,20 +220,45 @@ def dashboard():
         role=session.get("role"),
     )
 @app.route("/employees")
-@login_required
+@twin_decorators(login_required, http_cache.conditional("employees"))
 def employees_list():
-    conn = get_db_connection()
-    employees = conn.execute(
-        """
-        SELECT id, first_name, last_name, employment_type, phone, email, status
-        FROM employees
-        WHERE status = 'active'
-        ORDER BY last_name, first_name
-        """
-    ).fetchall()
-    conn.close()
+    page = employee_page_from_args(get_db_connection())
+    return render_template("employees_list.html", employees=page["employees"], page=page)
+
+
+@async_twin(employees_list)
+async def employees_list_async():
+    page = await async_db.run(employee_page_from_args)
+    return await async_db.run_blocking(
+        render_template, "employees_list.html", employees=page["employees"], page=page
+    )
+
 
-    return render_template("employees_list.html", employees=employees)
+@app.route("/employees/search")
+@login_required
+def employees_search():
+    """JSON typeahead for employee pickers."""
+    search = request.args.get("q", "").strip()
+    try:
+        limit = min(max(int(request.args.get("limit", "")), 1), employee_directory.TYPEAHEAD_LIMIT)
+    except ValueError:
+        limit = employee_directory.TYPEAHEAD_LIMIT
+    return jsonify(employee_directory.search_employees(get_db_connection(), search, limit))
+
+
+def employee_page_from_args(conn):
+    """One keyset page of active employees, driven by q/after/before/per_page."""
+    search = request.args.get("q", "").strip()
+    page_size = employee_directory.parse_page_size(request.args.get("per_page"))
+    page = employee_directory.fetch_employee_page(
+        conn,
+        search=search,
+        after=request.args.get("after") or None,
+        before=request.args.get("before") or None,
+        page_size=page_size,
+    )
+    page.update(search=search, page_size=page_size, page_sizes=employee_directory.PAGE_SIZES)
+    return page
 
 
 
@@ -213,14 +273,10 @@ def employee_new():
         employment_type = request.form.get("employment_type", "").strip()
         phone = request.form.get("phone", "").strip()
         email = request.form.get("email", "").strip()
+        team = request.form.get("team", "").strip()
+        hire_date = request.form.get("hire_date", "").strip()
 
-        errors = []
-        if not first_name:
-            errors.append("First name is required.")
-        if not last_name:
-            errors.append("Last name is required.")
-        if employment_type not in ("hourly", "salaried"):
-            errors.append("Employment type must be hourly or salaried.")
+        errors = validation.validate_employee(first_name, last_name, employment_type, hire_date)
 
         if errors:
             return render_template(
@@ -231,36 +287,33 @@ def employee_new():
                 employment_type=employment_type,
                 phone=phone,
                 email=email,
+                team=team,
+                hire_date=hire_date,
             )
 
-        conn = get_db_connection()
-        # Insert employee
-        cur = conn.execute(
-            """
-            INSERT INTO employees (first_name, last_name, employment_type, phone, email, status)
-            VALUES (?, ?, ?, ?, ?, 'active')
-            """,
-            (first_name, last_name, employment_type, phone, email),
-        )
-        employee_id = cur.lastrowid
-
-        # Fetch active PTO types
-        pto_types = conn.execute(
-            "SELECT id, default_hours FROM pto_types WHERE is_active = 1"
-        ).fetchall()
-
-        # Create PTO balances using default_hours from each PTO type
-        for pto_type in pto_types:
-            conn.execute(
+        def insert_employee(conn):
+            cur = conn.execute(
                 """
-                INSERT INTO pto_balances (employee_id, pto_type_id, hours_allotted, hours_used)
-                VALUES (?, ?, ?, 0)
+                INSERT INTO employees (first_name, last_name, employment_type, phone, email, team, hire_date, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 'active')
                 """,
-                (employee_id, pto_type["id"], pto_type["default_hours"]),
+                (first_name, last_name, employment_type, phone, email, team or None, hire_date or None),
             )
+            employee_id = cur.lastrowid
+
+            # Create PTO balances using default_hours from each active PTO type
+            with balance_cache.invalidating(conn, [employee_id]):
+                for pto_type in pto_catalog.active_types(conn):
+                    conn.execute(
+                        """
+                        INSERT INTO pto_balances (employee_id, pto_type_id, hours_allotted, hours_used)
+                        VALUES (?, ?, ?, 0)
+                        """,
+                        (employee_id, pto_type["id"], pto_type["default_hours"]),
+                    )
+            ledger.post_openings(conn, "employee_id = ?", (employee_id,))
 
-        conn.commit()
-        conn.close()
+        db.run_write(get_db_connection(), insert_employee)
 
         return redirect(url_for("employees_list"))
 
@@ -268,47 +321,28 @@ def employee_new():
     return render_template("employee_form.html")
 
 @app.route("/employees/<int:employee_id>", methods=["GET", "POST"])
-@login_required
+@twin_decorators(
+    login_required,
+    http_cache.conditional("employees", "pto_entries", "pto_types", "pto_balances", "managers"),
+)
 def employee_detail(employee_id):
     conn = get_db_connection()
+    # Read before the page's data, so the live feed replays anything newer.
+    feed_last_id = change_feed.latest_id(conn)
 
-    # Get employee info
-    employee = conn.execute(
-        """
-        SELECT id, first_name, last_name, employment_type, phone, email, status
-        FROM employees
-        WHERE id = ?
-        """,
-        (employee_id,),
-    ).fetchone()
-
+    employee = load_employee(conn, employee_id)
     if employee is None:
-        conn.close()
         return "Employee not found", 404
 
     is_admin = session.get("role") == "admin"
     errors = []
     form_data = None
 
-    pto_rows = conn.execute(
-        """
-        SELECT
-            pt.id AS pto_type_id,
-            pt.display_name,
-            b.hours_allotted,
-            b.hours_used
-        FROM pto_types pt
-        LEFT JOIN pto_balances b
-            ON b.pto_type_id = pt.id AND b.employee_id = ?
-        WHERE pt.is_active = 1
-        ORDER BY pt.display_name
-        """,
-        (employee_id,),
-    ).fetchall()
+    summary = balances.employee_summary(conn, employee_id)
+    pto_rows = summary["pto_rows"]
 
     if request.method == "POST":
         if not is_admin:
-            conn.close()
             flash("Admin access required to update balances.", "error")
             return redirect(url_for("employee_detail", employee_id=employee_id))
 
@@ -356,34 +390,57 @@ def employee_detail(employee_id):
 
             if not errors:
                 if updates:
-                    # Fetch all existing balance records upfront to avoid N+1 queries
-                    existing_balances = conn.execute(
-                        "SELECT pto_type_id FROM pto_balances WHERE employee_id = ?",
-                        (employee_id,),
-                    ).fetchall()
-                    existing_pto_type_ids = {row["pto_type_id"] for row in existing_balances}
-
-                    for hours_allotted, hours_used, pto_type_id in updates:
-                        if pto_type_id in existing_pto_type_ids:
-                            conn.execute(
-                                """
-                                UPDATE pto_balances
-                                SET hours_allotted = ?
-                                WHERE employee_id = ? AND pto_type_id = ?
-                                """,
-                                (hours_allotted, employee_id, pto_type_id),
-                            )
-                        else:
-                            conn.execute(
-                                """
-                                INSERT INTO pto_balances (employee_id, pto_type_id, hours_allotted, hours_used)
-                                VALUES (?, ?, ?, ?)
-                                """,
-                                (employee_id, pto_type_id, hours_allotted, hours_used),
-                            )
-
-                    conn.commit()
-                    conn.close()
+                    manager_id = session.get("user_id")
+
+                    def save_balances(conn):
+                        # Fetch all existing balance records upfront to avoid N+1 queries
+                        existing_balances = conn.execute(
+                            "SELECT pto_type_id, hours_allotted FROM pto_balances WHERE employee_id = ?",
+                            (employee_id,),
+                        ).fetchall()
+                        existing_allotted = {
+                            row["pto_type_id"]: row["hours_allotted"] for row in existing_balances
+                        }
+
+                        ledger_rows = []
+                        for hours_allotted, hours_used, pto_type_id in updates:
+                            if pto_type_id not in existing_allotted:
+                                ledger_rows.append({
+                                    "employee_id": employee_id, "pto_type_id": pto_type_id,
+                                    "kind": "opening", "allotted_delta": hours_allotted,
+                                    "used_delta": hours_used, "manager_id": manager_id,
+                                })
+                            elif hours_allotted != existing_allotted[pto_type_id]:
+                                ledger_rows.append({
+                                    "employee_id": employee_id, "pto_type_id": pto_type_id,
+                                    "kind": "adjustment",
+                                    "allotted_delta": hours_allotted - existing_allotted[pto_type_id],
+                                    "manager_id": manager_id,
+                                })
+                        ledger.post(conn, ledger_rows)
+
+                        with balance_cache.invalidating(conn, [employee_id]):
+                            for hours_allotted, hours_used, pto_type_id in updates:
+                                if pto_type_id in existing_allotted:
+                                    conn.execute(
+                                        """
+                                        UPDATE pto_balances
+                                        SET hours_allotted = ?
+                                        WHERE employee_id = ? AND pto_type_id = ?
+                                        """,
+                                        (hours_allotted, employee_id, pto_type_id),
+                                    )
+                                else:
+                                    conn.execute(
+                                        """
+                                        INSERT INTO pto_balances (employee_id, pto_type_id, hours_allotted, hours_used)
+                                        VALUES (?, ?, ?, ?)
+                                        """,
+                                        (employee_id, pto_type_id, hours_allotted, hours_used),
+                                    )
+                        change_feed.record_balances(conn, employee_id)
+
+                    db.run_write(conn, save_balances)
                     flash("PTO balances updated.", "success")
                     return redirect(
                         url_for("employee_detail", employee_id=employee_id, _anchor="balances-edit")
@@ -394,11 +451,46 @@ def employee_detail(employee_id):
         if errors:
             flash("Please fix the errors below.", "error")
 
-    # Get PTO entries (history)
-    pto_entries = conn.execute(
+    # PTO history; only queried if the template's cached fragment misses.
+    pto_entries = fragment_cache.lazy(lambda: load_pto_history(conn, employee_id))
+    return render_employee_detail(employee, summary, pto_entries, feed_last_id, errors, form_data)
+
+
+@async_twin(employee_detail)
+async def employee_detail_async(employee_id):
+    # Read before the page's data, so the live feed replays anything newer.
+    feed_last_id = await async_db.run(change_feed.latest_id)
+    employee, summary = await asyncio.gather(
+        async_db.run(load_employee, employee_id),
+        async_db.run(balances.employee_summary, employee_id),
+    )
+    if employee is None:
+        return "Employee not found", 404
+
+    # Loaded while rendering, and only if the cached fragment misses.
+    pto_entries = fragment_cache.lazy(lambda: load_pto_history(get_db_connection(), employee_id))
+    return await async_db.run_blocking(
+        render_employee_detail, employee, summary, pto_entries, feed_last_id
+    )
+
+
+def load_employee(conn, employee_id):
+    return conn.execute(
+        """
+        SELECT id, first_name, last_name, employment_type, phone, email, team, hire_date, status
+        FROM employees
+        WHERE id = ?
+        """,
+        (employee_id,),
+    ).fetchone()
+
+
+def load_pto_history(conn, employee_id):
+    return conn.execute(
         """
         SELECT
             e.id,
+            e.pto_type_id,
             pt.display_name AS pto_name,
             e.start_date,
             e.end_date,
@@ -415,36 +507,25 @@ def employee_detail(employee_id):
         (employee_id,),
     ).fetchall()
 
-    conn.close()
-
-    balance_rows = build_balance_rows(pto_rows, form_data if errors else None)
 
-    # Derive balances for read-only view from balance_rows to avoid duplication
-    balances = []
-    for row in balance_rows:
-        hours_allotted = row["hours_allotted"] if row["hours_allotted"] is not None else 0.0
-        hours_used = row["hours_used"]
-        balances.append(
-            {
-                "pto_name": row["display_name"],
-                "hours_allotted": hours_allotted,
-                "hours_used": hours_used,
-                "hours_remaining": hours_allotted - hours_used,
-            }
-        )
+def render_employee_detail(employee, summary, pto_entries, feed_last_id, errors=None, form_data=None):
+    if errors:
+        balance_rows = build_balance_rows(summary["pto_rows"], form_data)
+    else:
+        balance_rows = summary["balance_rows"]
 
     return render_template(
         "employee_detail.html",
         employee=employee,
-        balances=balances,
+        balances=summary["balances"],
         pto_entries=pto_entries,
         balance_rows=balance_rows,
-        errors=errors,
-        is_admin=is_admin,
+        errors=errors or [],
+        is_admin=session.get("role") == "admin",
+        feed_last_id=feed_last_id,
     )
 
 
-
 @app.route("/employees/<int:employee_id>/pto/new", methods=["GET", "POST"])
 @login_required
 def pto_entry_new(employee_id):
@@ -457,18 +538,12 @@ def pto_entry_new(employee_id):
     ).fetchone()
 
     if employee is None:
-        conn.close()
         return "Employee not found", 404
 
     # PTO types for dropdown
-    pto_types = conn.execute(
-        """
-        SELECT id, code, display_name
-        FROM pto_types
-        WHERE is_active = 1
-        ORDER BY display_name
-        """
-    ).fetchall()
+    pto_types = pto_catalog.active_types(conn)
+
+    holidays = holiday_calendar.load_calendar(conn)
 
     if request.method == "POST":
         pto_type_id = request.form.get("pto_type_id", "").strip()
@@ -477,53 +552,11 @@ def pto_entry_new(employee_id):
         hours_str = request.form.get("hours", "").strip()
         notes = request.form.get("notes", "").strip()
 
-        errors = []
-
-        # Validate pto_type_id exists
-        try:
-            pto_type_id_int = int(pto_type_id)
-        except ValueError:
-            pto_type_id_int = None
-        if not pto_type_id_int:
-            errors.append("Please select a PTO type.")
-
-        if not start_date:
-            errors.append("Start date is required.")
-        if not end_date:
-            errors.append("End date is required.")
-
-        # Validate date range if both dates are present
-        if start_date and end_date:
-            try:
-                start_dt = datetime.strptime(start_date, "%Y-%m-%d").date()
-                end_dt = datetime.strptime(end_date, "%Y-%m-%d").date()
-                if end_dt < start_dt:
-                    errors.append("End date cannot be before start date.")
-            except ValueError:
-                errors.append("Invalid date format.")
-
-        # Auto-calculate hours if not provided
-        hours = None
-        if hours_str:
-            # User provided hours - validate it
-            try:
-                hours = float(hours_str)
-                if hours <= 0:
-                    errors.append("Hours must be greater than 0.")
-            except ValueError:
-                errors.append("Hours must be a valid number (e.g. 8 or 4.5).")
-        elif start_date and end_date and not errors:
-            # No hours provided - calculate from dates
-            calculated_hours = calculate_pto_hours(start_date, end_date)
-            if calculated_hours is not None and calculated_hours > 0:
-                hours = calculated_hours
-                hours_str = str(hours)  # Update for form re-rendering
-            else:
-                errors.append("Could not calculate hours from the provided dates.")
-
-        # Ensure hours is set
-        if hours is None:
-            errors.append("Hours must be a valid number (e.g. 8 or 4.5).")
+        errors, pto_type_id_int, hours = validation.validate_pto_entry(
+            pto_type_id, start_date, end_date, hours_str, holidays
+        )
+        if hours is not None and not hours_str:
+            hours_str = str(hours)  # Update for form re-rendering
 
         # Optional: ensure balance row exists and check remaining hours
         if pto_type_id_int and hours is not None:
@@ -536,72 +569,154 @@ def pto_entry_new(employee_id):
                 (employee_id, pto_type_id_int),
             ).fetchone()
 
-            if balance is None:
-                errors.append("No PTO balance found for this PTO type.")
-            else:
-                remaining = balance["hours_allotted"] - balance["hours_used"]
-                if hours > remaining:
-                    errors.append(
-                        f"Not enough PTO remaining. Remaining: {remaining:.2f} hours."
-                    )
-
-        if errors:
-            conn.close()
-            return render_template(
-                "pto_entry_form.html",
-                employee=employee,
-                pto_types=pto_types,
-                errors=errors,
-                form_data={
-                    "pto_type_id": pto_type_id,
-                    "start_date": start_date,
-                    "end_date": end_date,
-                    "hours": hours_str,
-                    "notes": notes,
-                },
-            )
-
-        # Insert PTO entry
-        conn.execute(
-            """
-            INSERT INTO pto_entries
-                (employee_id, pto_type_id, start_date, end_date, hours, notes, created_by_manager_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            """,
-            (employee_id, pto_type_id_int, start_date, end_date, hours, notes, session.get("user_id")),
-        )
+            remaining = None if balance is None else balance["hours_allotted"] - balance["hours_used"]
+            error = validation.balance_error(remaining, hours)
+            if error:
+                errors.append(error)
+
+        if not errors:
+            manager_id = session.get("user_id")
+
+            def insert_entry(conn):
+                # Checked inside the write so two managers can't both take
+                # the last free slot on the same day.
+                entries.check_conflicts(
+                    conn, employee_id, start_date, end_date,
+                    max_people_out=app.config["MAX_PEOPLE_OUT_PER_DAY"],
+                    allow_overlap=app.config["ALLOW_OVERLAPPING_PTO"],
+                )
+                entries.insert_entry(
+                    conn, employee_id, pto_type_id_int, start_date, end_date, hours, notes,
+                    manager_id, holidays,
+                )
 
-        # Update used hours
-        conn.execute(
-            """
-            UPDATE pto_balances
-            SET hours_used = hours_used + ?
-            WHERE employee_id = ? AND pto_type_id = ?
-            """,
-            (hours, employee_id, pto_type_id_int),
+            try:
+                db.run_write(conn, insert_entry)
+                return redirect(url_for("employee_detail", employee_id=employee_id))
+            except entries.BookingConflict as conflict:
+                errors.extend(conflict.errors)
+
+        return render_template(
+            "pto_entry_form.html",
+            employee=employee,
+            pto_types=pto_types,
+            holiday_dates=holiday_dates_for_form(holidays),
+            errors=errors,
+            form_data={
+                "pto_type_id": pto_type_id,
+                "start_date": start_date,
+                "end_date": end_date,
+                "hours": hours_str,
+                "notes": notes,
+            },
         )
 
-        conn.commit()
-        conn.close()
-
-        return redirect(url_for("employee_detail", employee_id=employee_id))
-
     # GET request
-    conn.close()
     return render_template(
         "pto_entry_form.html",
         employee=employee,
         pto_types=pto_types,
+        holiday_dates=holiday_dates_for_form(holidays),
         form_data={}
     )
 
 
+@app.route("/employees/<int:employee_id>/pto/<int:entry_id>/delete", methods=["POST"])
+@admin_required
+def pto_entry_delete(employee_id, entry_id):
+    conn = get_db_connection()
+    entry = conn.execute(
+        "SELECT id FROM pto_entries WHERE id = ? AND employee_id = ?",
+        (entry_id, employee_id),
+    ).fetchone()
+    if entry is None:
+        abort(404)
+
+    db.run_write(conn, lambda conn: entries.delete_entry(conn, entry_id))
+    flash("PTO entry deleted and hours returned to the balance.", "success")
+    return redirect(url_for("employee_detail", employee_id=employee_id))
+
+
+def holiday_dates_for_form(holidays):
+    """Holiday dates around today, so the form's hour preview matches the server."""
+    if holidays is None:
+        return []
+    today = date.today()
+    window_start = date(today.year - 1, 1, 1)
+    window_end = date(today.year + 1, 12, 31)
+    return [d.isoformat() for d in holidays.holidays_between(window_start, window_end)]
+
+
 @app.route("/calendar")
-@login_required
+@twin_decorators(
+    login_required,
+    http_cache.conditional("pto_entries", "pto_days", "pto_types", "employees"),
+)
 def calendar_view():
-    # Query params
+    args, error = calendar_args()
+    if error:
+        return error
+
+    conn = get_db_connection()
+    # Read before the page's data, so the live feed replays anything newer.
+    feed_last_id = change_feed.latest_id(conn)
+    employee_id = args["employee_id"]
+
+    # Only queried if the template's cached fragment misses.
+    pto_entries = fragment_cache.lazy(lambda: load_calendar_entries(conn, args))
+
+    # Per-day staffing grid and the optional "who is out" list come from the
+    # pto_days occupancy table rather than re-expanding the entries above.
+    people_out = occupancy.daily_counts(conn, args["month_start"], args["month_end"], employee_id)
+    out_on_day = (
+        occupancy.who_is_out(conn, args["selected_day"], employee_id) if args["selected_day"] else None
+    )
+
+    return render_calendar(
+        args,
+        feed_last_id,
+        selected_employee_name(conn, employee_id),
+        pto_entries,
+        people_out,
+        out_on_day,
+    )
+
+
+@async_twin(calendar_view)
+async def calendar_view_async():
+    args, error = calendar_args()
+    if error:
+        return error
+
+    # Read before the page's data, so the live feed replays anything newer.
+    feed_last_id = await async_db.run(change_feed.latest_id)
+    employee_id = args["employee_id"]
+    queries = [
+        async_db.run(selected_employee_name, employee_id),
+        async_db.run(occupancy.daily_counts, args["month_start"], args["month_end"], employee_id),
+    ]
+    if args["selected_day"]:
+        queries.append(async_db.run(occupancy.who_is_out, args["selected_day"], employee_id))
+    employee_name, people_out, *out_on_day = await asyncio.gather(*queries)
+
+    # Loaded while rendering, and only if the cached fragment misses.
+    pto_entries = fragment_cache.lazy(lambda: load_calendar_entries(get_db_connection(), args))
+    return await async_db.run_blocking(
+        render_calendar,
+        args,
+        feed_last_id,
+        employee_name,
+        pto_entries,
+        people_out,
+        out_on_day[0] if out_on_day else None,
+    )
+
+
+def calendar_args():
+    """(parsed calendar query string, None), or (None, an error response)."""
     selected_employee = request.args.get("employee_id", "all").strip()
     month_str = request.args.get("month", "").strip()  # format YYYY-MM
+    day_str = request.args.get("day", "").strip()  # optional YYYY-MM-DD: who is out
 
     # Default to current month if not provided
     if not month_str:
@@ -616,35 +731,57 @@ def calendar_view():
         month_start = date(year, month, 1)
         month_end = date(year, month, last_day)
     except Exception:
-        return "Invalid month format. Use YYYY-MM.", 400
-
-    conn = get_db_connection()
-
-    # Employees for dropdown
-    employees = conn.execute(
-        """
-        SELECT id, first_name, last_name
-        FROM employees
-        WHERE status = 'active'
-        ORDER BY last_name, first_name
-        """
-    ).fetchall()
+        return None, ("Invalid month format. Use YYYY-MM.", 400)
 
-    # Build query for PTO entries overlapping the month:
-    # overlap condition: start_date <= month_end AND end_date >= month_start
-    params = [month_end.isoformat(), month_start.isoformat()]
-    employee_filter_sql = ""
+    selected_day = None
+    if day_str:
+        try:
+            selected_day = datetime.strptime(day_str, "%Y-%m-%d").date()
+        except ValueError:
+            return None, ("Invalid day format. Use YYYY-MM-DD.", 400)
 
+    employee_id = None
     if selected_employee != "all":
         try:
-            employee_id_int = int(selected_employee)
-            employee_filter_sql = "AND e.employee_id = ?"
-            params.append(employee_id_int)
+            employee_id = int(selected_employee)
         except ValueError:
-            conn.close()
-            return "Invalid employee_id", 400
+            return None, ("Invalid employee_id", 400)
+
+    return {
+        "selected_employee": selected_employee,
+        "employee_id": employee_id,
+        "month_str": month_str,
+        "year": year,
+        "month": month,
+        "month_start": month_start,
+        "month_end": month_end,
+        "day_str": day_str,
+        "selected_day": selected_day,
+    }, None
+
+
+def selected_employee_name(conn, employee_id):
+    """The selected employee's label; the picker loads other matches on demand from employees_search."""
+    if employee_id is None:
+        return ""
+    row = conn.execute(
+        "SELECT id, first_name, last_name FROM employees WHERE id = ?",
+        (employee_id,),
+    ).fetchone()
+    if row is None:
+        return ""
+    return f"{row['first_name']} {row['last_name']} #{row['id']}"
+
+
+def load_calendar_entries(conn, args):
+    """PTO entries overlapping the month: start_date <= month_end AND end_date >= month_start."""
+    params = [args["month_end"].isoformat(), args["month_start"].isoformat()]
+    employee_filter_sql = ""
+    if args["employee_id"] is not None:
+        employee_filter_sql = "AND e.employee_id = ?"
+        params.append(args["employee_id"])
 
-    entries = conn.execute(
+    return conn.execute(
         f"""
         SELECT
             e.id,
@@ -652,6 +789,7 @@ def calendar_view():
             e.end_date,
             e.hours,
             e.notes,
+            e.pto_type_id,
             pt.display_name AS pto_name,
             emp.first_name AS emp_first,
             emp.last_name AS emp_last
@@ -667,69 +805,47 @@ def calendar_view():
         tuple(params),
     ).fetchall()
 
-    conn.close()
+
+def render_calendar(args, feed_last_id, employee_name, pto_entries, people_out, out_on_day):
+    weeks = [
+        [
+            {
+                "date": day.isoformat(),
+                "day": day.day,
+                "in_month": day.month == args["month"],
+                "people_out": people_out.get(day.isoformat(), 0),
+            }
+            for day in week
+        ]
+        for week in cal.Calendar().monthdatescalendar(args["year"], args["month"])
+    ]
 
     return render_template(
         "calendar.html",
-        employees=employees,
-        entries=entries,
-        selected_employee=selected_employee,
-        month_str=month_str,
-        month_start=month_start.isoformat(),
-        month_end=month_end.isoformat(),
+        entries=pto_entries,
+        weeks=weeks,
+        selected_day=args["day_str"] if args["selected_day"] else "",
+        out_on_day=out_on_day,
+        selected_employee=args["selected_employee"],
+        selected_employee_name=employee_name,
+        month_str=args["month_str"],
+        month_start=args["month_start"].isoformat(),
+        month_end=args["month_end"].isoformat(),
+        feed_last_id=feed_last_id,
     )
 
 
 @app.route("/admin/balances")
 @admin_or_manager_required
 def admin_balances_select_employee():
-    conn = get_db_connection()
-    employees = conn.execute(
-        """
-        SELECT id, first_name, last_name
-        FROM employees
-        WHERE status = 'active'
-        ORDER BY last_name, first_name
-        """
-    ).fetchall()
-    conn.close()
-
+    page = employee_page_from_args(get_db_connection())
     return render_template(
         "admin_balances_select_employee.html",
-        employees=employees,
+        employees=page["employees"],
+        page=page,
     )
 
 
-def build_balance_rows(pto_rows, form_data=None):
-    rows = []
-    for row in pto_rows:
-        hours_allotted = row["hours_allotted"]
-        hours_used = row["hours_used"] if row["hours_used"] is not None else 0.0
-
-        if form_data is not None:
-            input_value = form_data.get(str(row["pto_type_id"]), "")
-        else:
-            input_value = "" if hours_allotted is None else f"{hours_allotted:g}"
-
-        remaining = (
-            None
-            if hours_allotted is None
-            else float(hours_allotted) - float(hours_used)
-        )
-
-        rows.append(
-            {
-                "pto_type_id": row["pto_type_id"],
-                "display_name": row["display_name"],
-                "hours_allotted": hours_allotted,
-                "hours_used": hours_used,
-                "remaining": remaining,
-                "input_value": input_value,
-            }
-        )
-    return rows
-
-
 @app.route("/admin/balances/<int:employee_id>", methods=["GET"])
 @admin_or_manager_required
 def admin_balances_edit(employee_id):
@@ -737,11 +853,17 @@ def admin_balances_edit(employee_id):
 
 
 @app.route("/admin/pto-types", methods=["GET"])
-@admin_required
+@twin_decorators(admin_required, http_cache.conditional("pto_types"))
 def admin_pto_types():
     return render_admin_pto_types()
 
 
+@async_twin(admin_pto_types)
+async def admin_pto_types_async():
+    # One catalog read (usually served from pto_catalog's cache); nothing to gather.
+    return await async_db.run_blocking(render_admin_pto_types)
+
+
 @app.route("/admin/pto-types/new", methods=["POST"])
 @admin_required
 def admin_pto_type_new():
@@ -772,8 +894,7 @@ def admin_pto_type_new():
             default_hours = None
 
     if not errors:
-        conn = get_db_connection()
-        try:
+        def insert_pto_type(conn):
             cur = conn.execute(
                 """
                 INSERT INTO pto_types (code, display_name, is_active, default_hours)
@@ -782,31 +903,25 @@ def admin_pto_type_new():
                 (normalized_code, display_name, default_hours),
             )
             pto_type_id = cur.lastrowid
+            change_feed.record_pto_type(conn, pto_type_id)
+
+            # Default balances for every active employee are created in the
+            # background; with a large headcount that is too long to hold
+            # the write lock for.
+            return jobs.enqueue(
+                conn, "pto_type_balances",
+                {"pto_type_id": pto_type_id, "default_hours": default_hours},
+                manager_id=session.get("user_id"),
+            )
 
-            # Create default balances for active employees so the new PTO type is usable immediately.
-            employees = conn.execute(
-                "SELECT id FROM employees WHERE status = 'active'"
-            ).fetchall()
-            balance_rows = [
-                (emp["id"], pto_type_id, default_hours, 0.0) for emp in employees
-            ]
-            if balance_rows:
-                conn.executemany(
-                    """
-                    INSERT OR IGNORE INTO pto_balances (employee_id, pto_type_id, hours_allotted, hours_used)
-                    VALUES (?, ?, ?, ?)
-                    """,
-                    balance_rows,
-                )
-
-            conn.commit()
-            flash("PTO type added.")
+        try:
+            job_id = db.run_write(get_db_connection(), insert_pto_type)
+            jobs.notify()
+            pto_catalog.invalidate()
+            flash(f"PTO type added. Balances for active employees are being created (job #{job_id}).")
             return redirect(url_for("admin_pto_types"))
         except sqlite3.IntegrityError:
             errors.append("Code must be unique.")
-            conn.rollback()
-        finally:
-            conn.close()
 
     return render_admin_pto_types(errors)
 
@@ -834,41 +949,47 @@ def admin_pto_type_edit(pto_type_id):
 
     if not errors:
         conn = get_db_connection()
-        cur = conn.execute("SELECT id, default_hours FROM pto_types WHERE id = ?", (pto_type_id,))
-        existing = cur.fetchone()
+        existing = pto_catalog.get_type(conn, pto_type_id)
         if existing is None:
-            conn.close()
             abort(404)
         
         # Use existing default_hours if not provided in the form
         if default_hours is None:
             default_hours = existing["default_hours"]
 
-        conn.execute(
-            """
-            UPDATE pto_types
-            SET display_name = ?, default_hours = ?
-            WHERE id = ?
-            """,
-            (display_name, default_hours, pto_type_id),
-        )
+        manager_id = session.get("user_id")
 
-        # Only update all employee balances if explicitly requested
-        if update_all_balances:
+        def update_pto_type(conn):
             conn.execute(
                 """
-                UPDATE pto_balances
-                SET hours_allotted = ?
-                WHERE pto_type_id = ?
+                UPDATE pto_types
+                SET display_name = ?, default_hours = ?
+                WHERE id = ?
                 """,
-                (default_hours, pto_type_id),
+                (display_name, default_hours, pto_type_id),
             )
-            flash("PTO type updated and all employee balances updated.")
+            change_feed.record_pto_type(conn, pto_type_id)
+
+            # Only update all employee balances if explicitly requested,
+            # and then in the background.
+            if update_all_balances:
+                return jobs.enqueue(
+                    conn, "pto_type_allotments",
+                    {
+                        "pto_type_id": pto_type_id, "hours": default_hours, "manager_id": manager_id,
+                        "note": "Updated all balances to the type's default hours",
+                    },
+                    manager_id=manager_id,
+                )
+
+        job_id = db.run_write(conn, update_pto_type)
+        pto_catalog.invalidate()
+
+        if job_id:
+            jobs.notify()
+            flash(f"PTO type updated. All employee balances are being updated (job #{job_id}).")
         else:
             flash("PTO type updated.")
-        
-        conn.commit()
-        conn.close()
         return redirect(url_for("admin_pto_types"))
 
     return render_admin_pto_types(errors)
@@ -878,22 +999,22 @@ def admin_pto_type_edit(pto_type_id):
 @admin_required
 def admin_pto_type_toggle(pto_type_id):
     conn = get_db_connection()
-    pto_type = conn.execute(
-        "SELECT id, is_active FROM pto_types WHERE id = ?",
-        (pto_type_id,),
-    ).fetchone()
+    pto_type = pto_catalog.get_type(conn, pto_type_id)
 
     if pto_type is None:
-        conn.close()
         abort(404)
 
     new_status = 0 if pto_type["is_active"] else 1
-    conn.execute(
-        "UPDATE pto_types SET is_active = ? WHERE id = ?",
-        (new_status, pto_type_id),
-    )
-    conn.commit()
-    conn.close()
+
+    def set_status(conn):
+        conn.execute(
+            "UPDATE pto_types SET is_active = ? WHERE id = ?",
+            (new_status, pto_type_id),
+        )
+        change_feed.record_pto_type(conn, pto_type_id)
+
+    db.run_write(conn, set_status)
+    pto_catalog.invalidate()
 
     flash("PTO type deactivated." if new_status == 0 else "PTO type reactivated.")
     return redirect(url_for("admin_pto_types"))
@@ -905,12 +1026,8 @@ def admin_pto_type_delete(pto_type_id):
     errors = []
     conn = get_db_connection()
 
-    pto_type = conn.execute(
-        "SELECT id, display_name FROM pto_types WHERE id = ?",
-        (pto_type_id,),
-    ).fetchone()
+    pto_type = pto_catalog.get_type(conn, pto_type_id)
     if pto_type is None:
-        conn.close()
         abort(404)
 
     balances_with_usage = conn.execute(
@@ -925,33 +1042,515 @@ def admin_pto_type_delete(pto_type_id):
         "SELECT COUNT(*) FROM pto_entries WHERE pto_type_id = ?",
         (pto_type_id,),
     ).fetchone()[0]
+    active_policies = conn.execute(
+        "SELECT COUNT(*) FROM accrual_policies WHERE pto_type_id = ? AND is_active = 1",
+        (pto_type_id,),
+    ).fetchone()[0]
 
     if balances_with_usage > 0 or entries_count > 0:
         errors.append(
             "Cannot delete PTO type; it is in use. Deactivate instead."
         )
-        conn.close()
+        return render_admin_pto_types(errors)
+    if active_policies > 0:
+        errors.append(
+            "Cannot delete PTO type; accrual policies grant it. Deactivate them first."
+        )
         return render_admin_pto_types(errors)
 
-    conn.execute("DELETE FROM pto_balances WHERE pto_type_id = ?", (pto_type_id,))
-    conn.execute("DELETE FROM pto_types WHERE id = ?", (pto_type_id,))
-    conn.commit()
-    conn.close()
+    def delete_pto_type(conn):
+        # Only unused types get here, so their ledger holds openings,
+        # adjustments and accruals from policies since deactivated.
+        jobs.cancel_for_pto_type(conn, pto_type_id)
+        conn.execute("DELETE FROM accrual_policies WHERE pto_type_id = ?", (pto_type_id,))
+        conn.execute("DELETE FROM balance_snapshots WHERE pto_type_id = ?", (pto_type_id,))
+        conn.execute("DELETE FROM balance_ledger WHERE pto_type_id = ?", (pto_type_id,))
+        with balance_cache.invalidating(conn):
+            conn.execute("DELETE FROM pto_balances WHERE pto_type_id = ?", (pto_type_id,))
+        conn.execute("DELETE FROM pto_types WHERE id = ?", (pto_type_id,))
+        change_feed.record(conn, "pto_type_deleted", {"id": pto_type_id})
+
+    db.run_write(conn, delete_pto_type)
+    pto_catalog.invalidate()
     flash("PTO type deleted.")
 
     return redirect(url_for("admin_pto_types"))
 
-def render_admin_pto_types(errors=None):
+@app.route("/admin/holidays", methods=["GET"])
+@admin_required
+def admin_holidays():
+    return render_admin_holidays()
+
+
+@app.route("/admin/holidays/calendars/new", methods=["POST"])
+@admin_required
+def admin_holiday_calendar_new():
+    name = request.form.get("name", "").strip()
+    if not name:
+        return render_admin_holidays(["Calendar name is required."])
+
+    try:
+        db.run_write(
+            get_db_connection(),
+            lambda conn: conn.execute(
+                "INSERT INTO holiday_calendars (name, is_default) VALUES (?, 0)", (name,)
+            ),
+        )
+    except sqlite3.IntegrityError:
+        return render_admin_holidays(["Calendar name must be unique."])
+
+    flash("Holiday calendar added.")
+    return redirect(url_for("admin_holidays"))
+
+
+@app.route("/admin/holidays/calendars/<int:calendar_id>/default", methods=["POST"])
+@admin_required
+def admin_holiday_calendar_default(calendar_id):
     conn = get_db_connection()
-    ensure_default_pto_types(conn)
-    pto_types = conn.execute(
+    if conn.execute("SELECT 1 FROM holiday_calendars WHERE id = ?", (calendar_id,)).fetchone() is None:
+        abort(404)
+
+    def set_default(conn):
+        conn.execute("UPDATE holiday_calendars SET is_default = (id = ?)", (calendar_id,))
+
+    db.run_write(conn, set_default)
+    resync_upcoming_occupancy(conn)
+    flash("Default holiday calendar changed.")
+    return redirect(url_for("admin_holidays"))
+
+
+@app.route("/admin/holidays/calendars/<int:calendar_id>/delete", methods=["POST"])
+@admin_required
+def admin_holiday_calendar_delete(calendar_id):
+    conn = get_db_connection()
+    calendar_row = conn.execute(
+        "SELECT id, is_default FROM holiday_calendars WHERE id = ?", (calendar_id,)
+    ).fetchone()
+    if calendar_row is None:
+        abort(404)
+    if calendar_row["is_default"]:
+        return render_admin_holidays(
+            ["Cannot delete the default calendar. Make another calendar the default first."]
+        )
+
+    def delete_calendar(conn):
+        conn.execute("DELETE FROM holiday_calendars WHERE id = ?", (calendar_id,))
+        holiday_calendar.touch_calendar(conn, calendar_id)
+
+    db.run_write(conn, delete_calendar)
+    flash("Holiday calendar deleted.")
+    return redirect(url_for("admin_holidays"))
+
+
+@app.route("/admin/holidays/calendars/<int:calendar_id>/rules/new", methods=["POST"])
+@admin_required
+def admin_holiday_rule_new(calendar_id):
+    conn = get_db_connection()
+    if conn.execute("SELECT 1 FROM holiday_calendars WHERE id = ?", (calendar_id,)).fetchone() is None:
+        abort(404)
+
+    name = request.form.get("name", "").strip()
+    kind = request.form.get("kind", "").strip()
+    observed = 1 if request.form.get("observed") == "1" else 0
+    errors = []
+
+    if not name:
+        errors.append("Holiday name is required.")
+    if kind not in holiday_calendar.RULE_KINDS:
+        errors.append("Please select a rule type.")
+
+    def int_field(field, label, low, high):
+        raw = request.form.get(field, "").strip()
+        try:
+            value = int(raw)
+        except ValueError:
+            errors.append(f"{label} is required.")
+            return None
+        if not low <= value <= high:
+            errors.append(f"{label} must be between {low} and {high}.")
+            return None
+        return value
+
+    month = day = weekday = nth = None
+    holiday_date = None
+    if kind == "fixed":
+        month = int_field("month", "Month", 1, 12)
+        day = int_field("day", "Day", 1, 31)
+        if month and day and day > cal.monthrange(2000, month)[1]:  # 2000 is a leap year
+            errors.append("That day does not exist in the selected month.")
+    elif kind in ("nth_weekday", "last_weekday"):
+        month = int_field("month", "Month", 1, 12)
+        weekday = int_field("weekday", "Weekday", 0, 6)
+        if kind == "nth_weekday":
+            nth = int_field("nth", "Occurrence", 1, 5)
+    elif kind == "date":
+        holiday_date = request.form.get("holiday_date", "").strip()
+        try:
+            datetime.strptime(holiday_date, "%Y-%m-%d")
+        except ValueError:
+            errors.append("A valid date is required.")
+
+    if errors:
+        return render_admin_holidays(errors)
+
+    def insert_rule(conn):
+        conn.execute(
+            """
+            INSERT INTO holiday_rules
+                (calendar_id, name, kind, month, day, weekday, nth, holiday_date, observed)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (calendar_id, name, kind, month, day, weekday, nth, holiday_date, observed),
+        )
+        holiday_calendar.touch_calendar(conn, calendar_id)
+
+    db.run_write(conn, insert_rule)
+    resync_upcoming_occupancy(conn)
+    flash("Holiday added.")
+    return redirect(url_for("admin_holidays"))
+
+
+@app.route("/admin/holidays/rules/<int:rule_id>/delete", methods=["POST"])
+@admin_required
+def admin_holiday_rule_delete(rule_id):
+    conn = get_db_connection()
+    rule = conn.execute(
+        "SELECT id, calendar_id FROM holiday_rules WHERE id = ?", (rule_id,)
+    ).fetchone()
+    if rule is None:
+        abort(404)
+
+    def delete_rule(conn):
+        conn.execute("DELETE FROM holiday_rules WHERE id = ?", (rule_id,))
+        holiday_calendar.touch_calendar(conn, rule["calendar_id"])
+
+    db.run_write(conn, delete_rule)
+    resync_upcoming_occupancy(conn)
+    flash("Holiday removed.")
+    return redirect(url_for("admin_holidays"))
+
+
+@app.route("/admin/import", methods=["GET", "POST"])
+@admin_required
+def admin_import():
+    if request.method == "GET":
+        return render_template("admin_import.html", errors=[], report=None)
+
+    kind = request.form.get("kind", "")
+    upload = request.files.get("file")
+    errors = []
+    if kind not in importer.IMPORTERS:
+        errors.append("Please choose what to import.")
+    if upload is None or not upload.filename:
+        errors.append("Please choose a file.")
+    if errors:
+        return render_template("admin_import.html", errors=errors, report=None)
+
+    fmt = request.form.get("format") or importer.detect_format(upload.filename)
+    if fmt not in importer.FORMATS:
+        fmt = "csv"
+    options = {}
+    if kind == "entries":
+        options = {
+            "manager_id": session.get("user_id"),
+            "max_people_out": app.config["MAX_PEOPLE_OUT_PER_DAY"],
+            "allow_overlap": app.config["ALLOW_OVERLAPPING_PTO"],
+        }
+
+    # Stream the upload instead of reading it into memory.
+    # Text that isn't UTF-8 is reported on the line it starts at, after the
+    # rows before it have imported.
+    stream = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", errors="surrogateescape", newline="")
+    try:
+        report = importer.run_import(get_db_connection(), kind, stream, fmt, **options)
+    finally:
+        stream.detach()
+
+    return render_template("admin_import.html", errors=[], report=report)
+
+
+@app.route("/admin/export", methods=["GET"])
+@admin_or_manager_required
+def admin_export():
+    return render_admin_export()
+
+
+@app.route("/admin/export/entries")
+@admin_or_manager_required
+def admin_export_entries():
+    fmt = request.args.get("format", "csv")
+    start_date = request.args.get("start_date", "").strip()
+    end_date = request.args.get("end_date", "").strip()
+    pto_type_id = request.args.get("pto_type_id", "").strip()
+    employee_id = request.args.get("employee_id", "").strip()
+
+    errors = []
+    if fmt not in exports.FORMATS:
+        errors.append("Unknown export format.")
+    for label, value in (("Start date", start_date), ("End date", end_date)):
+        if value:
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                errors.append(f"{label} must be YYYY-MM-DD.")
+    if start_date and end_date and not errors and end_date < start_date:
+        errors.append("End date cannot be before start date.")
+    if pto_type_id and not pto_type_id.isdigit():
+        errors.append("Invalid PTO type.")
+    if employee_id and not employee_id.isdigit():
+        errors.append("Invalid employee.")
+    if errors:
+        return render_admin_export(errors)
+
+    rows = exports.iter_entries(
+        get_db_connection(),
+        start_date=start_date or None,
+        end_date=end_date or None,
+        pto_type_id=int(pto_type_id) if pto_type_id else None,
+        employee_id=int(employee_id) if employee_id else None,
+    )
+    return export_response(fmt, "pto_entries", "PTO Entries", exports.ENTRY_HEADER, rows)
+
+
+@app.route("/admin/export/balances")
+@admin_or_manager_required
+def admin_export_balances():
+    fmt = request.args.get("format", "csv")
+    if fmt not in exports.FORMATS:
+        return render_admin_export(["Unknown export format."])
+    rows = exports.iter_balances(get_db_connection())
+    return export_response(fmt, "pto_balances", "PTO Balances", exports.BALANCE_HEADER, rows)
+
+
+def export_response(fmt, filename, sheet_name, header, rows):
+    """Stream an export; the request context (and its connection) lives until the last row."""
+    return Response(
+        stream_with_context(exports.stream(fmt, sheet_name, header, rows)),
+        mimetype=exports.MIMETYPES[fmt],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}_{date.today().isoformat()}.{fmt}"'
+        },
+    )
+
+
+def render_admin_export(errors=None):
+    pto_types = pto_catalog.all_types(get_db_connection())
+    return render_template(
+        "admin_export.html",
+        pto_types=pto_types,
+        args=request.args,
+        errors=errors or [],
+    )
+
+
+@app.route("/admin/jobs")
+@admin_required
+def admin_jobs():
+    return render_template("admin_jobs.html", jobs=jobs.recent_jobs(get_db_connection()))
+
+
+@app.route("/admin/jobs/<int:job_id>")
+@admin_required
+def admin_job_status(job_id):
+    job = jobs.get_job(get_db_connection(), job_id)
+    if job is None:
+        abort(404)
+    return jsonify({
+        key: job[key]
+        for key in (
+            "id", "kind", "status", "progress_done", "progress_total", "attempts", "max_attempts",
+            "error", "run_after", "created_at", "started_at", "finished_at",
+        )
+    })
+
+
+@app.route("/admin/jobs/<int:job_id>/retry", methods=["POST"])
+@admin_required
+def admin_job_retry(job_id):
+    if jobs.retry(get_db_connection(), job_id):
+        flash(f"Job #{job_id} queued again.")
+    else:
+        flash(f"Job #{job_id} hasn't failed; nothing to retry.")
+    return redirect(url_for("admin_jobs"))
+
+
+@app.route("/admin/cache-stats")
+@admin_required
+def admin_cache_stats():
+    return jsonify({
+        "balance_summaries": balance_cache.stats(),
+        "template_fragments": fragment_cache.stats(),
+    })
+
+
+@app.route("/metrics")
+def metrics():
+    if not instrumentation.metrics_authorized(request):
+        abort(401)
+    cache = balance_cache.stats()
+    fragments = fragment_cache.stats()
+    job_counts = dict.fromkeys(jobs.STATUSES, 0)
+    job_counts.update(
+        get_db_connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+    )
+    lines = [
+        *instrumentation.gauges(
+            "pto_balance_cache_entries", "Balance summaries cached in this process.", cache["size"]
+        ),
+        *instrumentation.gauges(
+            "pto_balance_cache_lookups", "Balance cache lookups since start, by result.",
+            {"hit": cache["hits"], "miss": cache["misses"]}, "result",
+        ),
+        *instrumentation.gauges(
+            "pto_balance_cache_evictions", "Entries evicted for size since start.", cache["evictions"]
+        ),
+        *instrumentation.gauges(
+            "pto_balance_cache_invalidations", "Invalidating writes since start.", cache["invalidations"]
+        ),
+        *instrumentation.gauges(
+            "pto_fragment_cache_lookups", "Template fragment cache lookups since start, by result.",
+            {"hit": fragments["hits"], "miss": fragments["misses"]}, "result",
+        ),
+        *instrumentation.gauges("pto_jobs", "Background jobs by status.", job_counts, "status"),
+    ]
+    return Response(
+        instrumentation.render_metrics(lines), mimetype="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+def events_args():
+    """(stream arguments for change_feed.open_stream, None), or (None, an error response)."""
+    employee_id = None
+    if request.args.get("employee_id", "all") != "all":
+        try:
+            employee_id = int(request.args["employee_id"])
+        except ValueError:
+            return None, ("Invalid employee_id", 400)
+
+    month_start = month_end = None
+    month_str = request.args.get("month", "").strip()
+    if month_str:
+        try:
+            year, month = (int(part) for part in month_str.split("-"))
+            month_start = date(year, month, 1).isoformat()
+            month_end = date(year, month, cal.monthrange(year, month)[1]).isoformat()
+        except ValueError:
+            return None, ("Invalid month format. Use YYYY-MM.", 400)
+
+    kinds = [kind for kind in request.args.get("kinds", "").split(",") if kind]
+    if any(kind not in change_feed.KINDS for kind in kinds):
+        return None, ("Unknown event kind", 400)
+
+    # EventSource sends Last-Event-ID when it reconnects; pages pass the
+    # id they were rendered at for the first connection. None: from now.
+    after_id = None
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    if last_event_id:
+        try:
+            after_id = int(last_event_id)
+        except ValueError:
+            return None, ("Invalid Last-Event-ID", 400)
+
+    return {
+        "after_id": after_id,
+        "employee_id": employee_id,
+        "month_start": month_start,
+        "month_end": month_end,
+        "kinds": kinds,
+    }, None
+
+
+def events_response(body):
+    if body is None:
+        # This process is serving all the streams it will; the page retries later.
+        retry_ms = int(app.config["FEED_BUSY_RETRY_MS"])
+        return Response(
+            f"retry: {retry_ms}\n\n",
+            status=503,
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "Retry-After": str(max(retry_ms // 1000, 1))},
+        )
+    return Response(
+        body,
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/events")
+@twin_decorators(login_required)
+def events():
+    """Server-sent change feed for open calendar and employee pages (see change_feed.py)."""
+    args, error = events_args()
+    if error:
+        return error
+    if args["after_id"] is None:
+        args["after_id"] = change_feed.latest_id(get_db_connection())
+    return events_response(change_feed.open_stream(app, **args))
+
+
+@async_twin(events)
+async def events_async():
+    args, error = events_args()
+    if error:
+        return error
+    if args["after_id"] is None:
+        args["after_id"] = await async_db.run(change_feed.latest_id)
+    return events_response(change_feed.open_stream(app, **args, run_async=True))
+
+
+def resync_upcoming_occupancy(conn):
+    """Holidays changed: re-expand days for entries that haven't ended yet.
+
+    Past entries keep the days they were booked with.
+    """
+    occupancy.rebuild(conn, since=date.today())
+    # Bumped once the days are rewritten, so pages versioned by it can't be
+    # cached from a half-finished resync.
+    db.run_write(conn, lambda conn: change_counters.bump(conn, "pto_days"))
+
+
+def render_admin_holidays(errors=None):
+    conn = get_db_connection()
+    calendars = conn.execute(
+        "SELECT id, name, is_default FROM holiday_calendars ORDER BY is_default DESC, name"
+    ).fetchall()
+    rules = conn.execute(
+        """
+        SELECT id, calendar_id, name, kind, month, day, weekday, nth, holiday_date, observed
+        FROM holiday_rules
+        ORDER BY calendar_id, month, day, name
         """
-        SELECT id, code, display_name, is_active, default_hours
-        FROM pto_types
-        ORDER BY is_active DESC, display_name
-        """,
     ).fetchall()
-    conn.close()
+
+    rules_by_calendar = {}
+    for rule in rules:
+        rules_by_calendar.setdefault(rule["calendar_id"], []).append(
+            {"id": rule["id"], "name": rule["name"], "description": holiday_calendar.describe_rule(rule)}
+        )
+
+    # Upcoming observed dates for the default calendar, as a sanity check.
+    upcoming = []
+    default_calendar = holiday_calendar.load_calendar(conn)
+    if default_calendar is not None:
+        today = date.today()
+        upcoming = default_calendar.holidays_between(today, date(today.year + 1, 12, 31))
+
+    return render_template(
+        "admin_holidays.html",
+        calendars=calendars,
+        rules_by_calendar=rules_by_calendar,
+        upcoming=upcoming,
+        month_names=list(cal.month_name),
+        weekday_names=holiday_calendar.WEEKDAY_NAMES,
+        errors=errors or [],
+    )
+
+
+def render_admin_pto_types(errors=None):
+    conn = get_db_connection()
+    ensure_default_pto_types(conn)
+    pto_types = pto_catalog.all_types(conn)
 
     return render_template(
         "admin_pto_types.html",
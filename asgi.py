@@ -0,0 +1,214 @@
+"""
+ASGI entry point, for serving from an event loop:
+
+    uvicorn asgi:application --host 0.0.0.0 --port 8000 --workers 4
+
+Settings come from the same environment variables as wsgi.py, plus:
+
+    PTO_THREADS      threads for requests served by the WSGI app (default 4);
+                     async views' queries get the rest of DB_POOL_SIZE
+                     unless ASYNC_DB_THREADS is set (see async_db.py)
+
+GET and HEAD requests for an endpoint in app.ASYNC_VIEWS (the calendar,
+the employee list and detail pages, the PTO types page, the change feed)
+run that async view on the event loop. Its queries go to async_db's
+bounded thread pool, and independent ones are gathered, so a page costs
+about as much as its slowest query and a waiting page holds no thread. An
+async view may return a Response whose body is an async iterable (the
+change feed's stream), which is sent as it's produced. Everything else -
+forms, uploads, the JSON API, exports - goes to the ordinary WSGI app
+through a2wsgi, on a pool of PTO_THREADS threads; it reads the request
+body as it arrives (so /admin/import streams) and streams the response.
+"""
+import asyncio
+import io
+import os
+import sys
+
+from a2wsgi import WSGIMiddleware
+from flask import request_started
+from werkzeug.exceptions import HTTPException
+
+import async_db
+from app import ASYNC_VIEWS
+from wsgi import app
+
+
+def build_environ(scope, body=b""):
+    """The WSGI environ (PEP 3333) for an ASGI http scope and its request body, for async views."""
+    script_name = scope.get("root_path", "")
+    path = scope["path"]
+    if script_name and path.startswith(script_name):
+        path = path[len(script_name):]
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": script_name.encode("utf-8").decode("latin-1"),
+        "PATH_INFO": path.encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("ascii"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1] or 80),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.input_terminated": True,  # the whole body is read up front
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"], environ["REMOTE_PORT"] = scope["client"][0], str(scope["client"][1])
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1")
+        if name == "content-length":
+            key = "CONTENT_LENGTH"
+        elif name == "content-type":
+            key = "CONTENT_TYPE"
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if key in environ:
+            value = f"{environ[key]},{value}"
+        environ[key] = value
+    return environ
+
+
+def _response_start(status, headers):
+    return {
+        "type": "http.response.start",
+        "status": int(status.split(" ", 1)[0]),
+        "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+    }
+
+
+def _terminated_input(wsgi_app):
+    """
+    a2wsgi's wsgi.input ends where the request body does, so say so: a
+    body sent without a Content-Length (chunked) is then read to its end
+    instead of taken as empty.
+    """
+
+    def with_terminated_input(environ, start_response):
+        environ["wsgi.input_terminated"] = True
+        return wsgi_app(environ, start_response)
+
+    return with_terminated_input
+
+
+class Application:
+    def __init__(self, flask_app, threads):
+        self.app = flask_app
+        async_db.configure(flask_app, threads)
+        self.wsgi = WSGIMiddleware(_terminated_input(flask_app), workers=threads)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http":
+            raise ValueError(f"unsupported ASGI scope type {scope['type']!r}")
+
+        # Async views are GET and HEAD only, so they have no body to read.
+        environ = build_environ(scope)
+        view = self.async_view(environ)
+        if view is not None:
+            await self.run_async(view, environ, receive, send)
+        else:
+            await self.wsgi(scope, receive, send)
+
+    def async_view(self, environ):
+        if environ["REQUEST_METHOD"] not in ("GET", "HEAD"):
+            return None
+        try:
+            endpoint, _ = self.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return None  # 404s, 405s and slash redirects come from the WSGI app
+        return ASYNC_VIEWS.get(endpoint)
+
+    async def run_async(self, view, environ, receive, send):
+        """Flask.wsgi_app and full_dispatch_request, awaiting the view on the event loop."""
+        app = self.app
+        ctx = app.request_context(environ)
+        error = None
+        started = []
+        stream = None
+        try:
+            try:
+                ctx.push()
+                try:
+                    request_started.send(app, _async_wrapper=app.ensure_sync)
+                    rv = app.preprocess_request()
+                    if rv is None:
+                        rv = await view(**ctx.request.view_args)
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                response = app.finalize_request(rv)
+            except Exception as e:
+                error = e
+                response = app.handle_exception(e)
+            if hasattr(response.response, "__aiter__"):
+                # Streamed after the context is gone, like a WSGI generator.
+                stream = response.response
+                started.extend((response.status, response.get_wsgi_headers(environ).to_wsgi_list()))
+                body = b""
+            else:
+                # Buffered; no body for HEAD or 304.
+                body = b"".join(response(
+                    environ, lambda status, headers, exc_info=None: started.extend((status, headers))
+                ))
+        finally:
+            if error is not None and app.should_ignore_error(error):
+                error = None
+            ctx.pop(error)
+
+        if stream is not None:
+            await self.send_stream(stream, environ, *started, receive, send)
+            return
+        await send(_response_start(*started))
+        await send({"type": "http.response.body", "body": body})
+
+    async def send_stream(self, stream, environ, status, headers, receive, send):
+        """Send an async body chunk by chunk until it ends or the client goes away."""
+
+        async def pump():
+            await send(_response_start(status, headers))
+            if environ["REQUEST_METHOD"] != "HEAD":
+                async for chunk in stream:
+                    await send({
+                        "type": "http.response.body",
+                        "body": chunk.encode() if isinstance(chunk, str) else chunk,
+                        "more_body": True,
+                    })
+            await send({"type": "http.response.body", "body": b""})
+
+        async def watch_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        sender = asyncio.ensure_future(pump())
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            # A page that goes away ends its stream at once, mid-wait.
+            await asyncio.wait((sender, watcher), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (sender, watcher):
+                task.cancel()
+            await asyncio.gather(sender, watcher, return_exceptions=True)
+            await stream.aclose()
+        if not sender.cancelled() and sender.exception() is not None:
+            raise sender.exception()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.wsgi.executor.shutdown(wait=False)
+                async_db.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+application = Application(app, threads=int(os.environ.get("PTO_THREADS", 4)))
@@ -0,0 +1,125 @@
+"""
+Database access for async views (see asgi.py).
+
+sqlite3 blocks, so async views never query on the event loop. `run` calls
+fn(conn, *args) on a bounded thread pool with a connection checked out
+of the app's pool for that one call, which lets a view run independent
+queries at the same time:
+
+    employee, summary = await asyncio.gather(
+        async_db.run(load_employee, employee_id),
+        async_db.run(balances.employee_summary, employee_id),
+    )
+
+Each call sees the current request and app context (request, session, g),
+but gets its own connection, so gathered queries don't share a read
+snapshot; like the sync views' autocommit reads, each sees what had
+committed when it ran. `run_blocking` runs anything else that blocks
+(template rendering, which may hit the fragment cache's lazy queries) on
+the same pool.
+
+ASYNC_DB_THREADS bounds how many run at once per process. Each one holds
+a connection from the same pool as the WSGI threads in asgi.py, so by
+default it's DB_POOL_SIZE less those threads; `configure` works that out
+when asgi.py starts, and warns if a configured value leaves the threads
+waiting on each other for connections.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+import db
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = {
+    # Queries and renders running at once for async views. None: DB_POOL_SIZE
+    # less the WSGI threads (see configure), or all of it outside asgi.py.
+    "ASYNC_DB_THREADS": None,
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(app=None):
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                config = (app or current_app).config
+                _executor = ThreadPoolExecutor(
+                    max_workers=config["ASYNC_DB_THREADS"] or config["DB_POOL_SIZE"],
+                    thread_name_prefix="async-db",
+                )
+    return _executor
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """fn(*args, **kwargs) on the thread pool, in a copy of the caller's context."""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        get_executor(), lambda: context.run(fn, *args, **kwargs)
+    )
+
+
+async def run(fn, *args, **kwargs):
+    """fn(conn, *args, **kwargs) on the thread pool with a pooled connection of its own."""
+    pool = db.request_pool()  # the request's read replica, if it's routed to one
+
+    def call():
+        conn = pool.acquire()
+        try:
+            return fn(conn, *args, **kwargs)
+        finally:
+            pool.release(conn)
+
+    return await run_blocking(call)
+
+
+def configure(app, sync_threads):
+    """
+    Size ASYNC_DB_THREADS for a server that also runs sync_threads WSGI
+    threads on the same connection pool, and warn if together they need
+    more connections than DB_POOL_SIZE allows.
+    """
+    config = app.config
+    pool_size = config["DB_POOL_SIZE"]
+    if config["ASYNC_DB_THREADS"] is None:
+        config["ASYNC_DB_THREADS"] = max(pool_size - sync_threads, 1)
+    if config["ASYNC_DB_THREADS"] + sync_threads > pool_size:
+        logger.warning(
+            "ASYNC_DB_THREADS (%d) plus %d WSGI threads is more than DB_POOL_SIZE (%d); "
+            "requests will queue for connections and may time out. Raise DB_POOL_SIZE "
+            "or lower the thread counts.",
+            config["ASYNC_DB_THREADS"], sync_threads, pool_size,
+        )
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+
+
+def _reset_after_fork():
+    global _executor, _executor_lock
+    # The parent's worker threads don't exist in the child.
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def init_app(app):
+    for key, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(key, value)
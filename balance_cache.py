@@ -0,0 +1,153 @@
+"""
+Per-employee cache of balance summaries (the rows behind employee_detail).
+
+Entries live in an LRU with an optional size limit and TTL. Writes that
+change an employee's balances drop just that employee, by wrapping the
+write in invalidating():
+
+    with balance_cache.invalidating(conn, [employee_id]):
+        conn.execute("UPDATE pto_balances ...")
+
+The cache is also tagged with the pto_balances and pto_types change
+counters. A write this process didn't wrap, including one from another
+worker process, moves a counter past the tag and the next lookup starts
+from an empty cache. Wrapped writes advance the tag themselves, so they
+only cost the employees they touch.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import change_counters
+
+COUNTERS = ("pto_balances", "pto_types")
+
+DEFAULT_CONFIG = {
+    "BALANCE_CACHE_SIZE": 1024,  # employees kept; None for no limit
+    "BALANCE_CACHE_TTL": 300.0,  # seconds; None to keep entries until invalidated
+}
+
+
+class BalanceCache:
+    def __init__(self, max_size=None, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = None
+        self._entries = OrderedDict()  # employee_id -> (expires_at, summary)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, conn, employee_id, load):
+        """The cached summary for employee_id, or load(conn, employee_id) on a miss."""
+        current = change_counters.versions(conn, *COUNTERS)
+        now = time.monotonic()
+        with self._lock:
+            if current != self.version:
+                self._entries.clear()
+                self.version = current
+            found = self._entries.get(employee_id)
+            if found is not None and (found[0] is None or found[0] > now):
+                self._entries.move_to_end(employee_id)
+                self.hits += 1
+                return found[1]
+            self.misses += 1
+
+        summary = load(conn, employee_id)
+
+        with self._lock:
+            # Skip the store if a write moved the tag while we were loading.
+            if self.version == current:
+                expires_at = now + self.ttl if self.ttl else None
+                self._entries[employee_id] = (expires_at, summary)
+                self._entries.move_to_end(employee_id)
+                while self.max_size and len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return summary
+
+    @contextmanager
+    def invalidating(self, conn, employee_ids=None):
+        """
+        Wrap a write (inside its transaction) that changes these employees'
+        balances; None means it may change anyone's.
+        """
+        before = change_counters.versions(conn, *COUNTERS)
+        try:
+            yield
+        except BaseException:
+            # The transaction will roll back; don't tag with versions that
+            # may never be committed.
+            self.clear()
+            raise
+        after = change_counters.versions(conn, *COUNTERS)
+        with self._lock:
+            if employee_ids is None or self.version != before:
+                self._entries.clear()
+            else:
+                for employee_id in employee_ids:
+                    self._entries.pop(employee_id, None)
+            self.version = after if self.version == before else None
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.version = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+_cache = BalanceCache(
+    max_size=DEFAULT_CONFIG["BALANCE_CACHE_SIZE"], ttl=DEFAULT_CONFIG["BALANCE_CACHE_TTL"]
+)
+
+
+def get_summary(conn, employee_id, load):
+    return _cache.get(conn, employee_id, load)
+
+
+def invalidating(conn, employee_ids=None):
+    return _cache.invalidating(conn, employee_ids)
+
+
+def stats():
+    return _cache.stats()
+
+
+def clear():
+    _cache.clear()
+
+
+def _reset_after_fork():
+    # The parent's lock may have been held at fork time; its entries are
+    # still valid, but start clean like any new worker.
+    _cache._lock = threading.Lock()
+    _cache.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def init_app(app):
+    for key, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(key, value)
+    _cache.max_size = app.config["BALANCE_CACHE_SIZE"]
+    _cache.ttl = app.config["BALANCE_CACHE_TTL"]
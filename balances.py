@@ -0,0 +1,88 @@
+"""
+Employee balance rows as shown on employee_detail and returned by the API.
+
+employee_summary() is the cached entry point; see balance_cache.py for
+when cached summaries are dropped.
+"""
+import balance_cache
+import pto_catalog
+
+
+def employee_balance_rows(conn, employee_id):
+    """One row per active PTO type with the employee's balance (None where missing)."""
+    balances = {
+        row["pto_type_id"]: row
+        for row in conn.execute(
+            "SELECT pto_type_id, hours_allotted, hours_used FROM pto_balances WHERE employee_id = ?",
+            (employee_id,),
+        )
+    }
+    rows = []
+    for pto_type in pto_catalog.active_types(conn):
+        balance = balances.get(pto_type["id"])
+        rows.append(
+            {
+                "pto_type_id": pto_type["id"],
+                "display_name": pto_type["display_name"],
+                "hours_allotted": balance["hours_allotted"] if balance is not None else None,
+                "hours_used": balance["hours_used"] if balance is not None else None,
+            }
+        )
+    return rows
+
+
+def load_summary(conn, employee_id):
+    """Everything employee_detail shows about balances (uncached)."""
+    pto_rows = employee_balance_rows(conn, employee_id)
+    balance_rows = build_balance_rows(pto_rows)
+
+    # Derive balances for read-only view from balance_rows to avoid duplication
+    balances = []
+    for row in balance_rows:
+        hours_allotted = row["hours_allotted"] if row["hours_allotted"] is not None else 0.0
+        hours_used = row["hours_used"]
+        balances.append(
+            {
+                "pto_type_id": row["pto_type_id"],
+                "pto_name": row["display_name"],
+                "hours_allotted": hours_allotted,
+                "hours_used": hours_used,
+                "hours_remaining": hours_allotted - hours_used,
+            }
+        )
+    return {"pto_rows": pto_rows, "balance_rows": balance_rows, "balances": balances}
+
+
+def build_balance_rows(pto_rows, form_data=None):
+    rows = []
+    for row in pto_rows:
+        hours_allotted = row["hours_allotted"]
+        hours_used = row["hours_used"] if row["hours_used"] is not None else 0.0
+
+        if form_data is not None:
+            input_value = form_data.get(str(row["pto_type_id"]), "")
+        else:
+            input_value = "" if hours_allotted is None else f"{hours_allotted:g}"
+
+        remaining = (
+            None
+            if hours_allotted is None
+            else float(hours_allotted) - float(hours_used)
+        )
+
+        rows.append(
+            {
+                "pto_type_id": row["pto_type_id"],
+                "display_name": row["display_name"],
+                "hours_allotted": hours_allotted,
+                "hours_used": hours_used,
+                "remaining": remaining,
+                "input_value": input_value,
+            }
+        )
+    return rows
+
+
+def employee_summary(conn, employee_id):
+    """load_summary(), through the per-employee balance cache."""
+    return balance_cache.get_summary(conn, employee_id, load_summary)
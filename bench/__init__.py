@@ -0,0 +1 @@
+"""Benchmark suite; see bench/run.py."""
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Synthetic PTO tracker databases for benchmarks.
+
+Builds a fresh database with init_db's schema and migrations, then fills it
+with employees spread over teams, extra PTO types, balances and years of
+non-overlapping PTO entries. Derived tables (ledger, pto_days) are built
+the same way the app builds them, so every page sees consistent data.
+Generation is seeded, so the same scale always produces the same data.
+
+Usage (from the repository root):
+    python -m bench.datagen --scale medium --db /tmp/pto_bench.db
+"""
+import argparse
+import random
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+import business_days
+import db
+import init_db
+import occupancy
+
+SCALES = {
+    # name: (employees, PTO types, years of entries, entries per employee per year)
+    "tiny": (100, 5, 1, 6),
+    "small": (1_000, 8, 2, 8),
+    "medium": (10_000, 10, 3, 8),
+    "large": (100_000, 12, 3, 8),
+}
+TEAMS = ("Engineering", "Sales", "Support", "Finance", "Operations", "Marketing", "HR", None)
+FIRST_NAMES = ("Ana", "Ben", "Chloe", "Dev", "Eli", "Fay", "Gus", "Hana", "Ivan", "Jo", "Kai", "Lena")
+LAST_NAMES = ("Adams", "Brown", "Chen", "Diaz", "Evans", "Fox", "Garcia", "Hill", "Ito", "Jones", "Khan", "Lee")
+INSERT_BATCH_SIZE = 10_000
+FIRST_YEAR = 2023
+
+
+def generate(db_path, scale="small", seed=1, verbose=True):
+    """Create db_path from scratch at a named scale; returns the scale's parameters."""
+    employee_count, type_count, years, entries_per_year = SCALES[scale]
+    rng = random.Random(seed)
+
+    init_db.DB_PATH = Path(db_path)
+    init_db.init_db()
+    conn = db.connect(db_path)
+    try:
+        def say(message):
+            if verbose:
+                print(message, file=sys.stderr)
+
+        say(f"Adding {type_count - 3} PTO types...")
+        conn.executemany(
+            "INSERT INTO pto_types (code, display_name, is_active, default_hours) VALUES (?, ?, 1, ?)",
+            [(f"TYPE_{n}", f"Synthetic Type {n}", rng.choice((8, 16, 24, 40))) for n in range(4, type_count + 1)],
+        )
+
+        say(f"Adding {employee_count} employees...")
+        for start in range(0, employee_count, INSERT_BATCH_SIZE):
+            conn.executemany(
+                """
+                INSERT INTO employees
+                    (first_name, last_name, employment_type, email, team, hire_date, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (
+                        rng.choice(FIRST_NAMES), f"{rng.choice(LAST_NAMES)}{n}",
+                        rng.choice(("hourly", "salaried")), f"person{n}@example.com",
+                        rng.choice(TEAMS),
+                        (date(2005, 1, 1) + timedelta(days=rng.randrange(365 * 18))).isoformat(),
+                        "active" if rng.random() < 0.95 else "inactive",
+                    )
+                    for n in range(start, min(start + INSERT_BATCH_SIZE, employee_count))
+                ],
+            )
+        conn.commit()
+
+        say("Adding balances...")
+        conn.execute(
+            """
+            INSERT INTO pto_balances (employee_id, pto_type_id, hours_allotted, hours_used)
+            SELECT e.id, t.id, t.default_hours * 4, 0
+            FROM employees e CROSS JOIN pto_types t
+            """
+        )
+
+        say(f"Adding {years} year(s) of PTO entries...")
+        type_ids = [row[0] for row in conn.execute("SELECT id FROM pto_types")]
+        employee_ids = [row[0] for row in conn.execute("SELECT id FROM employees ORDER BY id")]
+        span = 365 * years
+        batch = []
+        for employee_id in employee_ids:
+            day = date(FIRST_YEAR, 1, 1) + timedelta(days=rng.randrange(30))
+            for _ in range(entries_per_year * years):
+                day += timedelta(days=rng.randrange(7, span // (entries_per_year * years) * 2))
+                end = day + timedelta(days=rng.choice((0, 0, 0, 1, 2, 4)))
+                if (end - date(FIRST_YEAR, 1, 1)).days >= span:
+                    break
+                hours = business_days.calculate_pto_hours(day, end)
+                if hours:
+                    batch.append((employee_id, rng.choice(type_ids), day.isoformat(), end.isoformat(), hours))
+                day = end + timedelta(days=1)
+            if len(batch) >= INSERT_BATCH_SIZE:
+                _insert_entries(conn, batch)
+                batch = []
+        _insert_entries(conn, batch)
+        conn.execute(
+            """
+            UPDATE pto_balances
+            SET hours_used = used.hours
+            FROM (
+                SELECT employee_id, pto_type_id, SUM(hours) AS hours
+                FROM pto_entries
+                GROUP BY employee_id, pto_type_id
+            ) AS used
+            WHERE pto_balances.employee_id = used.employee_id
+                AND pto_balances.pto_type_id = used.pto_type_id
+            """
+        )
+
+        say("Writing the balance ledger...")
+        today = date.today().isoformat()
+        conn.execute(
+            """
+            INSERT INTO balance_ledger
+                (employee_id, pto_type_id, kind, allotted_delta, used_delta, effective_date)
+            SELECT employee_id, pto_type_id, 'opening', hours_allotted, 0, ?
+            FROM pto_balances
+            """,
+            (today,),
+        )
+        conn.execute(
+            """
+            INSERT INTO balance_ledger
+                (employee_id, pto_type_id, kind, used_delta, effective_date, entry_id)
+            SELECT employee_id, pto_type_id, 'usage', hours, start_date, id
+            FROM pto_entries
+            """
+        )
+        conn.commit()
+
+        say("Expanding PTO days...")
+        occupancy.rebuild(conn)
+        conn.execute("ANALYZE")
+        conn.commit()
+        say(f"Done: {db_path}")
+    finally:
+        conn.close()
+    return {"employees": employee_count, "pto_types": type_count, "years": years}
+
+
+def _insert_entries(conn, rows):
+    conn.executemany(
+        """
+        INSERT INTO pto_entries (employee_id, pto_type_id, start_date, end_date, hours, notes)
+        VALUES (?, ?, ?, ?, ?, NULL)
+        """,
+        rows,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic benchmark database.")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--db", required=True, help="path of the database to (re)create")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    generate(args.db, args.scale, args.seed)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
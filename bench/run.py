@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Benchmarks: real routes through Flask's test client, plus microbenchmarks
+of the hot pure functions.
+
+Each scenario is timed per call. The report gives throughput and
+p50/p95/p99 latency in milliseconds. With --baseline, a scenario whose p95
+grew, or whose throughput dropped, by more than --tolerance fails the run
+(exit status 1). --save-baseline writes this run's results as the new
+baseline. Baselines are only comparable on the same machine and scale.
+
+Background job workers are off during a run, so the admin PTO type routes
+measure the request itself; the jobs they queue are left unprocessed.
+
+Usage (from the repository root):
+    python -m bench.run --scale small [--db /tmp/pto_bench_small.db] [--regenerate]
+        [--iterations 200] [--only calendar_view,employee_detail]
+        [--baseline bench/baseline.json] [--save-baseline] [--tolerance 0.25]
+        [--output results.json]
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from bench import datagen
+
+WARMUP_CALLS = 5
+MICRO_BATCH = 100  # calls timed together in microbenchmarks
+
+
+# --- Scenarios ---
+
+class Context:
+    """What scenarios share: the test client, a seeded RNG and facts about the data."""
+
+    def __init__(self, client, conn, rng):
+        self.client = client
+        self.rng = rng
+        self.employee_ids = [row[0] for row in conn.execute("SELECT id FROM employees WHERE status = 'active'")]
+        self.pto_type_ids = [row[0] for row in conn.execute("SELECT id FROM pto_types WHERE is_active = 1")]
+        bounds = conn.execute("SELECT MIN(start_date), MAX(start_date) FROM pto_entries").fetchone()
+        first = date.fromisoformat(bounds[0] or date.today().isoformat())
+        last = date.fromisoformat(bounds[1] or date.today().isoformat())
+        self.months = sorted({
+            (first + timedelta(days=n)).strftime("%Y-%m") for n in range(0, (last - first).days + 1, 28)
+        })
+        self.last_names = [row[0] for row in conn.execute("SELECT last_name FROM employees LIMIT 200")]
+        self.booking_day = date(2099, 1, 5)  # past any generated entry
+        self.counter = 0
+
+    def employee(self):
+        return self.rng.choice(self.employee_ids)
+
+
+def _expect(response, *statuses):
+    if response.status_code not in statuses:
+        raise RuntimeError(f"unexpected status {response.status_code}: {response.data[:200]!r}")
+
+
+def calendar_view(ctx):
+    _expect(ctx.client.get(f"/calendar?month={ctx.rng.choice(ctx.months)}"), 200)
+
+
+def calendar_view_employee(ctx):
+    _expect(ctx.client.get(f"/calendar?month={ctx.rng.choice(ctx.months)}&employee_id={ctx.employee()}"), 200)
+
+
+def employee_detail(ctx):
+    _expect(ctx.client.get(f"/employees/{ctx.employee()}"), 200)
+
+
+def employees_list(ctx):
+    _expect(ctx.client.get("/employees"), 200)
+
+
+def employees_list_search(ctx):
+    _expect(ctx.client.get(f"/employees?q={ctx.rng.choice(ctx.last_names)[:4]}"), 200)
+
+
+def pto_entry_new(ctx):
+    # One business day each, a week apart, so bookings never overlap.
+    day = ctx.booking_day + timedelta(days=7 * ctx.counter)
+    ctx.counter += 1
+    response = ctx.client.post(
+        f"/employees/{ctx.employee()}/pto/new",
+        data={"pto_type_id": str(ctx.rng.choice(ctx.pto_type_ids)), "start_date": day.isoformat(),
+              "end_date": day.isoformat(), "hours": "8"},
+    )
+    # 200 is the form again, e.g. for an exhausted balance; still a full request.
+    _expect(response, 302, 200)
+
+
+def admin_pto_type_new(ctx):
+    ctx.counter += 1
+    _expect(ctx.client.post(
+        "/admin/pto-types/new",
+        data={"code": f"bench_{time.time_ns()}_{ctx.counter}", "display_name": "Bench", "default_hours": "8"},
+    ), 302)
+
+
+def admin_pto_type_edit(ctx):
+    pto_type_id = ctx.rng.choice(ctx.pto_type_ids)
+    _expect(ctx.client.post(
+        f"/admin/pto-types/{pto_type_id}/edit",
+        data={"display_name": f"Type {pto_type_id}", "default_hours": str(ctx.rng.choice((8, 16, 40))),
+              "update_all_balances": "1"},
+    ), 302)
+
+
+ROUTE_SCENARIOS = {
+    "calendar_view": calendar_view,
+    "calendar_view_employee": calendar_view_employee,
+    "employee_detail": employee_detail,
+    "employees_list": employees_list,
+    "employees_list_search": employees_list_search,
+    "pto_entry_new": pto_entry_new,
+    "admin_pto_type_new": admin_pto_type_new,
+    "admin_pto_type_edit": admin_pto_type_edit,
+}
+
+
+def micro_calculate_pto_hours(rng):
+    from business_days import calculate_pto_hours
+
+    pairs = []
+    for _ in range(MICRO_BATCH):
+        start = date(2025, 1, 1) + timedelta(days=rng.randrange(365))
+        pairs.append((start.isoformat(), (start + timedelta(days=rng.randrange(15))).isoformat()))
+
+    def call():
+        for start, end in pairs:
+            calculate_pto_hours(start, end)
+    return call
+
+
+def micro_build_balance_rows(rng):
+    from balances import build_balance_rows
+
+    rows = [
+        {"pto_type_id": n, "display_name": f"Type {n}", "hours_allotted": rng.choice((40.0, 80.0, None)),
+         "hours_used": rng.choice((0.0, 16.0, None))}
+        for n in range(12)
+    ]
+
+    def call():
+        for _ in range(MICRO_BATCH):
+            build_balance_rows(rows)
+    return call
+
+
+MICRO_SCENARIOS = {
+    "calculate_pto_hours": micro_calculate_pto_hours,
+    "build_balance_rows": micro_build_balance_rows,
+}
+
+
+# --- Measurement ---
+
+def summarize(samples, total_seconds, calls_per_sample=1):
+    """Throughput (calls/s) and latency percentiles (ms per call) for per-sample timings."""
+    per_call = sorted(s / calls_per_sample * 1000 for s in samples)
+    cuts = statistics.quantiles(per_call, n=100, method="inclusive") if len(per_call) > 1 else per_call * 99
+    return {
+        "calls": len(samples) * calls_per_sample,
+        "throughput": len(samples) * calls_per_sample / total_seconds if total_seconds else 0.0,
+        "p50_ms": cuts[49],
+        "p95_ms": cuts[94],
+        "p99_ms": cuts[98],
+    }
+
+
+def measure(fn, iterations, calls_per_sample=1):
+    for _ in range(WARMUP_CALLS):
+        fn()
+    samples = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return summarize(samples, time.perf_counter() - started, calls_per_sample)
+
+
+def run(db_path, iterations, only=None, seed=1):
+    import app as app_module
+
+    app = app_module.app
+    app.config.update(DATABASE=Path(db_path), TESTING=True, JOB_WORKERS=0)
+    client = app.test_client()
+    _expect(client.post("/login", data={"username": "admin", "password": "password"}), 302)
+
+    import db
+    conn = db.connect(db_path)
+    try:
+        ctx = Context(client, conn, random.Random(seed))
+    finally:
+        conn.close()
+
+    results = {}
+    for name, scenario in ROUTE_SCENARIOS.items():
+        if only and name not in only:
+            continue
+        results[name] = measure(lambda: scenario(ctx), iterations)
+        _print_result(name, results[name])
+    for name, factory in MICRO_SCENARIOS.items():
+        if only and name not in only:
+            continue
+        results[name] = measure(factory(random.Random(seed)), iterations, MICRO_BATCH)
+        _print_result(name, results[name])
+    return results
+
+
+def _print_result(name, result):
+    print(
+        f"{name:<24} {result['throughput']:>12.1f}/s  p50 {result['p50_ms']:>9.3f} ms  "
+        f"p95 {result['p95_ms']:>9.3f} ms  p99 {result['p99_ms']:>9.3f} ms",
+        flush=True,
+    )
+
+
+def compare(results, baseline, tolerance):
+    """Messages for scenarios that regressed against the baseline."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']:.3f} ms vs baseline {base['p95_ms']:.3f} ms")
+        if result["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {result['throughput']:.1f}/s vs baseline {base['throughput']:.1f}/s"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite.")
+    parser.add_argument("--scale", choices=datagen.SCALES, default="small")
+    parser.add_argument("--db", help="benchmark database (default: one per scale in the temp directory)")
+    parser.add_argument("--regenerate", action="store_true", help="rebuild the database even if it exists")
+    parser.add_argument("--iterations", type=int, default=200, help="timed calls per scenario")
+    parser.add_argument("--only", help="comma-separated scenario names")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="write this run to --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown, as a fraction")
+    parser.add_argument("--output", help="also write the results as JSON here")
+    args = parser.parse_args()
+
+    db_path = Path(args.db or Path(tempfile.gettempdir()) / f"pto_bench_{args.scale}.db")
+    if args.regenerate or not db_path.exists():
+        datagen.generate(db_path, args.scale, args.seed)
+    only = set(args.only.split(",")) if args.only else None
+
+    results = run(db_path, args.iterations, only, args.seed)
+    report = {"scale": args.scale, "iterations": args.iterations, "results": results}
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+    if args.baseline and args.save_baseline:
+        Path(args.baseline).write_text(json.dumps(report, indent=2))
+        print(f"Saved baseline to {args.baseline}.")
+    elif args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if baseline.get("scale") != args.scale:
+            print(f"Baseline is for scale {baseline.get('scale')!r}, not {args.scale!r}.", file=sys.stderr)
+            return 2
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}", file=sys.stderr)
+        if regressions:
+            return 1
+        print("No regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,122 @@
+"""
+Business-day counting for PTO hour calculations.
+
+Counting is closed-form: a range of N days is N // 7 whole weeks (five
+weekdays each) plus a remainder of at most six days, looked up in a table
+indexed by the weekday the range starts on. Cost is the same for a one-day
+request and a one-year leave.
+"""
+from datetime import date, datetime
+
+# PTO calculation constants
+HOURS_PER_DAY = 8
+SKIP_WEEKENDS = True
+
+# _REMAINDER_WEEKDAYS[w][r]: weekdays among the r consecutive days starting
+# on weekday w (Monday=0, ..., Sunday=6), for r in 0..6.
+_REMAINDER_WEEKDAYS = tuple(
+    tuple(sum(1 for offset in range(r) if (w + offset) % 7 < 5) for r in range(7))
+    for w in range(7)
+)
+
+
+def parse_date(value):
+    """Return a date for a date or YYYY-MM-DD string, or None if invalid."""
+    if isinstance(value, str):
+        try:
+            return datetime.strptime(value, "%Y-%m-%d").date()
+        except (ValueError, TypeError):
+            return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return None
+
+
+def count_business_days(start_date, end_date, skip_weekends=SKIP_WEEKENDS):
+    """Count days in [start_date, end_date], excluding weekends if asked."""
+    days = (end_date - start_date).days + 1
+    if days <= 0:
+        return 0
+    if not skip_weekends:
+        return days
+    weeks, remainder = divmod(days, 7)
+    return weeks * 5 + _REMAINDER_WEEKDAYS[start_date.weekday()][remainder]
+
+
+def count_business_days_batch(start_ordinals, end_ordinals, skip_weekends=SKIP_WEEKENDS):
+    """
+    Count business days for many ranges given as proleptic ordinals
+    (date.toordinal()), e.g. straight from a bulk query.
+
+    The per-range work is a handful of integer operations with no date
+    objects created; weekday is (ordinal - 1) % 7 with Monday=0.
+    """
+    table = _REMAINDER_WEEKDAYS
+    if not skip_weekends:
+        return [max(end - start + 1, 0) for start, end in zip(start_ordinals, end_ordinals)]
+    return [
+        (days // 7) * 5 + table[(start - 1) % 7][days % 7] if days > 0 else 0
+        for start, end in zip(start_ordinals, end_ordinals)
+        for days in (end - start + 1,)
+    ]
+
+
+def calculate_pto_hours(start_date, end_date, hours_per_day=HOURS_PER_DAY, skip_weekends=SKIP_WEEKENDS,
+                        holiday_calendar=None):
+    """
+    Calculate PTO hours between start_date and end_date (inclusive).
+
+    Args:
+        start_date: date object or string in YYYY-MM-DD format
+        end_date: date object or string in YYYY-MM-DD format
+        hours_per_day: hours per work day (default: HOURS_PER_DAY constant)
+        skip_weekends: if True, exclude Saturday/Sunday (default: SKIP_WEEKENDS constant)
+        holiday_calendar: optional HolidayCalendar whose holidays are not charged
+
+    Returns:
+        float: Total hours, or None if dates are invalid
+    """
+    start_date = parse_date(start_date)
+    end_date = parse_date(end_date)
+
+    # Validate date range
+    if start_date is None or end_date is None or end_date < start_date:
+        return None
+
+    if holiday_calendar is not None:
+        return holiday_calendar.count_working_days(start_date, end_date, skip_weekends) * hours_per_day
+    return count_business_days(start_date, end_date, skip_weekends) * hours_per_day
+
+
+def calculate_pto_hours_batch(date_pairs, hours_per_day=HOURS_PER_DAY, skip_weekends=SKIP_WEEKENDS,
+                              holiday_calendar=None):
+    """
+    calculate_pto_hours for many (start_date, end_date) pairs at once.
+
+    Returns a list aligned with date_pairs; invalid pairs give None, exactly
+    as calculate_pto_hours would.
+    """
+    if holiday_calendar is not None:
+        return [
+            calculate_pto_hours(start_date, end_date, hours_per_day, skip_weekends, holiday_calendar)
+            for start_date, end_date in date_pairs
+        ]
+
+    starts = []
+    ends = []
+    valid = []
+    for start_date, end_date in date_pairs:
+        start_date = parse_date(start_date)
+        end_date = parse_date(end_date)
+        ok = start_date is not None and end_date is not None and end_date >= start_date
+        valid.append(ok)
+        starts.append(start_date.toordinal() if ok else 0)
+        ends.append(end_date.toordinal() if ok else 0)
+
+    counts = count_business_days_batch(starts, ends, skip_weekends)
+    return [
+        count * hours_per_day if ok else None
+        for count, ok in zip(counts, valid)
+    ]
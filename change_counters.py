@@ -0,0 +1,77 @@
+"""
+Change counters stored in SQLite.
+
+A counter is a row in change_counters whose version is bumped by triggers
+every time the table it watches changes. Reading a counter is a single
+primary-key lookup, so in-process caches and indexes can cheaply ask
+"has anything changed since I was built?" - and because the counters live
+in the database, every worker process sees the same answer.
+"""
+
+
+def install(conn, name, table, events=("INSERT", "UPDATE", "DELETE"), update_columns=None):
+    """
+    Create counter `name` and the triggers that bump it on changes to `table`.
+
+    update_columns limits the UPDATE trigger to changes of those columns.
+    Safe to call again; existing counters and triggers are left alone.
+    """
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO change_counters (name, version, updated_at)
+        VALUES (?, 0, CURRENT_TIMESTAMP)
+        """,
+        (name,),
+    )
+    for event in events:
+        columns = ""
+        if event == "UPDATE" and update_columns:
+            columns = " OF " + ", ".join(update_columns)
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_counter_{name}_{event.lower()}
+            AFTER {event}{columns} ON {table}
+            BEGIN
+                UPDATE change_counters
+                SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE name = '{name}';
+            END
+            """
+        )
+
+
+def versions(conn, *names):
+    """Current versions of the given counters, as a tuple in the same order."""
+    rows = conn.execute(
+        f"SELECT name, version FROM change_counters WHERE name IN ({', '.join('?' * len(names))})",
+        names,
+    ).fetchall()
+    found = {row[0]: row[1] for row in rows}
+    return tuple(found.get(name, 0) for name in names)
+
+
+def bump(conn, name):
+    """Bump a counter by hand, for changes no trigger sees."""
+    conn.execute(
+        """
+        UPDATE change_counters
+        SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE name = ?
+        """,
+        (name,),
+    )
+
+
+def snapshot(conn, *names):
+    """(versions, latest updated_at) for the given counters in one query.
+
+    updated_at is SQLite's CURRENT_TIMESTAMP text (UTC), or None if none of
+    the counters exist.
+    """
+    rows = conn.execute(
+        f"SELECT name, version, updated_at FROM change_counters WHERE name IN ({', '.join('?' * len(names))})",
+        names,
+    ).fetchall()
+    found = {row[0]: row[1] for row in rows}
+    updated = [row[2] for row in rows if row[2]]
+    return tuple(found.get(name, 0) for name in names), max(updated) if updated else None
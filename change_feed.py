@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""
+Change feed: a log of PTO writes, streamed to open pages as server-sent
+events so they can update in place instead of being reloaded.
+
+Writes append to change_events inside their own transaction (entries.py
+for every entry insert and delete, employee_detail for balance edits, the
+admin PTO type routes and their background jobs), so an event exists
+exactly when its change commits. Event kinds and payloads:
+
+    entry_created, entry_deleted   the entry as the API shows it, plus the
+                                   days it covers and its balance row
+    balances_changed               {"employee_ids": [...], "balances": [...]}
+    pto_type_changed               the PTO type row
+    pto_type_deleted               {"id": ...}
+
+GET /events streams events after Last-Event-ID (or ?last_event_id=, or
+from now), filtered by ?employee_id=, ?month=YYYY-MM and ?kinds=. Each
+stream polls the table every FEED_POLL_INTERVAL seconds, so it sees writes
+from every worker process, and takes a pooled connection only for each
+poll. Streams end after FEED_STREAM_SECONDS; the browser reconnects with
+the id of the last event it saw. A client resuming from before the oldest
+kept event gets a "reset" event and should reload.
+
+Under asgi.py a stream is an async generator on the event loop (see
+`stream_async`) and holds no thread between polls. Served by threads
+(gunicorn's gthread workers, or the dev server), a stream holds its thread,
+so it long-polls instead: it ends as soon as it has sent events, and only
+FEED_MAX_STREAMS run at once per process. Beyond either process limit,
+/events answers 503 with a `retry:` of FEED_BUSY_RETRY_MS, and the page
+tries again after that.
+
+Events older than FEED_RETENTION_DAYS are removed by `prune`; run it from
+cron alongside the accrual runs.
+
+Usage:
+    python change_feed.py tail [--after ID] [--limit 50]
+    python change_feed.py prune [--days 7]
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from werkzeug.wsgi import ClosingIterator
+
+import async_db
+import db
+
+BASE_DIR = Path(__file__).resolve().parent
+DB_PATH = BASE_DIR / "pto_tracker.db"
+
+KINDS = ("entry_created", "entry_deleted", "balances_changed", "pto_type_changed", "pto_type_deleted")
+
+DEFAULT_CONFIG = {
+    "FEED_POLL_INTERVAL": 1.0,     # seconds between looks for new events
+    "FEED_HEARTBEAT": 15.0,        # seconds between keepalive comments on a quiet stream
+    "FEED_STREAM_SECONDS": 30.0,   # a stream ends after this; the browser reconnects
+    "FEED_RETRY_MS": 2000,         # reconnect delay sent to browsers
+    "FEED_MAX_STREAMS": 2,         # streams served by threads at once, per process
+    "FEED_MAX_ASYNC_STREAMS": 500,  # streams on the event loop at once, per process
+    "FEED_BUSY_RETRY_MS": 15000,   # reconnect delay sent with a 503 beyond those
+    "FEED_BATCH_SIZE": 500,        # events read per poll
+    "FEED_RETENTION_DAYS": 7,
+}
+
+
+# --- Recording (inside the caller's write) ---
+
+def record(conn, kind, payload, employee_id=None, start_date=None, end_date=None):
+    conn.execute(
+        """
+        INSERT INTO change_events (kind, employee_id, start_date, end_date, payload)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        (kind, employee_id, start_date, end_date, json.dumps(payload, separators=(",", ":"))),
+    )
+
+
+def record_entries(conn, kind, first_id, last_id=None):
+    """One event per entry with id in [first_id, last_id]; record deletions before the DELETE."""
+    conn.execute(
+        """
+        INSERT INTO change_events (kind, employee_id, start_date, end_date, payload)
+        SELECT ?, e.employee_id, e.start_date, e.end_date, json_object(
+            'id', e.id,
+            'employee_id', e.employee_id,
+            'first_name', emp.first_name,
+            'last_name', emp.last_name,
+            'pto_type_id', e.pto_type_id,
+            'pto_type', pt.display_name,
+            'start_date', e.start_date,
+            'end_date', e.end_date,
+            'hours', e.hours,
+            'notes', e.notes,
+            'created_by', m.full_name,
+            'created_at', e.created_at,
+            'days', json((
+                SELECT json_group_array(day)
+                FROM (SELECT day FROM pto_days WHERE entry_id = e.id ORDER BY day)
+            )),
+            'balance', json_object(
+                'pto_type_id', e.pto_type_id,
+                'display_name', pt.display_name,
+                'hours_allotted', b.hours_allotted,
+                'hours_used', b.hours_used
+            )
+        )
+        FROM pto_entries e
+        JOIN employees emp ON emp.id = e.employee_id
+        JOIN pto_types pt ON pt.id = e.pto_type_id
+        LEFT JOIN managers m ON m.id = e.created_by_manager_id
+        LEFT JOIN pto_balances b ON b.employee_id = e.employee_id AND b.pto_type_id = e.pto_type_id
+        WHERE e.id BETWEEN ? AND ?
+        ORDER BY e.id
+        """,
+        (kind, first_id, first_id if last_id is None else last_id),
+    )
+
+
+def record_balances(conn, employee_id):
+    """An employee's balances for every active type, as employee_detail shows them."""
+    conn.execute(
+        """
+        INSERT INTO change_events (kind, employee_id, payload)
+        SELECT 'balances_changed', :employee_id, json_object(
+            'employee_ids', json_array(:employee_id),
+            'balances', json((
+                SELECT json_group_array(json_object(
+                    'pto_type_id', t.id,
+                    'display_name', t.display_name,
+                    'hours_allotted', b.hours_allotted,
+                    'hours_used', COALESCE(b.hours_used, 0)
+                ))
+                FROM (SELECT id, display_name FROM pto_types WHERE is_active = 1 ORDER BY display_name) t
+                LEFT JOIN pto_balances b ON b.pto_type_id = t.id AND b.employee_id = :employee_id
+            ))
+        )
+        """,
+        {"employee_id": employee_id},
+    )
+
+
+def record_type_balances(conn, pto_type_id, employee_ids, hours_allotted, hours_used=None):
+    """Many employees' balances of one type set to hours_allotted (hours_used None: unchanged)."""
+    if not employee_ids:
+        return
+    row = conn.execute("SELECT display_name FROM pto_types WHERE id = ?", (pto_type_id,)).fetchone()
+    record(conn, "balances_changed", {
+        "employee_ids": list(employee_ids),
+        "balances": [{
+            "pto_type_id": pto_type_id,
+            "display_name": row[0] if row is not None else None,
+            "hours_allotted": hours_allotted,
+            "hours_used": hours_used,
+        }],
+    })
+
+
+def record_pto_type(conn, pto_type_id):
+    conn.execute(
+        """
+        INSERT INTO change_events (kind, payload)
+        SELECT 'pto_type_changed', json_object(
+            'id', id, 'code', code, 'display_name', display_name,
+            'is_active', is_active, 'default_hours', default_hours
+        )
+        FROM pto_types
+        WHERE id = ?
+        """,
+        (pto_type_id,),
+    )
+
+
+# --- Reading ---
+
+def latest_id(conn):
+    return conn.execute("SELECT COALESCE(MAX(id), 0) FROM change_events").fetchone()[0]
+
+
+def oldest_id(conn):
+    return conn.execute("SELECT MIN(id) FROM change_events").fetchone()[0]
+
+
+def events_after(conn, after_id, upto_id, employee_id=None, month_start=None, month_end=None,
+                 kinds=None, limit=DEFAULT_CONFIG["FEED_BATCH_SIZE"]):
+    """
+    Events in (after_id, upto_id] that match the filters, oldest first.
+
+    Events that aren't about one employee (or one date range) match every
+    employee (or month) filter.
+    """
+    kinds = tuple(kinds or KINDS)
+    return conn.execute(
+        f"""
+        SELECT id, kind, payload
+        FROM change_events
+        WHERE id > ? AND id <= ?
+            AND kind IN ({", ".join("?" * len(kinds))})
+            AND (? IS NULL OR employee_id IS NULL OR employee_id = ?)
+            AND (? IS NULL OR start_date IS NULL OR (start_date <= ? AND end_date >= ?))
+        ORDER BY id
+        LIMIT ?
+        """,
+        (after_id, upto_id, *kinds, employee_id, employee_id,
+         month_start, month_end, month_start, limit),
+    ).fetchall()
+
+
+def format_event(event_id, kind, data):
+    """One server-sent event; data is JSON text."""
+    return f"id: {event_id}\nevent: {kind}\ndata: {data}\n\n"
+
+
+# --- Streaming ---
+
+_open_streams = {"threaded": 0, "async": 0}
+_streams_lock = threading.Lock()
+
+
+class _Claim:
+    """One open stream's place in the per-process count."""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.held = True
+
+    def release(self):
+        with _streams_lock:
+            if self.held:
+                self.held = False
+                _open_streams[self.kind] -= 1
+
+
+def claim_stream(kind, limit):
+    """A _Claim on a stream of `kind` ("threaded" or "async"), or None if `limit` are open."""
+    with _streams_lock:
+        if _open_streams[kind] >= limit:
+            return None
+        _open_streams[kind] += 1
+        return _Claim(kind)
+
+
+def _reset_after_fork():
+    global _streams_lock
+    # The parent's streams aren't the child's to serve.
+    _streams_lock = threading.Lock()
+    for kind in _open_streams:
+        _open_streams[kind] = 0
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _with_conn(pool, fn, *args):
+    conn = pool.acquire()
+    try:
+        return fn(conn, *args)
+    finally:
+        pool.release(conn)
+
+
+def opening(conn, after_id, config):
+    """
+    The start of a stream: the reconnect delay, and a "reset" event if
+    events the client missed were pruned. Returns (text, ended).
+    """
+    text = f"retry: {int(config['FEED_RETRY_MS'])}\n\n"
+    oldest = oldest_id(conn)
+    if oldest is not None and after_id + 1 < oldest:
+        # Only a reload catches the client up.
+        return text + format_event(latest_id(conn), "reset", "{}"), True
+    return text, False
+
+
+def poll(conn, after_id, employee_id, month_start, month_end, kinds, batch_size):
+    """
+    One look for events after after_id. Returns (text to send, the id
+    to look after next time, events sent, whether more are waiting).
+    """
+    upto = latest_id(conn)
+    events = events_after(
+        conn, after_id, upto, employee_id, month_start, month_end, kinds, batch_size,
+    ) if upto > after_id else []
+    more = len(events) == batch_size
+    if more:
+        upto = events[-1]["id"]  # take the rest on the next pass
+    text = "".join(format_event(event["id"], event["kind"], event["payload"]) for event in events)
+    if upto > after_id and (not events or events[-1]["id"] < upto):
+        # An id with no data moves the browser's Last-Event-ID past
+        # events filtered out here, without dispatching anything.
+        text += f"id: {upto}\n\n"
+    return text, upto, len(events), more
+
+
+def stream(app, after_id, employee_id=None, month_start=None, month_end=None, kinds=None):
+    """
+    Generator of server-sent events for /events served by a thread: a long
+    poll that ends once it has sent events. Uses app's pool one poll at a
+    time, so it can run after the request context is gone.
+    """
+    config = app.config
+    pool = db.get_pool(app)
+    started = last_sent = time.monotonic()
+    text, ended = _with_conn(pool, opening, after_id, config)
+    yield text
+    if ended:
+        return
+
+    while True:
+        text, after_id, sent, more = _with_conn(
+            pool, poll, after_id, employee_id, month_start, month_end, kinds, config["FEED_BATCH_SIZE"],
+        )
+        if text:
+            yield text
+        if sent and not more:
+            return  # free the thread; the browser reconnects for the next ones
+        now = time.monotonic()
+        if sent:
+            last_sent = now
+        if now - last_sent >= config["FEED_HEARTBEAT"]:
+            yield ": keepalive\n\n"
+            last_sent = now
+        if now - started >= config["FEED_STREAM_SECONDS"]:
+            return
+        if not more:
+            time.sleep(config["FEED_POLL_INTERVAL"])
+
+
+async def stream_async(app, after_id, employee_id=None, month_start=None, month_end=None, kinds=None):
+    """
+    Async generator of server-sent events for /events under asgi.py. Each
+    poll runs on async_db's thread pool; between polls the stream only
+    waits on the event loop.
+    """
+    config = app.config
+    pool = db.get_pool(app)
+    executor = async_db.get_executor(app)
+    loop = asyncio.get_running_loop()
+
+    def read(fn, *args):
+        return loop.run_in_executor(executor, _with_conn, pool, fn, *args)
+
+    started = last_sent = time.monotonic()
+    text, ended = await read(opening, after_id, config)
+    yield text
+    if ended:
+        return
+
+    while True:
+        text, after_id, sent, more = await read(
+            poll, after_id, employee_id, month_start, month_end, kinds, config["FEED_BATCH_SIZE"],
+        )
+        if text:
+            yield text
+        now = time.monotonic()
+        if sent:
+            last_sent = now
+        if now - last_sent >= config["FEED_HEARTBEAT"]:
+            yield ": keepalive\n\n"
+            last_sent = now
+        if now - started >= config["FEED_STREAM_SECONDS"]:
+            return
+        if not more:
+            await asyncio.sleep(config["FEED_POLL_INTERVAL"])
+
+
+class _AsyncBody:
+    """An async stream body that releases its claim when it ends or is closed, started or not."""
+
+    def __init__(self, body, claim):
+        self.body = body
+        self.claim = claim
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self.body:
+                yield chunk
+        finally:
+            self.claim.release()
+
+    async def aclose(self):
+        try:
+            await self.body.aclose()
+        finally:
+            self.claim.release()
+
+
+def _released(body, claim):
+    try:
+        yield from body
+    finally:
+        claim.release()
+
+
+def open_stream(app, after_id, employee_id=None, month_start=None, month_end=None, kinds=None,
+                run_async=False):
+    """
+    The body for an /events response, or None if this process already has
+    its limit of streams of that sort. The claim on the limit goes when the
+    body ends or the server closes it.
+    """
+    args = (app, after_id, employee_id, month_start, month_end, kinds)
+    if run_async:
+        claim = claim_stream("async", app.config["FEED_MAX_ASYNC_STREAMS"])
+        return None if claim is None else _AsyncBody(stream_async(*args), claim)
+    claim = claim_stream("threaded", app.config["FEED_MAX_STREAMS"])
+    if claim is None:
+        return None
+    return ClosingIterator(_released(stream(*args), claim), claim.release)
+
+
+def prune(conn, days=DEFAULT_CONFIG["FEED_RETENTION_DAYS"]):
+    """Delete events older than `days`, always keeping the newest. Returns the number deleted."""
+
+    def delete(conn):
+        return conn.execute(
+            """
+            DELETE FROM change_events
+            WHERE created_at < datetime('now', ?)
+                AND id < (SELECT MAX(id) FROM change_events)
+            """,
+            (f"-{int(days)} days",),
+        ).rowcount
+
+    return db.run_write(conn, delete)
+
+
+def init_app(app):
+    for key, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(key, value)
+
+
+# --- CLI ---
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and prune the change feed.")
+    parser.add_argument("--db", default=str(DB_PATH), help="database path")
+    commands = parser.add_subparsers(dest="command", required=True)
+    tail = commands.add_parser("tail", help="print recent events")
+    tail.add_argument("--after", type=int, help="events after this id (default: the last --limit)")
+    tail.add_argument("--limit", type=int, default=50)
+    prune_cmd = commands.add_parser("prune", help="delete old events")
+    prune_cmd.add_argument("--days", type=int, default=DEFAULT_CONFIG["FEED_RETENTION_DAYS"])
+    args = parser.parse_args()
+
+    conn = db.connect(args.db)
+    try:
+        if args.command == "tail":
+            latest = latest_id(conn)
+            after = args.after if args.after is not None else max(latest - args.limit, 0)
+            for event in events_after(conn, after, latest, limit=args.limit):
+                print(f"{event['id']:>8}  {event['kind']:<18} {event['payload']}")
+        elif args.command == "prune":
+            print(f"Deleted {prune(conn, args.days)} event(s).")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
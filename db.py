@@ -0,0 +1,378 @@
+"""
+SQLite connection management for the PTO tracker.
+
+Connections are kept in a bounded pool and handed out one per app context:
+the first call to get_db_connection() in a request checks a connection out,
+and teardown_appcontext returns it. Pragmas are applied once, when a
+connection is opened, instead of on every request.
+
+The database runs in WAL mode so readers never wait behind a writer. Writes
+go through run_write(), which takes the write lock up front and retries with
+backoff if another writer still holds it after busy_timeout.
+
+Read-only requests can be served from a read replica instead (see
+read_replica.py); get_db_connection() picks the pool per request.
+"""
+import logging
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+
+from flask import current_app, g, has_app_context, has_request_context, session
+
+
+logger = logging.getLogger(__name__)
+
+
+# Defaults for app.config; override before the first request.
+DEFAULT_CONFIG = {
+    "DB_POOL_SIZE": 8,             # max connections open at once
+    "DB_POOL_TIMEOUT": 10.0,       # seconds to wait for a free connection
+    "DB_POOL_IDLE_TIMEOUT": 300.0,  # close connections idle longer than this
+    "DB_POOL_HEALTH_CHECK_INTERVAL": 30.0,  # ping idle connections before reuse
+
+    # Storage pragmas, applied to every new connection.
+    "SQLITE_JOURNAL_MODE": "WAL",
+    "SQLITE_SYNCHRONOUS": "NORMAL",     # safe with WAL; FULL fsyncs every commit
+    "SQLITE_CACHE_SIZE": -16000,        # negative = KiB, so ~16 MB per connection
+    "SQLITE_MMAP_SIZE": 128 * 1024 * 1024,
+    "SQLITE_TEMP_STORE": "MEMORY",
+    "SQLITE_BUSY_TIMEOUT_MS": 5000,
+    "SQLITE_WAL_AUTOCHECKPOINT": 1000,  # pages; the background checkpoint keeps this rare
+
+    # Background WAL checkpoint; 0 disables the thread.
+    "SQLITE_CHECKPOINT_INTERVAL": 60.0,
+
+    # sqlite3.Connection subclass for pooled connections (instrumentation
+    # sets one); None for the plain class.
+    "DB_CONNECTION_FACTORY": None,
+
+    # Retries for write transactions that still hit "database is locked".
+    "DB_WRITE_RETRIES": 5,
+    "DB_WRITE_RETRY_BACKOFF": 0.05,     # seconds, doubled on each attempt
+}
+
+# Session key holding the time of the session's last committed write.
+LAST_WRITE_SESSION_KEY = "_db_last_write"
+
+_PRAGMA_CHOICES = {
+    "SQLITE_JOURNAL_MODE": ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"),
+    "SQLITE_SYNCHRONOUS": ("OFF", "NORMAL", "FULL", "EXTRA"),
+    "SQLITE_TEMP_STORE": ("DEFAULT", "FILE", "MEMORY"),
+}
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the pool timeout."""
+
+
+def storage_pragmas(config):
+    """Build the PRAGMA statements for a connection from app config."""
+    settings = dict(DEFAULT_CONFIG)
+    settings.update({key: config[key] for key in DEFAULT_CONFIG if key in config})
+
+    for key, choices in _PRAGMA_CHOICES.items():
+        value = str(settings[key]).upper()
+        if value not in choices:
+            raise ValueError(f"{key} must be one of {', '.join(choices)}; got {settings[key]!r}.")
+        settings[key] = value
+
+    return [
+        f"PRAGMA busy_timeout = {int(settings['SQLITE_BUSY_TIMEOUT_MS'])};",
+        f"PRAGMA journal_mode = {settings['SQLITE_JOURNAL_MODE']};",
+        f"PRAGMA synchronous = {settings['SQLITE_SYNCHRONOUS']};",
+        f"PRAGMA cache_size = {int(settings['SQLITE_CACHE_SIZE'])};",
+        f"PRAGMA mmap_size = {int(settings['SQLITE_MMAP_SIZE'])};",
+        f"PRAGMA temp_store = {settings['SQLITE_TEMP_STORE']};",
+        f"PRAGMA wal_autocheckpoint = {int(settings['SQLITE_WAL_AUTOCHECKPOINT'])};",
+    ]
+
+
+def connect(db_path, pragmas=None, factory=None, uri=False):
+    """Open a configured connection outside of the pool (scripts, CLIs)."""
+    conn = sqlite3.connect(
+        db_path, check_same_thread=False, factory=factory or sqlite3.Connection, uri=uri
+    )
+    conn.execute("PRAGMA foreign_keys = ON;")
+    for pragma in storage_pragmas({}) if pragmas is None else pragmas:
+        conn.execute(pragma)
+    conn.row_factory = sqlite3.Row  # access columns by name
+    return conn
+
+
+def _is_lock_error(exc):
+    message = str(exc).lower()
+    return "database is locked" in message or "database is busy" in message
+
+
+def run_write(conn, work, retries=None, backoff=None):
+    """
+    Run work(conn) inside a write transaction and commit it.
+
+    The transaction starts with BEGIN IMMEDIATE so the write lock is taken
+    before any statement runs; busy_timeout then covers the wait. If the lock
+    is still held after that, the whole transaction is rolled back and
+    retried with exponential backoff. work must therefore only touch the
+    database - do side effects such as flash() after run_write returns, and
+    register in-process state it changes with on_rollback().
+
+    Returns whatever work returns.
+    """
+    if has_app_context():
+        config = current_app.config
+        retries = config["DB_WRITE_RETRIES"] if retries is None else retries
+        backoff = config["DB_WRITE_RETRY_BACKOFF"] if backoff is None else backoff
+    else:
+        retries = DEFAULT_CONFIG["DB_WRITE_RETRIES"] if retries is None else retries
+        backoff = DEFAULT_CONFIG["DB_WRITE_RETRY_BACKOFF"] if backoff is None else backoff
+
+    attempt = 0
+    while True:
+        if conn.in_transaction:
+            # Earlier statements in this request opened an implicit
+            # transaction; finish it so ours starts clean.
+            conn.commit()
+        _transaction.rollback_callbacks = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            result = work(conn)
+            conn.commit()
+            _end_transaction(rolled_back=False)
+            _note_write()
+            return result
+        except sqlite3.OperationalError as exc:
+            if conn.in_transaction:
+                conn.rollback()
+            _end_transaction(rolled_back=True)
+            if not _is_lock_error(exc) or attempt >= retries:
+                raise
+            delay = backoff * (2 ** attempt) * (1 + random.random())
+            logger.warning("Write transaction hit a lock (attempt %d); retrying in %.3fs", attempt + 1, delay)
+            time.sleep(delay)
+            attempt += 1
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            _end_transaction(rolled_back=True)
+            raise
+
+
+# Per thread: callbacks for the run_write transaction in progress to call
+# if it rolls back (None outside run_write).
+_transaction = threading.local()
+
+
+def on_rollback(callback):
+    """
+    Call callback() if the run_write transaction this thread is in rolls
+    back, for in-process state updated alongside the write. Outside
+    run_write it is never called.
+    """
+    callbacks = getattr(_transaction, "rollback_callbacks", None)
+    if callbacks is not None and callback not in callbacks:
+        callbacks.append(callback)
+
+
+def _end_transaction(rolled_back):
+    callbacks = getattr(_transaction, "rollback_callbacks", None) or []
+    _transaction.rollback_callbacks = None
+    if rolled_back:
+        for callback in callbacks:
+            callback()
+
+
+def _note_write():
+    """Remember when this session last wrote, so read replicas can send its reads to the primary."""
+    if has_request_context() and current_app.config.get("DB_READ_REPLICA"):
+        session[LAST_WRITE_SESSION_KEY] = time.time()
+
+
+class Checkpointer(threading.Thread):
+    """Daemon thread that runs a passive WAL checkpoint on an interval."""
+
+    def __init__(self, db_path, interval, pragmas=None):
+        super().__init__(name="sqlite-checkpointer", daemon=True)
+        self.db_path = db_path
+        self.interval = interval
+        self.pragmas = pragmas
+        self._stop_event = threading.Event()
+
+    def run(self):
+        conn = connect(self.db_path, self.pragmas)
+        try:
+            while not self._stop_event.wait(self.interval):
+                try:
+                    # PASSIVE never blocks readers or writers; whatever it
+                    # can't copy back now is picked up on the next pass.
+                    conn.execute("PRAGMA wal_checkpoint(PASSIVE);").fetchone()
+                except sqlite3.Error:
+                    logger.exception("WAL checkpoint failed")
+        finally:
+            conn.close()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class ConnectionPool:
+    """A bounded pool of SQLite connections to a single database file."""
+
+    def __init__(self, db_path, size=8, timeout=10.0, idle_timeout=300.0,
+                 health_check_interval=30.0, pragmas=None, factory=None, uri=False):
+        self.db_path = db_path
+        self.pragmas = pragmas
+        self.factory = factory
+        self.uri = uri
+        self.size = size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = queue.LifoQueue()  # (conn, last_used) - reuse the warmest first
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(
+                f"No database connection available after {self.timeout:.1f}s "
+                f"(pool size {self.size})."
+            )
+        try:
+            while True:
+                try:
+                    conn, last_used = self._idle.get_nowait()
+                except queue.Empty:
+                    return connect(self.db_path, self.pragmas, self.factory, self.uri)
+
+                idle_for = time.monotonic() - last_used
+                if self.idle_timeout and idle_for > self.idle_timeout:
+                    conn.close()
+                    continue
+                if idle_for > self.health_check_interval and not self._is_healthy(conn):
+                    conn.close()
+                    continue
+                return conn
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                # A handler returned without committing; don't leak its writes
+                # (or its locks) into the next request.
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+        else:
+            with self._lock:
+                if self._closed:
+                    conn.close()
+                else:
+                    self._idle.put((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        with self._lock:
+            self._closed = True
+            while True:
+                try:
+                    conn, _ = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                conn.close()
+
+    @staticmethod
+    def _is_healthy(conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+
+_pool_init_lock = threading.Lock()
+
+
+def get_pool(app=None):
+    app = app or current_app
+    pool = app.extensions.get("sqlite_pool")
+    if pool is None:
+        with _pool_init_lock:
+            pool = app.extensions.get("sqlite_pool")
+            if pool is None:
+                config = app.config
+                pool = ConnectionPool(
+                    config["DATABASE"],
+                    size=config["DB_POOL_SIZE"],
+                    timeout=config["DB_POOL_TIMEOUT"],
+                    idle_timeout=config["DB_POOL_IDLE_TIMEOUT"],
+                    health_check_interval=config["DB_POOL_HEALTH_CHECK_INTERVAL"],
+                    pragmas=storage_pragmas(config),
+                    factory=config["DB_CONNECTION_FACTORY"],
+                )
+                app.extensions["sqlite_pool"] = pool
+
+                if config["SQLITE_CHECKPOINT_INTERVAL"] and config["SQLITE_JOURNAL_MODE"].upper() == "WAL":
+                    checkpointer = Checkpointer(
+                        config["DATABASE"], config["SQLITE_CHECKPOINT_INTERVAL"], pool.pragmas
+                    )
+                    checkpointer.start()
+                    app.extensions["sqlite_checkpointer"] = checkpointer
+    return pool
+
+
+def request_pool():
+    """
+    The pool this app context's connections come from: a read replica's
+    for read-only requests that read_replica routes there, else the app's.
+    """
+    if "db_pool" not in g:
+        router = current_app.extensions.get("sqlite_read_router")
+        pool = router() if router is not None and has_request_context() else None
+        g.db_pool = pool or get_pool()
+    return g.db_pool
+
+
+def get_db_connection():
+    """Return this app context's connection, checking one out on first use."""
+    if "db" not in g:
+        g.db = request_pool().acquire()
+    return g.db
+
+
+def release_db_connection(exc=None):
+    conn = g.pop("db", None)
+    pool = g.pop("db_pool", None)
+    if conn is not None:
+        (pool or get_pool()).release(conn)
+
+
+# Pools and checkpointers inherited across a fork. Their connections belong
+# to the parent: closing them in the child (even by garbage collection)
+# would drop the parent's SQLite locks, so they are kept here and never used.
+_inherited = []
+
+
+def _reset_after_fork(app):
+    """In a forked child: forget the parent's pool so the first request opens fresh connections."""
+    global _pool_init_lock
+    _pool_init_lock = threading.Lock()
+    for key in ("sqlite_pool", "sqlite_checkpointer"):
+        inherited = app.extensions.pop(key, None)
+        if inherited is not None:
+            _inherited.append(inherited)
+
+
+def init_app(app):
+    for key, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(key, value)
+    app.teardown_appcontext(release_db_connection)
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=lambda: _reset_after_fork(app))
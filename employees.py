@@ -0,0 +1,123 @@
+"""
+Employee directory queries: keyset-paginated listing and name/email search.
+
+Pages are ordered by (last_name, first_name, id) and addressed by an opaque
+cursor holding that key for the first or last row shown, so fetching page
+N costs the same as page 1 (no OFFSET scan). The
+idx_employees_status_name index serves both the ordering and the seek.
+"""
+import base64
+import json
+
+PAGE_SIZES = (25, 50, 100)
+DEFAULT_PAGE_SIZE = 50
+TYPEAHEAD_LIMIT = 10
+
+EMPLOYEE_COLUMNS = "id, first_name, last_name, employment_type, phone, email, team, hire_date, status"
+
+
+def encode_cursor(row):
+    key = [row["last_name"], row["first_name"], row["id"]]
+    return base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Return (last_name, first_name, id) from a cursor, or None if malformed."""
+    try:
+        last_name, first_name, employee_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(last_name, str) or not isinstance(first_name, str) or not isinstance(employee_id, int):
+        return None
+    return last_name, first_name, employee_id
+
+
+def parse_page_size(raw, default=DEFAULT_PAGE_SIZE):
+    try:
+        size = int(raw)
+    except (TypeError, ValueError):
+        return default
+    return size if size in PAGE_SIZES else default
+
+
+def _search_clause(search):
+    """SQL and params for a case-insensitive prefix match on name or email."""
+    if not search:
+        return "", []
+    escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    pattern = escaped + "%"
+    sql = """
+        AND (
+            first_name LIKE ? ESCAPE '\\'
+            OR last_name LIKE ? ESCAPE '\\'
+            OR email LIKE ? ESCAPE '\\'
+            OR first_name || ' ' || last_name LIKE ? ESCAPE '\\'
+        )
+    """
+    return sql, [pattern, pattern, pattern, pattern]
+
+
+def fetch_employee_page(conn, search="", after=None, before=None, page_size=DEFAULT_PAGE_SIZE,
+                        columns=EMPLOYEE_COLUMNS):
+    """
+    Fetch one page of active employees.
+
+    after/before are cursors from a previous page's next_cursor/prev_cursor.
+    Returns a dict with the rows and the cursors for the neighbouring pages
+    (None where there is no such page).
+    """
+    search_sql, params = _search_clause(search)
+    key = decode_cursor(after or before) if (after or before) else None
+
+    keyset_sql = ""
+    if key is not None:
+        keyset_sql = "AND (last_name, first_name, id) > (?, ?, ?)" if after else \
+                     "AND (last_name, first_name, id) < (?, ?, ?)"
+        params.extend(key)
+    backwards = key is not None and not after
+    order = "DESC" if backwards else "ASC"
+
+    # One extra row tells us whether another page exists in this direction.
+    rows = conn.execute(
+        f"""
+        SELECT {columns}
+        FROM employees
+        WHERE status = 'active'
+            {search_sql}
+            {keyset_sql}
+        ORDER BY last_name {order}, first_name {order}, id {order}
+        LIMIT ?
+        """,
+        (*params, page_size + 1),
+    ).fetchall()
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+
+    if backwards:
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, key is not None
+
+    return {
+        "employees": rows,
+        "next_cursor": encode_cursor(rows[-1]) if rows and has_next else None,
+        "prev_cursor": encode_cursor(rows[0]) if rows and has_prev else None,
+    }
+
+
+def search_employees(conn, search, limit=TYPEAHEAD_LIMIT):
+    """Typeahead matches: the first few active employees by name order."""
+    page = fetch_employee_page(
+        conn, search=search, page_size=limit, columns="id, first_name, last_name, email"
+    )
+    return [
+        {
+            "id": row["id"],
+            "name": f"{row['first_name']} {row['last_name']}",
+            "email": row["email"] or "",
+        }
+        for row in page["employees"]
+    ]
@@ -0,0 +1,221 @@
+"""
+Writes to pto_entries.
+
+Every insert and delete of a PTO entry goes through here so the balance,
+the per-day occupancy rows and anything else derived from entries stay in
+step with it. These functions only execute statements; call them inside
+db.run_write() so they share the caller's transaction.
+"""
+from collections import defaultdict
+
+import balance_cache
+import change_feed
+import interval_index
+import ledger
+import occupancy
+import validation
+
+
+class BatchRejected(Exception):
+    """An all-or-nothing batch had items that couldn't be booked."""
+
+    def __init__(self, rejected):
+        super().__init__(f"{len(rejected)} item(s) rejected")
+        self.rejected = rejected
+
+
+class BookingConflict(Exception):
+    """A new entry overlaps existing PTO or breaks the people-out limit."""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def check_conflicts(conn, employee_id, start_date, end_date, max_people_out=None,
+                    allow_overlap=False):
+    """Raise BookingConflict if the entry can't be booked; call inside the write."""
+    errors = interval_index.find_conflicts(
+        conn, employee_id, start_date, end_date, max_people_out, allow_overlap
+    )
+    if errors:
+        raise BookingConflict(errors)
+
+
+def insert_entry(conn, employee_id, pto_type_id, start_date, end_date, hours, notes,
+                 manager_id, holidays=None):
+    """Insert an entry, charge its hours to the balance and record its days."""
+    cur = conn.execute(
+        """
+        INSERT INTO pto_entries
+            (employee_id, pto_type_id, start_date, end_date, hours, notes, created_by_manager_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        (employee_id, pto_type_id, start_date, end_date, hours, notes, manager_id),
+    )
+    entry_id = cur.lastrowid
+
+    # Update used hours
+    with balance_cache.invalidating(conn, [employee_id]):
+        conn.execute(
+            """
+            UPDATE pto_balances
+            SET hours_used = hours_used + ?
+            WHERE employee_id = ? AND pto_type_id = ?
+            """,
+            (hours, employee_id, pto_type_id),
+        )
+    ledger.post(conn, [
+        {
+            "employee_id": employee_id, "pto_type_id": pto_type_id, "kind": "usage",
+            "used_delta": hours, "effective_date": start_date, "entry_id": entry_id,
+            "manager_id": manager_id,
+        }
+    ])
+
+    occupancy.sync_entry(conn, entry_id, holidays)
+    # The event first: the index notes the feed position it has reached.
+    change_feed.record_entries(conn, "entry_created", entry_id)
+    interval_index.record_insert(conn, entry_id, employee_id, start_date, end_date)
+    return entry_id
+
+
+def delete_entry(conn, entry_id):
+    """Delete an entry and give its hours back. Returns the deleted row or None."""
+    entry = conn.execute(
+        "SELECT id, employee_id, pto_type_id, start_date, end_date, hours FROM pto_entries WHERE id = ?",
+        (entry_id,),
+    ).fetchone()
+    if entry is None:
+        return None
+
+    if entry["hours"]:
+        with balance_cache.invalidating(conn, [entry["employee_id"]]):
+            conn.execute(
+                """
+                UPDATE pto_balances
+                SET hours_used = MAX(hours_used - ?, 0)
+                WHERE employee_id = ? AND pto_type_id = ?
+                """,
+                (entry["hours"], entry["employee_id"], entry["pto_type_id"]),
+            )
+        ledger.post(conn, [
+            {
+                "employee_id": entry["employee_id"], "pto_type_id": entry["pto_type_id"],
+                "kind": "reversal", "used_delta": -entry["hours"],
+                "effective_date": entry["start_date"], "entry_id": entry_id,
+            }
+        ])
+
+    # Recorded first, while its days and names can still be read.
+    change_feed.record_entries(conn, "entry_deleted", entry_id)
+    # pto_days rows go with it (ON DELETE CASCADE).
+    conn.execute("DELETE FROM pto_entries WHERE id = ?", (entry_id,))
+    interval_index.record_delete(conn, entry_id)
+    return entry
+
+
+def insert_entries(conn, candidates, manager_id, holidays, max_people_out=None, allow_overlap=False,
+                   atomic=False):
+    """
+    Insert many validated entries at once, inside the caller's write.
+
+    candidates are dicts with key, employee_id, pto_type_id, start_date,
+    end_date, hours and notes, where key identifies the item in the results.
+    Balances for the whole batch come from one query, and each entry is
+    checked against them and for conflicts, as in the single-entry path,
+    taking earlier entries in the batch into account. Accepted entries,
+    their balance updates and occupancy rows are written with executemany.
+
+    Returns (accepted candidates, with "id" set; [(key, messages)] rejected).
+    With atomic=True any rejection raises BatchRejected before anything is
+    written, so the caller's transaction rolls back.
+    """
+    # Remaining hours for every (employee, type) in the batch, in one query.
+    keys = sorted({(c["employee_id"], c["pto_type_id"]) for c in candidates})
+    remaining = {}
+    for start in range(0, len(keys), 400):
+        batch = keys[start:start + 400]
+        for row in conn.execute(
+            f"""
+            WITH wanted (employee_id, pto_type_id) AS (VALUES {', '.join(['(?, ?)'] * len(batch))})
+            SELECT b.employee_id, b.pto_type_id, b.hours_allotted - b.hours_used AS remaining
+            FROM pto_balances b
+            JOIN wanted w ON w.employee_id = b.employee_id AND w.pto_type_id = b.pto_type_id
+            """,
+            [value for key in batch for value in key],
+        ):
+            remaining[(row["employee_id"], row["pto_type_id"])] = row["remaining"]
+
+    next_id = conn.execute(
+        """
+        SELECT MAX(
+            COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'pto_entries'), 0),
+            COALESCE((SELECT MAX(id) FROM pto_entries), 0)
+        ) + 1
+        """
+    ).fetchone()[0]
+
+    accepted = []
+    rejected = []
+    used = defaultdict(float)
+    with interval_index.bulk_booking(conn, max_people_out, allow_overlap) as booking:
+        for c in candidates:
+            key = (c["employee_id"], c["pto_type_id"])
+            balance = remaining.get(key)
+            error = validation.balance_error(
+                None if balance is None else balance - used[key], c["hours"]
+            )
+            if error:
+                rejected.append((c["key"], [error]))
+                continue
+            conflicts = booking.try_add(next_id, c["employee_id"], c["start_date"], c["end_date"])
+            if conflicts:
+                rejected.append((c["key"], conflicts))
+                continue
+            c["id"] = next_id
+            next_id += 1
+            used[key] += c["hours"]
+            accepted.append(c)
+
+        # Raised inside bulk_booking so the index is left to be rebuilt.
+        if atomic and rejected:
+            raise BatchRejected(rejected)
+
+        if accepted:
+            conn.executemany(
+                """
+                INSERT INTO pto_entries
+                    (id, employee_id, pto_type_id, start_date, end_date, hours, notes, created_by_manager_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (c["id"], c["employee_id"], c["pto_type_id"], c["start_date"], c["end_date"],
+                     c["hours"], c["notes"], manager_id)
+                    for c in accepted
+                ],
+            )
+            with balance_cache.invalidating(conn, {employee_id for employee_id, _ in used}):
+                conn.executemany(
+                    """
+                    UPDATE pto_balances
+                    SET hours_used = hours_used + ?
+                    WHERE employee_id = ? AND pto_type_id = ?
+                    """,
+                    [(hours, employee_id, pto_type_id) for (employee_id, pto_type_id), hours in used.items()],
+                )
+            ledger.post(conn, [
+                {
+                    "employee_id": c["employee_id"], "pto_type_id": c["pto_type_id"], "kind": "usage",
+                    "used_delta": c["hours"], "effective_date": c["start_date"], "entry_id": c["id"],
+                    "manager_id": manager_id,
+                }
+                for c in accepted
+            ])
+            conn.executemany(
+                "INSERT INTO pto_days (entry_id, employee_id, day, hours) VALUES (?, ?, ?, ?)",
+                [row for c in accepted for row in occupancy.day_rows(c, holidays)],
+            )
+            # Accepted ids were handed out consecutively.
+            change_feed.record_entries(conn, "entry_created", accepted[0]["id"], accepted[-1]["id"])
+    return accepted, rejected
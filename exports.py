@@ -0,0 +1,231 @@
+"""
+Streaming CSV and XLSX exports of PTO entries and balances.
+
+Rows are read a page at a time with keyset queries and encoded as they
+arrive, so a response starts immediately and memory stays flat however
+many rows are exported. XLSX is written without extra dependencies: a
+single worksheet with inline strings, zipped on the fly. Text that a
+spreadsheet would run as a formula is prefixed with an apostrophe.
+"""
+import csv
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+EXPORT_PAGE_SIZE = 500
+FORMATS = ("csv", "xlsx")
+MIMETYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+ENTRY_HEADER = (
+    "Entry ID", "Employee ID", "First Name", "Last Name", "Team", "PTO Type Code", "PTO Type",
+    "Start Date", "End Date", "Hours", "Notes", "Created At",
+)
+BALANCE_HEADER = (
+    "Employee ID", "First Name", "Last Name", "Team", "Status", "PTO Type Code", "PTO Type",
+    "Hours Allotted", "Hours Used", "Hours Remaining",
+)
+
+
+# --- Paged reads ---
+
+def iter_entries(conn, start_date=None, end_date=None, pto_type_id=None, employee_id=None,
+                 page_size=EXPORT_PAGE_SIZE):
+    """
+    Yield export rows for entries overlapping [start_date, end_date] (either
+    end may be None), in (start_date, id) order.
+    """
+    filters = []
+    params = []
+    if start_date:
+        filters.append("AND e.end_date >= ?")
+        params.append(start_date)
+    if end_date:
+        filters.append("AND e.start_date <= ?")
+        params.append(end_date)
+    if pto_type_id is not None:
+        filters.append("AND e.pto_type_id = ?")
+        params.append(pto_type_id)
+    if employee_id is not None:
+        filters.append("AND e.employee_id = ?")
+        params.append(employee_id)
+    filter_sql = "\n            ".join(filters)
+
+    key = ("", 0)
+    while True:
+        rows = conn.execute(
+            f"""
+            SELECT
+                e.id, e.employee_id, emp.first_name, emp.last_name, emp.team,
+                pt.code, pt.display_name, e.start_date, e.end_date, e.hours,
+                e.notes, e.created_at
+            FROM pto_entries e
+            JOIN employees emp ON emp.id = e.employee_id
+            JOIN pto_types pt ON pt.id = e.pto_type_id
+            WHERE (e.start_date, e.id) > (?, ?)
+            {filter_sql}
+            ORDER BY e.start_date, e.id
+            LIMIT ?
+            """,
+            (*key, *params, page_size),
+        ).fetchall()
+        for row in rows:
+            yield tuple(row)
+        if len(rows) < page_size:
+            return
+        key = (rows[-1]["start_date"], rows[-1]["id"])
+
+
+def iter_balances(conn, page_size=EXPORT_PAGE_SIZE):
+    """Yield export rows for every balance, ordered by employee name then type."""
+    key = ("", "", 0, 0)
+    while True:
+        rows = conn.execute(
+            """
+            SELECT
+                emp.id, emp.first_name, emp.last_name, emp.team, emp.status,
+                pt.code, pt.display_name, b.hours_allotted, b.hours_used,
+                b.pto_type_id
+            FROM pto_balances b
+            JOIN employees emp ON emp.id = b.employee_id
+            JOIN pto_types pt ON pt.id = b.pto_type_id
+            WHERE (emp.last_name, emp.first_name, emp.id, b.pto_type_id) > (?, ?, ?, ?)
+            ORDER BY emp.last_name, emp.first_name, emp.id, b.pto_type_id
+            LIMIT ?
+            """,
+            (*key, page_size),
+        ).fetchall()
+        for row in rows:
+            allotted = row["hours_allotted"] or 0.0
+            used = row["hours_used"] or 0.0
+            yield (*tuple(row)[:9], allotted - used)
+        if len(rows) < page_size:
+            return
+        last = rows[-1]
+        key = (last["last_name"], last["first_name"], last["id"], last["pto_type_id"])
+
+
+# --- Encoders ---
+
+# A text cell starting with one of these is read as a formula by
+# spreadsheet apps; names and notes come from users, so such cells get a
+# leading apostrophe (OWASP's advice for CSV injection).
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _text_cell(value):
+    """value as written to a cell: None as "", numbers unchanged, formula-like text escaped."""
+    if value is None:
+        return ""
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def stream_csv(header, rows, rows_per_chunk=EXPORT_PAGE_SIZE):
+    """Yield CSV text a few hundred rows at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow([_text_cell(value) for value in row])
+        if count % rows_per_chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+class _ChunkSink:
+    """Write-only, unseekable file for zipfile; chunks are drained by the caller."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+# Characters XML 1.0 doesn't allow, even escaped.
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+</Types>"""
+
+_ROOT_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+
+_WORKBOOK = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>
+</workbook>"""
+
+_WORKBOOK_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+</Relationships>"""
+
+_SHEET_START = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>"""
+
+_SHEET_END = "</sheetData></worksheet>"
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return "<c/>"
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c t="n"><v>{value!r}</v></c>'
+    text = escape(_XML_INVALID.sub("", str(_text_cell(value))))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return "<row>" + "".join(_xlsx_cell(v) for v in values) + "</row>"
+
+
+def stream_xlsx(sheet_name, header, rows, rows_per_chunk=EXPORT_PAGE_SIZE):
+    """Yield the bytes of a one-sheet workbook as the rows are encoded."""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as workbook:
+        workbook.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        workbook.writestr("_rels/.rels", _ROOT_RELS)
+        workbook.writestr("xl/workbook.xml", _WORKBOOK.format(name=escape(sheet_name, {'"': "&quot;"})))
+        workbook.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        yield sink.drain()
+
+        # force_zip64: the sheet's size isn't known up front.
+        with workbook.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(_SHEET_START.encode("utf-8"))
+            sheet.write(_xlsx_row(header).encode("utf-8"))
+            for count, row in enumerate(rows, start=1):
+                sheet.write(_xlsx_row(row).encode("utf-8"))
+                if count % rows_per_chunk == 0:
+                    yield sink.drain()
+            sheet.write(_SHEET_END.encode("utf-8"))
+    yield sink.drain()
+
+
+def stream(fmt, sheet_name, header, rows):
+    if fmt == "xlsx":
+        return stream_xlsx(sheet_name, header, rows)
+    return stream_csv(header, rows)
@@ -0,0 +1,162 @@
+"""
+Rendered-fragment caching for heavy templates, and Jinja's bytecode cache.
+
+A template marks an expensive block with the fragment's name and whatever
+else its output depends on:
+
+    {% cache "pto_history", employee['id'], is_admin %}
+        ... table ...
+    {% endcache %}
+
+FRAGMENTS lists the change counters each fragment reads from. The cached
+HTML is keyed on the arguments plus the current versions of those
+counters, so any write to the tables behind it (from any process) makes
+the next render miss. A fragment must only depend on its arguments and on
+those tables; anything else it shows has to be one of the arguments.
+
+Views can pass data that only the fragment uses through lazy(), so a hit
+skips the query as well as the rendering.
+
+Compiled templates are also written to disk (FileSystemBytecodeCache), so
+a fresh worker loads bytecode instead of parsing every template again.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+import change_counters
+
+FRAGMENTS = {
+    "pto_history": ("pto_entries", "pto_types", "managers"),
+    "calendar_entries": ("pto_entries", "pto_types", "employees"),
+}
+
+DEFAULT_CONFIG = {
+    "FRAGMENT_CACHE_SIZE": 512,        # fragments kept per process
+    "TEMPLATE_BYTECODE_CACHE": True,
+    "TEMPLATE_BYTECODE_CACHE_DIR": None,  # None for Jinja's per-user temp directory
+}
+
+
+class FragmentCache:
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # (name, key, versions) -> html
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def fetch(self, conn, name, key, render):
+        """The cached HTML for this fragment, or render() stored under the current versions."""
+        versions = change_counters.versions(conn, *FRAGMENTS[name])
+        cache_key = (name, key, versions)
+        with self._lock:
+            html = self._entries.get(cache_key)
+            if html is not None:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return html
+            self.misses += 1
+
+        html = render()
+
+        with self._lock:
+            self._entries[cache_key] = html
+            # Entries from older versions can never hit again; they age out
+            # from the front like any other.
+            while self.max_size and len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+            }
+
+
+_cache = FragmentCache(max_size=DEFAULT_CONFIG["FRAGMENT_CACHE_SIZE"])
+
+
+class FragmentCacheExtension(Extension):
+    """The {% cache name, key... %} ... {% endcache %} tag."""
+
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        call = self.call_method("_render_fragment", [nodes.List(args)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render_fragment(self, args, caller):
+        from db import get_db_connection
+
+        name, *key = args
+        if name not in FRAGMENTS:
+            raise KeyError(f"unknown template fragment {name!r}; add it to fragment_cache.FRAGMENTS")
+        return Markup(_cache.fetch(get_db_connection(), name, tuple(key), caller))
+
+
+class lazy:
+    """Rows computed on first use: iterating or testing a lazy() in a fragment that hits never runs load."""
+
+    def __init__(self, load):
+        self._load = load
+        self._rows = None
+
+    def _get(self):
+        if self._rows is None:
+            self._rows = self._load()
+        return self._rows
+
+    def __iter__(self):
+        return iter(self._get())
+
+    def __len__(self):
+        return len(self._get())
+
+    def __bool__(self):
+        return bool(self._get())
+
+
+def stats():
+    return _cache.stats()
+
+
+def clear():
+    _cache.clear()
+
+
+def _reset_after_fork():
+    _cache._lock = threading.Lock()
+    _cache.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def init_app(app):
+    for key, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(key, value)
+    _cache.max_size = app.config["FRAGMENT_CACHE_SIZE"]
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    if app.config["TEMPLATE_BYTECODE_CACHE"]:
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config["TEMPLATE_BYTECODE_CACHE_DIR"])
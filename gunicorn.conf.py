@@ -0,0 +1,43 @@
+"""
+gunicorn settings for wsgi:app. Every value can be overridden from the
+environment (PTO_BIND, PTO_WORKERS, ...) or the command line.
+
+Reloading:
+    kill -HUP <master>    re-read this file and replace workers gracefully.
+                          With preload_app the master keeps the code it
+                          loaded, so new code needs a restart, or USR2 then
+                          WINCH/QUIT on the old master for a zero-downtime
+                          upgrade.
+    kill -TERM <master>   graceful stop; workers finish in-flight requests
+                          within graceful_timeout.
+
+SQLite takes one writer at a time, so more processes mostly help reads;
+a few processes with several threads each is a good start.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("PTO_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("PTO_WORKERS", min(multiprocessing.cpu_count(), 4)))
+# Live change feed streams long-poll here, at most FEED_MAX_STREAMS threads
+# per worker at a time (change_feed.py); the rest serve pages. Serve with
+# asgi.py to keep open pages' streams off the threads entirely.
+threads = int(os.environ.get("PTO_THREADS", 4))
+worker_class = "gthread"
+
+# Load app.py and compile templates once, before forking.
+preload_app = os.environ.get("PTO_PRELOAD", "1") != "0"
+
+timeout = int(os.environ.get("PTO_TIMEOUT", 60))
+graceful_timeout = int(os.environ.get("PTO_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+
+# Recycle workers now and then so slow leaks can't build up; jitter keeps
+# them from restarting together.
+max_requests = int(os.environ.get("PTO_MAX_REQUESTS", 5000))
+max_requests_jitter = 500
+
+accesslog = os.environ.get("PTO_ACCESS_LOG", "-")
+errorlog = "-"
+loglevel = os.environ.get("PTO_LOG_LEVEL", "info")
+
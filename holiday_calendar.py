@@ -0,0 +1,231 @@
+"""
+Holiday calendars for PTO hour calculation.
+
+Calendars and their rules live in the holiday_calendars / holiday_rules
+tables. For each year a calendar is asked about, it builds a per-day
+bitmap of working days (weekday and not an observed holiday) plus prefix
+sums over it, so counting working days in any range is two lookups per
+calendar year the range touches.
+
+Built calendars are cached per process. Every change to a calendar or its
+rules bumps holiday_calendars.version (see touch_calendar), and
+load_calendar() rebuilds when the version it sees differs from the cached
+one, so all worker processes pick up edits on their next lookup.
+"""
+import calendar as cal
+import os
+import threading
+from array import array
+from datetime import date, timedelta
+
+RULE_KINDS = ("fixed", "nth_weekday", "last_weekday", "date")
+
+WEEKDAY_NAMES = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+
+def rule_dates(rule, year):
+    """Actual (unshifted) dates a rule produces in a given year."""
+    kind = rule["kind"]
+    if kind == "fixed":
+        try:
+            return [date(year, rule["month"], rule["day"])]
+        except ValueError:  # e.g. Feb 29 outside leap years
+            return []
+    if kind == "nth_weekday":
+        first = date(year, rule["month"], 1)
+        offset = (rule["weekday"] - first.weekday()) % 7
+        day = 1 + offset + 7 * (rule["nth"] - 1)
+        if day > cal.monthrange(year, rule["month"])[1]:
+            return []
+        return [date(year, rule["month"], day)]
+    if kind == "last_weekday":
+        last_day = cal.monthrange(year, rule["month"])[1]
+        last = date(year, rule["month"], last_day)
+        return [last - timedelta(days=(last.weekday() - rule["weekday"]) % 7)]
+    if kind == "date":
+        holiday = date.fromisoformat(rule["holiday_date"])
+        return [holiday] if holiday.year == year else []
+    raise ValueError(f"Unknown holiday rule kind: {kind}")
+
+
+def observed_date(day):
+    """Shift a Saturday holiday to Friday and a Sunday holiday to Monday."""
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+class YearBitmap:
+    """Working-day bitmap and prefix sums for one calendar year."""
+
+    __slots__ = ("year", "first_ordinal", "working", "working_prefix", "holiday_prefix")
+
+    def __init__(self, year, holidays):
+        self.year = year
+        self.first_ordinal = date(year, 1, 1).toordinal()
+        n_days = 366 if cal.isleap(year) else 365
+
+        self.working = bytearray(n_days)
+        self.working_prefix = array("H", [0]) * (n_days + 1)
+        self.holiday_prefix = array("H", [0]) * (n_days + 1)
+
+        weekday = date(year, 1, 1).weekday()
+        holiday_offsets = {d.toordinal() - self.first_ordinal for d in holidays}
+        for i in range(n_days):
+            is_holiday = i in holiday_offsets
+            is_working = (weekday + i) % 7 < 5 and not is_holiday
+            self.working[i] = is_working
+            self.working_prefix[i + 1] = self.working_prefix[i] + is_working
+            self.holiday_prefix[i + 1] = self.holiday_prefix[i] + is_holiday
+
+    def count(self, first_offset, last_offset, skip_weekends):
+        """Days counted as PTO between two day-of-year offsets, inclusive."""
+        if skip_weekends:
+            return self.working_prefix[last_offset + 1] - self.working_prefix[first_offset]
+        days = last_offset - first_offset + 1
+        return days - (self.holiday_prefix[last_offset + 1] - self.holiday_prefix[first_offset])
+
+
+class HolidayCalendar:
+    def __init__(self, calendar_id, name, version, rules):
+        self.id = calendar_id
+        self.name = name
+        self.version = version
+        self.rules = [dict(rule) for rule in rules]
+        self._years = {}
+        self._lock = threading.Lock()
+
+    def holidays_in_year(self, year):
+        """Observed holiday dates falling in a year (including shifts across Jan 1)."""
+        holidays = set()
+        for rule in self.rules:
+            # A Jan 1 holiday on a Saturday is observed on Dec 31 of the
+            # previous year, so neighbouring years can contribute (within
+            # the years a date can have).
+            for source_year in range(max(year - 1, date.min.year), min(year + 1, date.max.year) + 1):
+                for day in rule_dates(rule, source_year):
+                    if rule["observed"]:
+                        day = observed_date(day)
+                    if day.year == year:
+                        holidays.add(day)
+        return holidays
+
+    def year_bitmap(self, year):
+        bitmap = self._years.get(year)
+        if bitmap is None:
+            with self._lock:
+                bitmap = self._years.get(year)
+                if bitmap is None:
+                    bitmap = YearBitmap(year, self.holidays_in_year(year))
+                    self._years[year] = bitmap
+        return bitmap
+
+    def is_working_day(self, day):
+        bitmap = self.year_bitmap(day.year)
+        return bool(bitmap.working[day.toordinal() - bitmap.first_ordinal])
+
+    def count_working_days(self, start_date, end_date, skip_weekends=True):
+        """PTO days in [start_date, end_date], excluding holidays (and weekends)."""
+        if end_date < start_date:
+            return 0
+        total = 0
+        for year in range(start_date.year, end_date.year + 1):
+            bitmap = self.year_bitmap(year)
+            first = start_date if year == start_date.year else date(year, 1, 1)
+            last = end_date if year == end_date.year else date(year, 12, 31)
+            total += bitmap.count(
+                first.toordinal() - bitmap.first_ordinal,
+                last.toordinal() - bitmap.first_ordinal,
+                skip_weekends,
+            )
+        return total
+
+    def holidays_between(self, start_date, end_date):
+        holidays = []
+        for year in range(start_date.year, end_date.year + 1):
+            holidays.extend(d for d in self.holidays_in_year(year) if start_date <= d <= end_date)
+        return sorted(holidays)
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    global _cache_lock
+    _cache_lock = threading.Lock()
+    _cache.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def load_calendar(conn, calendar_id=None):
+    """
+    Return the HolidayCalendar for calendar_id (or the default calendar),
+    or None if there is no such calendar. Costs one primary-key lookup when
+    the cached copy is current.
+    """
+    if calendar_id is None:
+        row = conn.execute(
+            "SELECT id, name, version FROM holiday_calendars WHERE is_default = 1"
+        ).fetchone()
+    else:
+        row = conn.execute(
+            "SELECT id, name, version FROM holiday_calendars WHERE id = ?",
+            (calendar_id,),
+        ).fetchone()
+    if row is None:
+        return None
+
+    cached = _cache.get(row["id"])
+    if cached is not None and cached.version == row["version"]:
+        return cached
+
+    rules = conn.execute(
+        """
+        SELECT kind, month, day, weekday, nth, holiday_date, observed
+        FROM holiday_rules
+        WHERE calendar_id = ?
+        """,
+        (row["id"],),
+    ).fetchall()
+    calendar = HolidayCalendar(row["id"], row["name"], row["version"], rules)
+    with _cache_lock:
+        _cache[row["id"]] = calendar
+    return calendar
+
+
+def touch_calendar(conn, calendar_id):
+    """Mark a calendar as changed; call inside the write that changes it."""
+    conn.execute(
+        "UPDATE holiday_calendars SET version = version + 1 WHERE id = ?",
+        (calendar_id,),
+    )
+    with _cache_lock:
+        _cache.pop(calendar_id, None)
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def describe_rule(rule):
+    """Human-readable description of a rule row, for the admin page."""
+    kind = rule["kind"]
+    if kind == "fixed":
+        text = f"{cal.month_name[rule['month']]} {rule['day']}"
+    elif kind == "nth_weekday":
+        ordinal = {1: "1st", 2: "2nd", 3: "3rd"}.get(rule["nth"], f"{rule['nth']}th")
+        text = f"{ordinal} {WEEKDAY_NAMES[rule['weekday']]} of {cal.month_name[rule['month']]}"
+    elif kind == "last_weekday":
+        text = f"Last {WEEKDAY_NAMES[rule['weekday']]} of {cal.month_name[rule['month']]}"
+    else:
+        text = rule["holiday_date"]
+    if rule["observed"]:
+        text += " (observed)"
+    return text
@@ -0,0 +1,124 @@
+"""
+Conditional GET for HTML pages and the JSON API.
+
+A page's validator is a hash of the change counters of the tables it reads
+(see change_counters.py), its URL and anything else it depends on. Reading
+the counters is one primary-key query, so a page whose browser copy is
+still current answers 304 Not Modified before any of its own queries run
+or its template renders:
+
+    @app.route("/calendar")
+    @login_required
+    @http_cache.conditional("pto_entries", "pto_days", "pto_types", "employees")
+    def calendar_view():
+        ...
+
+HTML validators also cover the signed-in user and today's date, since
+pages show role-dependent controls and date-dependent defaults. Counters
+are read before the view runs, so a write that lands mid-render can only
+make the next request miss, never serve stale HTML.
+
+Async views (asgi.py) are wrapped the same way; their counter query runs
+through async_db.
+
+Pages are private to the session and revalidated on every use
+("private, no-cache"), so a manager refreshing the calendar gets a cheap
+304 until someone books or cancels PTO.
+"""
+import hashlib
+import inspect
+from datetime import date, datetime, timedelta, timezone
+from functools import wraps
+
+from flask import make_response, request, session
+
+import async_db
+import change_counters
+from db import get_db_connection
+
+PAGE_CACHE_CONTROL = "private, no-cache"
+
+
+def validators(conn, counters, extra=()):
+    """
+    (ETag, Last-Modified or None) for the current request and the given counters.
+
+    Counter timestamps only have one-second resolution, so while the
+    latest one's second is still running another write can land in it
+    without changing Last-Modified. Until that second is over there is no
+    Last-Modified: it isn't sent, and If-Modified-Since can't match it.
+    """
+    versions, updated_at = change_counters.snapshot(conn, *counters)
+    etag = hashlib.sha1(
+        repr((request.full_path, counters, versions, extra)).encode("utf-8")
+    ).hexdigest()
+    last_modified = None
+    if updated_at:
+        last_modified = datetime.strptime(updated_at, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+        if last_modified + timedelta(seconds=1) > datetime.now(timezone.utc):
+            last_modified = None
+    return etag, last_modified
+
+
+def is_fresh(etag, last_modified=None):
+    """Whether the client's If-None-Match (or, without one, If-Modified-Since) is current."""
+    if request.if_none_match:
+        return etag in request.if_none_match
+    since = request.if_modified_since
+    return bool(since and last_modified and last_modified <= since)
+
+
+def conditional(*counters, cache_control=PAGE_CACHE_CONTROL):
+    """Serve GETs of an HTML view (sync or async) as 304 while the given counters are unchanged."""
+
+    def decorator(view):
+        if inspect.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(*args, **kwargs):
+                if request.method not in ("GET", "HEAD"):
+                    return await view(*args, **kwargs)
+                etag, not_modified = await async_db.run(_revalidate, counters, cache_control)
+                if not_modified is not None:
+                    return not_modified
+                return _finish(await view(*args, **kwargs), etag, cache_control)
+
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(*args, **kwargs)
+            etag, not_modified = _revalidate(get_db_connection(), counters, cache_control)
+            if not_modified is not None:
+                return not_modified
+            return _finish(view(*args, **kwargs), etag, cache_control)
+
+        return wrapper
+
+    return decorator
+
+
+def _revalidate(conn, counters, cache_control):
+    """(ETag or None, a 304 response if the client's copy is current or None)."""
+    # A pending flash message is shown once by whatever renders next; that
+    # page can neither be a 304 nor be revalidated later.
+    if session.get("_flashes"):
+        return None, None
+    extra = (session.get("user_id"), session.get("role"), date.today().isoformat())
+    etag, _ = validators(conn, counters, extra)
+    if etag not in request.if_none_match:
+        return etag, None
+    response = make_response("", 304)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+    response.vary.add("Cookie")
+    return etag, response
+
+
+def _finish(rv, etag, cache_control):
+    response = make_response(rv)
+    if etag is not None and response.status_code == 200:
+        response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+    response.vary.add("Cookie")
+    return response
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+Bulk import of employees and PTO entries from CSV or JSON lines.
+
+Input is streamed and handled in chunks. Each row is validated with the
+same rules as the employee and PTO entry forms (see validation.py). Each
+chunk's valid rows are then written in one transaction with executemany.
+Rows that fail are reported by line number and the rest of the file still
+imports.
+
+Employee columns: first_name, last_name, employment_type, phone, email, team,
+hire_date.
+Balances for every active PTO type are created for the whole chunk in a
+single INSERT ... SELECT.
+
+Entry columns: employee_id or employee_email, pto_type (code) or
+pto_type_id, start_date, end_date, hours (optional; calculated from the
+dates when blank), notes. Entries are checked against the remaining
+balance and for double bookings, exactly as in the PTO entry form.
+
+Usage:
+    python importer.py employees people.csv
+    python importer.py entries pto.jsonl --chunk-size 500
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+import balance_cache
+import db
+import entries
+import holiday_calendar
+import ledger
+import pto_catalog
+import validation
+
+BASE_DIR = Path(__file__).resolve().parent
+DB_PATH = BASE_DIR / "pto_tracker.db"
+
+DEFAULT_CHUNK_SIZE = 1000
+FORMATS = ("csv", "jsonl")
+
+_UNDECODABLE = re.compile("[\udc80-\udcff]")
+NOT_UTF8 = "The file isn't UTF-8 text from here on; nothing from this line on was imported."
+
+EMPLOYEE_FIELDS = ("first_name", "last_name", "employment_type", "phone", "email", "team", "hire_date")
+
+
+class ImportReport:
+    def __init__(self, kind):
+        self.kind = kind
+        self.rows_read = 0
+        self.imported = 0
+        self.errors = []  # (line number, [messages])
+        self._started = time.perf_counter()
+        self._finished = None
+
+    def add_error(self, line_no, messages):
+        self.errors.append((line_no, messages))
+
+    def finish(self):
+        self._finished = time.perf_counter()
+        return self
+
+    @property
+    def elapsed(self):
+        return (self._finished or time.perf_counter()) - self._started
+
+    @property
+    def rows_per_second(self):
+        return self.rows_read / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self):
+        return (
+            f"Imported {self.imported} of {self.rows_read} {self.kind} rows "
+            f"({len(self.errors)} rejected) in {self.elapsed:.2f}s "
+            f"({self.rows_per_second:,.0f} rows/s)."
+        )
+
+
+def detect_format(filename):
+    suffix = Path(filename or "").suffix.lower()
+    return "jsonl" if suffix in (".jsonl", ".ndjson", ".json") else "csv"
+
+
+def read_rows(stream, fmt):
+    """
+    Yield (line_no, row, error) for each record of a text stream. row is a
+    dict of column -> value, or None when the record couldn't be parsed.
+
+    A malformed CSV record is reported and skipped. Text that isn't UTF-8
+    ends the stream with an error at the first line not read, so the rows
+    before it still import; open the stream with errors="surrogateescape"
+    for that to be the exact line rather than the start of a decoded block.
+    """
+    stream = _decoded_lines(stream)
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        last_line = 0  # where the previous record ended; reader.line_num lags after an error
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                last_line += 1
+                yield last_line, None, f"Invalid CSV: {e}"
+                continue
+            except UnicodeDecodeError:
+                yield last_line + 1, None, NOT_UTF8
+                return
+            last_line = reader.line_num
+            yield last_line, row, None
+    elif fmt == "jsonl":
+        line_no = 0
+        while True:
+            try:
+                line = next(stream)
+            except StopIteration:
+                return
+            except UnicodeDecodeError:
+                yield line_no + 1, None, NOT_UTF8
+                return
+            line_no += 1
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_no, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(row, dict):
+                yield line_no, None, "Each line must be a JSON object."
+                continue
+            yield line_no, row, None
+    else:
+        raise ValueError(f"Unknown import format: {fmt}")
+
+
+def _decoded_lines(stream):
+    """
+    Lines of a text stream, raising UnicodeDecodeError at the first one with
+    bytes that aren't UTF-8 (kept as surrogates by errors="surrogateescape").
+    """
+    for line in stream:
+        if _UNDECODABLE.search(line):
+            line.encode("utf-8", "surrogateescape").decode("utf-8")
+        yield line
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _text(row, key):
+    value = row.get(key)
+    return "" if value is None else str(value).strip()
+
+
+# --- Employees ---
+
+def import_employees(conn, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    report = ImportReport("employee")
+    for chunk in _chunks(rows, chunk_size):
+        valid = []
+        for line_no, row, error in chunk:
+            report.rows_read += 1
+            if error:
+                report.add_error(line_no, [error])
+                continue
+            fields = {key: _text(row, key) for key in EMPLOYEE_FIELDS}
+            errors = validation.validate_employee(
+                fields["first_name"], fields["last_name"], fields["employment_type"],
+                fields["hire_date"],
+            )
+            if errors:
+                report.add_error(line_no, errors)
+                continue
+            valid.append(fields)
+
+        if valid:
+            db.run_write(conn, lambda conn: _write_employees(conn, valid))
+            report.imported += len(valid)
+    return report.finish()
+
+
+def _write_employees(conn, rows):
+    last_existing_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM employees").fetchone()[0]
+    conn.executemany(
+        """
+        INSERT INTO employees (first_name, last_name, employment_type, phone, email, team, hire_date, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?, 'active')
+        """,
+        [
+            (r["first_name"], r["last_name"], r["employment_type"], r["phone"], r["email"],
+             r["team"] or None, r["hire_date"] or None)
+            for r in rows
+        ],
+    )
+    # Balances for every new employee and active PTO type in one statement.
+    # Nobody cached has changed, so the balance cache only advances its tag.
+    with balance_cache.invalidating(conn, ()):
+        conn.execute(
+            """
+            INSERT INTO pto_balances (employee_id, pto_type_id, hours_allotted, hours_used)
+            SELECT e.id, pt.id, pt.default_hours, 0
+            FROM employees e
+            CROSS JOIN pto_types pt
+            WHERE e.id > ? AND pt.is_active = 1
+            """,
+            (last_existing_id,),
+        )
+    ledger.post_openings(conn, "employee_id > ?", (last_existing_id,))
+
+
+# --- PTO entries ---
+
+def import_entries(conn, rows, manager_id=None, max_people_out=None, allow_overlap=False,
+                   chunk_size=DEFAULT_CHUNK_SIZE):
+    report = ImportReport("PTO entry")
+    holidays = holiday_calendar.load_calendar(conn)
+    type_ids_by_code = {t["code"]: t["id"] for t in pto_catalog.active_types(conn)}
+
+    for chunk in _chunks(rows, chunk_size):
+        report.rows_read += len(chunk)
+        candidates, rejected = prepare_entries(conn, chunk, holidays, type_ids_by_code)
+        for line_no, messages in rejected:
+            report.add_error(line_no, messages)
+        if not candidates:
+            continue
+
+        def write_chunk(conn):
+            return entries.insert_entries(
+                conn, candidates, manager_id, holidays, max_people_out, allow_overlap
+            )
+
+        accepted, rejected = db.run_write(conn, write_chunk)
+        report.imported += len(accepted)
+        for line_no, messages in rejected:
+            report.add_error(line_no, messages)
+
+    report.errors.sort(key=lambda error: error[0])
+    return report.finish()
+
+
+def prepare_entries(conn, rows, holidays, type_ids_by_code=None):
+    """
+    Field validation and id resolution for a batch of entry rows (no writes).
+
+    rows are (key, row, parse_error) as yielded by read_rows(); the key (a
+    line number here, a list position in the API) tags the results.
+    Returns (candidates for entries.insert_entries(), [(key, messages)]).
+    """
+    if type_ids_by_code is None:
+        type_ids_by_code = {t["code"]: t["id"] for t in pto_catalog.active_types(conn)}
+    rejected = []
+    parsed = []
+    emails = set()
+    employee_ids = set()
+    for key, row, error in rows:
+        if error:
+            rejected.append((key, [error]))
+            continue
+        parsed.append((key, row))
+        if _text(row, "employee_id"):
+            try:
+                employee_ids.add(int(_text(row, "employee_id")))
+            except ValueError:
+                pass
+        elif _text(row, "employee_email"):
+            emails.add(_text(row, "employee_email").lower())
+
+    # Resolve employees for the whole chunk with one query per key type.
+    known_ids = set()
+    if employee_ids:
+        known_ids = {
+            row["id"] for row in conn.execute(
+                f"SELECT id FROM employees WHERE id IN ({', '.join('?' * len(employee_ids))})",
+                list(employee_ids),
+            )
+        }
+    ids_by_email = {}
+    if emails:
+        for row in conn.execute(
+            f"SELECT id, lower(email) AS email FROM employees WHERE lower(email) IN ({', '.join('?' * len(emails))})",
+            list(emails),
+        ):
+            ids_by_email.setdefault(row["email"], []).append(row["id"])
+
+    active_type_ids = set(type_ids_by_code.values())
+    candidates = []
+    for key, row in parsed:
+        errors = []
+
+        employee_id = None
+        if _text(row, "employee_id"):
+            try:
+                employee_id = int(_text(row, "employee_id"))
+            except ValueError:
+                pass
+            if employee_id not in known_ids:
+                errors.append("Employee not found.")
+                employee_id = None
+        elif _text(row, "employee_email"):
+            matches = ids_by_email.get(_text(row, "employee_email").lower(), [])
+            if len(matches) == 1:
+                employee_id = matches[0]
+            elif matches:
+                errors.append("More than one employee has this email; use employee_id.")
+            else:
+                errors.append("Employee not found.")
+        else:
+            errors.append("employee_id or employee_email is required.")
+
+        pto_type_id = _text(row, "pto_type_id")
+        code = _text(row, "pto_type").upper()
+        if not pto_type_id and code:
+            pto_type_id = str(type_ids_by_code.get(code, ""))
+            if not pto_type_id:
+                errors.append(f"Unknown or inactive PTO type '{code}'.")
+
+        start_date = _text(row, "start_date")
+        end_date = _text(row, "end_date")
+        field_errors, pto_type_id_int, hours = validation.validate_pto_entry(
+            pto_type_id, start_date, end_date, _text(row, "hours"), holidays
+        )
+        errors.extend(field_errors)
+        # Same rule as the single-entry form and API: active types only,
+        # however the type was given.
+        if pto_type_id_int and pto_type_id_int not in active_type_ids:
+            errors.append("Unknown or inactive PTO type.")
+
+        if errors:
+            rejected.append((key, errors))
+            continue
+        candidates.append(
+            {
+                "key": key,
+                "employee_id": employee_id,
+                "pto_type_id": pto_type_id_int,
+                "start_date": start_date,
+                "end_date": end_date,
+                "hours": hours,
+                "notes": _text(row, "notes"),
+            }
+        )
+    return candidates, rejected
+
+
+IMPORTERS = {
+    "employees": import_employees,
+    "entries": import_entries,
+}
+
+
+def run_import(conn, kind, stream, fmt, **options):
+    """Import a text stream; `kind` is 'employees' or 'entries'."""
+    return IMPORTERS[kind](conn, read_rows(stream, fmt), **options)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import employees or PTO entries.")
+    parser.add_argument("kind", choices=sorted(IMPORTERS))
+    parser.add_argument("path", help="CSV or JSON-lines file ('-' for stdin)")
+    parser.add_argument("--format", choices=FORMATS, help="defaults to the file extension")
+    parser.add_argument("--db", default=str(DB_PATH), help="path to the SQLite database")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--max-people-out", type=int, help="entries only: per-team daily limit")
+    parser.add_argument("--allow-overlap", action="store_true", help="entries only: allow double bookings")
+    args = parser.parse_args()
+
+    fmt = args.format or detect_format(args.path)
+    options = {"chunk_size": args.chunk_size}
+    if args.kind == "entries":
+        options.update(max_people_out=args.max_people_out, allow_overlap=args.allow_overlap)
+
+    conn = db.connect(args.db)
+    try:
+        if args.path == "-":
+            stream = io.TextIOWrapper(
+                sys.stdin.buffer, encoding="utf-8-sig", errors="surrogateescape", newline=""
+            )
+            report = run_import(conn, args.kind, stream, fmt, **options)
+        else:
+            with open(args.path, "r", encoding="utf-8-sig", errors="surrogateescape", newline="") as stream:
+                report = run_import(conn, args.kind, stream, fmt, **options)
+    finally:
+        conn.close()
+
+    print(report.summary())
+    for line_no, messages in report.errors[:50]:
+        print(f"  line {line_no}: {' '.join(messages)}")
+    if len(report.errors) > 50:
+        print(f"  ... and {len(report.errors) - 50} more.")
+    return 0 if not report.errors else 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,7 +1,9 @@
-import sqlite3
 from pathlib import Path
 from werkzeug.security import generate_password_hash
 
+import db
+import migrations
+
 BASE_DIR = Path(__file__).resolve().parent
 DB_PATH = BASE_DIR / "pto_tracker.db"
 SCHEMA_PATH = BASE_DIR / "schema.sql"
@@ -12,10 +14,13 @@ def init_db():
     if DB_PATH.exists():
         print(f"Deleting existing database at {DB_PATH}")
         DB_PATH.unlink()
+    # WAL mode leaves these next to the database; a stale WAL must not
+    # outlive the file it belongs to.
+    for suffix in ("-wal", "-shm"):
+        DB_PATH.with_name(DB_PATH.name + suffix).unlink(missing_ok=True)
 
     print(f"Creating new database at {DB_PATH}")
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("PRAGMA foreign_keys = ON;")
+    conn = db.connect(DB_PATH)
 
     with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
         schema_sql = f.read()
@@ -52,6 +57,11 @@ def init_db():
     )
 
     conn.commit()
+
+    # schema.sql is the base schema; indexes and later tables come from
+    # the versioned migrations so fresh and upgraded databases match.
+    migrations.migrate(conn)
+
     conn.close()
     print("Database initialized successfully.")
 
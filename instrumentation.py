@@ -0,0 +1,350 @@
+"""
+Request, SQL and template timing, exposed as Prometheus metrics.
+
+With instrumentation on, the pool opens TimedConnection objects, so every
+statement run through get_db_connection() is timed:
+
+- per request: query count, query time and template time, sent back in a
+  Server-Timing header, with a warning when one request runs the same
+  statement N_PLUS_ONE_THRESHOLD times or more (the N+1 pattern);
+- per process: histograms of request latency by endpoint, statement time
+  by statement kind, queries per request and template render time;
+- statements slower than SLOW_QUERY_MS are logged with their bound
+  parameters.
+
+Statement time covers executing the statement and producing its first row;
+rows fetched later by iterating the cursor aren't included. Request
+latency ends when the view returns, so a streamed body isn't counted.
+
+Setting PROFILE_REQUESTS lets a request ask for a cProfile dump with
+?_profile=1; one request is profiled at a time and the stats are written to
+PROFILE_DIR.
+
+Metrics are per process. /metrics renders them in the Prometheus text
+format. With METRICS_TOKEN set it requires "Authorization: Bearer <token>";
+without one it only answers requests made straight to a loopback address
+(not through a proxy), unless METRICS_PUBLIC opens it to anyone.
+"""
+import cProfile
+import hmac
+import ipaddress
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from flask import before_render_template, g, has_app_context, request, template_rendered
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = {
+    "INSTRUMENTATION_ENABLED": True,
+    "SLOW_QUERY_MS": 100.0,          # log statements slower than this; None to turn off
+    "N_PLUS_ONE_THRESHOLD": 20,      # warn when a request repeats one statement this often
+    "PROFILE_REQUESTS": False,       # allow ?_profile=1
+    "PROFILE_DIR": str(Path(__file__).resolve().parent / "profiles"),
+    "METRICS_TOKEN": None,
+    "METRICS_PUBLIC": False,         # serve /metrics to anyone when no token is set
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_settings = dict(DEFAULT_CONFIG)
+
+
+# --- Metrics ---
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """A Prometheus histogram with a fixed label set; observe() is thread-safe."""
+
+    def __init__(self, name, help_text, buckets, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series = {}  # label values -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted(self._series.items())
+            items = [(labels, list(series)) for labels, series in items]
+        for labels, series in items:
+            for bound, count in zip(self.buckets, series):
+                label_str = _format_labels(self.labelnames + ("le",), labels + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{label_str} {count}")
+            label_str = _format_labels(self.labelnames + ("le",), labels + ("+Inf",))
+            lines.append(f"{self.name}_bucket{label_str} {series[-2]}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_count{label_str} {series[-2]}")
+            lines.append(f"{self.name}_sum{label_str} {_format_value(series[-1])}")
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+REQUEST_LATENCY = Histogram(
+    "pto_http_request_duration_seconds", "Time spent in the view, by endpoint.",
+    LATENCY_BUCKETS, ("endpoint", "method", "status"),
+)
+REQUEST_QUERIES = Histogram(
+    "pto_http_request_queries", "SQL statements run per request, by endpoint.",
+    COUNT_BUCKETS, ("endpoint",),
+)
+QUERY_LATENCY = Histogram(
+    "pto_sql_statement_duration_seconds", "SQL statement time, by statement kind.",
+    QUERY_BUCKETS, ("statement",),
+)
+TEMPLATE_LATENCY = Histogram(
+    "pto_template_render_duration_seconds", "Template render time, by template.",
+    LATENCY_BUCKETS, ("template",),
+)
+HISTOGRAMS = (REQUEST_LATENCY, REQUEST_QUERIES, QUERY_LATENCY, TEMPLATE_LATENCY)
+
+
+def _reset_after_fork():
+    # Each worker process reports its own metrics from zero.
+    global _profile_lock
+    _profile_lock = threading.Lock()
+    for histogram in HISTOGRAMS:
+        histogram._lock = threading.Lock()
+        histogram.clear()
+
+
+def gauges(name, help_text, samples, labelname=None):
+    """Lines for a gauge family; samples is {label value: number}, or a number when unlabelled."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    if labelname is None:
+        lines.append(f"{name} {_format_value(samples)}")
+    else:
+        for label, value in sorted(samples.items()):
+            lines.append(f"{name}{_format_labels((labelname,), (label,))} {_format_value(value)}")
+    return lines
+
+
+def render_metrics(extra_lines=()):
+    """The Prometheus text exposition for this process."""
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    lines.extend(extra_lines)
+    return "\n".join(lines) + "\n"
+
+
+def metrics_authorized(req):
+    token = _settings["METRICS_TOKEN"]
+    if not token:
+        return _settings["METRICS_PUBLIC"] or _is_local(req)
+    supplied = req.headers.get("Authorization", "")
+    return hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode())
+
+
+def _is_local(req):
+    """
+    Whether req came straight from this host. A proxy on this host looks
+    local too, so forwarded requests don't count.
+    """
+    if "X-Forwarded-For" in req.headers or "Forwarded" in req.headers:
+        return False
+    try:
+        return ipaddress.ip_address(req.remote_addr or "").is_loopback
+    except ValueError:
+        return False
+
+
+# --- SQL timing ---
+
+def _statement_kind(sql):
+    words = sql.lstrip().split(None, 1)
+    return words[0].upper() if words else ""
+
+
+def _format_params(parameters):
+    text = repr(parameters)
+    return text if len(text) <= 500 else text[:500] + "..."
+
+
+def record_query(sql, parameters, elapsed):
+    QUERY_LATENCY.observe(elapsed, _statement_kind(sql))
+    if has_app_context():
+        stats = g.get("_request_stats")
+        if stats is not None:
+            stats.queries += 1
+            stats.query_time += elapsed
+            stats.statements[sql] += 1
+    slow_ms = _settings["SLOW_QUERY_MS"]
+    if slow_ms is not None and elapsed * 1000 >= slow_ms:
+        logger.warning(
+            "Slow query (%.1f ms): %s; params=%s",
+            elapsed * 1000, " ".join(sql.split()), _format_params(parameters),
+        )
+
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_query(sql, parameters, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_query(sql, "<executemany>", time.perf_counter() - start)
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3.Connection that times statements and commits (see record_query)."""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            record_query("COMMIT", (), time.perf_counter() - start)
+
+
+# --- Requests and templates ---
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_time = 0.0
+        self.template_time = 0.0
+        self.statements = Counter()
+        self.status = None
+        self.render_starts = []
+        self.profiler = None
+
+
+_profile_lock = threading.Lock()
+
+
+def _start_request():
+    stats = g._request_stats = RequestStats()
+    if _settings["PROFILE_REQUESTS"] and request.args.get("_profile") == "1":
+        # cProfile can't run two profilers at once; other requests go unprofiled.
+        if _profile_lock.acquire(blocking=False):
+            stats.profiler = cProfile.Profile()
+            stats.profiler.enable()
+
+
+def _finish_response(response):
+    stats = g.get("_request_stats")
+    if stats is not None:
+        stats.status = response.status_code
+        elapsed = time.perf_counter() - stats.started
+        response.headers["Server-Timing"] = (
+            f'db;dur={stats.query_time * 1000:.1f};desc="{stats.queries} queries", '
+            f"tpl;dur={stats.template_time * 1000:.1f}, "
+            f"total;dur={elapsed * 1000:.1f}"
+        )
+    return response
+
+
+def _finish_request(exc=None):
+    stats = g.pop("_request_stats", None)
+    if stats is None:
+        return
+    elapsed = time.perf_counter() - stats.started
+    endpoint = request.endpoint or "unmatched"
+    status = stats.status or 500
+    REQUEST_LATENCY.observe(elapsed, endpoint, request.method, str(status))
+    REQUEST_QUERIES.observe(stats.queries, endpoint)
+
+    if stats.statements:
+        sql, count = stats.statements.most_common(1)[0]
+        if count >= _settings["N_PLUS_ONE_THRESHOLD"]:
+            logger.warning(
+                "%s %s ran one statement %d times (%d queries in all): %s",
+                request.method, request.path, count, stats.queries, " ".join(sql.split()),
+            )
+
+    if stats.profiler is not None:
+        stats.profiler.disable()
+        try:
+            directory = Path(_settings["PROFILE_DIR"])
+            directory.mkdir(parents=True, exist_ok=True)
+            path = directory / f"{endpoint}-{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 10**6}.prof"
+            stats.profiler.dump_stats(path)
+            logger.info("Wrote profile for %s %s to %s", request.method, request.path, path)
+        finally:
+            _profile_lock.release()
+
+
+def _template_starting(sender, template, context, **extra):
+    stats = g.get("_request_stats") if has_app_context() else None
+    if stats is not None:
+        stats.render_starts.append(time.perf_counter())
+
+
+def _template_done(sender, template, context, **extra):
+    stats = g.get("_request_stats") if has_app_context() else None
+    if stats is not None and stats.render_starts:
+        elapsed = time.perf_counter() - stats.render_starts.pop()
+        stats.template_time += elapsed
+        TEMPLATE_LATENCY.observe(elapsed, template.name or "<string>")
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def init_app(app):
+    for key, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(key, value)
+    _settings.update({key: app.config[key] for key in DEFAULT_CONFIG})
+    if not app.config["INSTRUMENTATION_ENABLED"]:
+        return
+    app.config["DB_CONNECTION_FACTORY"] = TimedConnection
+    app.before_request(_start_request)
+    app.after_request(_finish_response)
+    app.teardown_request(_finish_request)
+    before_render_template.connect(_template_starting, app)
+    template_rendered.connect(_template_done, app)
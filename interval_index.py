@@ -0,0 +1,326 @@
+"""
+In-process interval index over pto_entries for booking conflict checks.
+
+Each employee and each team gets a segment tree over calendar days that
+holds how many entries cover each day, supporting "add an interval" and
+"max coverage in a range" in O(log days). From that:
+
+- an employee has overlapping PTO in [start, end] iff their max is > 0;
+- the most people a team already has out on any day of [start, end] is
+  the team tree's max over that range.
+
+The index is built once per process from pto_entries and kept current by
+entries.py on every insert and delete (and rebuilt if that write rolls
+back). It is tagged with the pto_entries / employee_teams change counters
+and the last change_events id it has seen. When another process has written in the meantime, the
+next lookup applies that process's entry_created / entry_deleted events
+(and re-reads employees' teams if those changed) instead of scanning
+pto_entries again. It only rebuilds from scratch when the events don't
+account for every change to pto_entries, e.g. after they were pruned.
+"""
+import os
+import threading
+from contextlib import contextmanager
+from datetime import date
+
+import change_counters
+import change_feed
+import db
+
+# Day range the trees cover: every date Python can represent, so no entry
+# is ever clamped onto another's days. Trees are sparse, so the width only
+# costs a few extra levels (about 22) per update and query.
+DOMAIN_START = date.min.toordinal()
+DOMAIN_END = date.max.toordinal()
+
+COUNTERS = ("pto_entries", "employee_teams")
+
+
+class DaySegmentTree:
+    """Sparse segment tree over day ordinals: range add, range max."""
+
+    __slots__ = ("_max", "_add")
+
+    def __init__(self):
+        self._max = {}  # node -> max coverage in the node's span
+        self._add = {}  # node -> count added to the whole span
+
+    def add(self, start, end, delta=1):
+        self._update(1, DOMAIN_START, DOMAIN_END, start, end, delta)
+
+    def max(self, start, end):
+        return self._query(1, DOMAIN_START, DOMAIN_END, start, end)
+
+    def _update(self, node, lo, hi, start, end, delta):
+        if end < lo or hi < start:
+            return
+        if start <= lo and hi <= end:
+            self._add[node] = self._add.get(node, 0) + delta
+            self._max[node] = self._max.get(node, 0) + delta
+            return
+        mid = (lo + hi) // 2
+        self._update(2 * node, lo, mid, start, end, delta)
+        self._update(2 * node + 1, mid + 1, hi, start, end, delta)
+        self._max[node] = self._add.get(node, 0) + max(
+            self._max.get(2 * node, 0), self._max.get(2 * node + 1, 0)
+        )
+
+    def _query(self, node, lo, hi, start, end):
+        if end < lo or hi < start:
+            return 0
+        if start <= lo and hi <= end:
+            return self._max.get(node, 0)
+        if node not in self._max:
+            return 0  # nothing was ever added under this node
+        mid = (lo + hi) // 2
+        return self._add.get(node, 0) + max(
+            self._query(2 * node, lo, mid, start, end),
+            self._query(2 * node + 1, mid + 1, hi, start, end),
+        )
+
+
+def _ordinals(start_date, end_date):
+    return date.fromisoformat(start_date).toordinal(), date.fromisoformat(end_date).toordinal()
+
+
+class PtoIntervalIndex:
+    def __init__(self):
+        self.version = None
+        self.event_id = 0  # last change_events id reflected here
+        self.by_employee = {}
+        self.by_team = {}
+        self.employee_team = {}
+        self.entries = {}  # entry_id -> (employee_id, team, start_ordinal, end_ordinal)
+
+    def load(self, conn):
+        self.by_employee = {}
+        self.by_team = {}
+        self.employee_team = {
+            row["id"]: row["team"] or ""
+            for row in conn.execute("SELECT id, team FROM employees")
+        }
+        self.entries = {}
+        for row in conn.execute("SELECT id, employee_id, start_date, end_date FROM pto_entries"):
+            self._add(row["id"], row["employee_id"], *_ordinals(row["start_date"], row["end_date"]))
+        self.event_id = change_feed.latest_id(conn)
+
+    def catch_up(self, conn, current):
+        """
+        Apply other processes' changes since self.version; False if the
+        change feed can't account for them all and a load() is needed.
+        """
+        if current[1] != self.version[1]:
+            self._reload_teams(conn)
+        entry_changes = current[0] - self.version[0]
+        if not entry_changes:
+            return True
+        events = conn.execute(
+            """
+            SELECT id, kind, employee_id, start_date, end_date, json_extract(payload, '$.id') AS entry_id
+            FROM change_events
+            WHERE id > ? AND kind IN ('entry_created', 'entry_deleted')
+            ORDER BY id
+            """,
+            (self.event_id,),
+        ).fetchall()
+        # Every insert or delete of an entry bumps the counter once and logs
+        # one event; anything else (pruned events, an UPDATE) means reload.
+        if len(events) != entry_changes:
+            return False
+        for event in events:
+            if event["kind"] == "entry_created":
+                if event["entry_id"] not in self.entries:
+                    self.team_of(conn, event["employee_id"])
+                    self._add(event["entry_id"], event["employee_id"],
+                              *_ordinals(event["start_date"], event["end_date"]))
+            else:
+                self._remove(event["entry_id"])
+        self.event_id = events[-1]["id"]
+        return True
+
+    def _reload_teams(self, conn):
+        """Re-read employees' teams and move entries whose employee changed team."""
+        self.employee_team = {
+            row["id"]: row["team"] or ""
+            for row in conn.execute("SELECT id, team FROM employees")
+        }
+        for entry_id, (employee_id, team, start, end) in list(self.entries.items()):
+            new_team = self.employee_team.get(employee_id, "")
+            if new_team != team:
+                self.by_team[team].add(start, end, -1)
+                self.by_team.setdefault(new_team, DaySegmentTree()).add(start, end, 1)
+                self.entries[entry_id] = (employee_id, new_team, start, end)
+
+    def team_of(self, conn, employee_id):
+        team = self.employee_team.get(employee_id)
+        if team is None:
+            row = conn.execute("SELECT team FROM employees WHERE id = ?", (employee_id,)).fetchone()
+            team = (row["team"] or "") if row is not None else ""
+            self.employee_team[employee_id] = team
+        return team
+
+    def _add(self, entry_id, employee_id, start, end):
+        team = self.employee_team.get(employee_id, "")
+        self.entries[entry_id] = (employee_id, team, start, end)
+        self.by_employee.setdefault(employee_id, DaySegmentTree()).add(start, end, 1)
+        self.by_team.setdefault(team, DaySegmentTree()).add(start, end, 1)
+
+    def _remove(self, entry_id):
+        found = self.entries.pop(entry_id, None)
+        if found is None:
+            return
+        employee_id, team, start, end = found
+        self.by_employee[employee_id].add(start, end, -1)
+        self.by_team[team].add(start, end, -1)
+
+    def employee_overlaps(self, employee_id, start, end):
+        tree = self.by_employee.get(employee_id)
+        return tree is not None and tree.max(start, end) > 0
+
+    def max_team_out(self, team, start, end):
+        tree = self.by_team.get(team)
+        return tree.max(start, end) if tree is not None else 0
+
+
+_index = PtoIntervalIndex()
+_lock = threading.RLock()
+
+
+def _reset_after_fork():
+    global _lock
+    _lock = threading.RLock()
+    _index.version = None  # rebuild on first use
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@contextmanager
+def _read_snapshot(conn):
+    """Run the block's reads in one transaction (or the caller's), so counters and rows agree."""
+    if conn.in_transaction:
+        yield
+        return
+    conn.execute("BEGIN")
+    try:
+        yield
+    finally:
+        conn.commit()
+
+
+def get_index(conn):
+    """The process-wide index, brought up to date first if the database has moved on."""
+    with _lock, _read_snapshot(conn):
+        current = change_counters.versions(conn, *COUNTERS)
+        if _index.version != current:
+            if _index.version is None or not _index.catch_up(conn, current):
+                _index.load(conn)
+            _index.version = current
+    return _index
+
+
+def _apply(conn, change):
+    """
+    Apply one of our own writes if the index was current just before it.
+    Call after the write's change_events row is recorded.
+    """
+    current = change_counters.versions(conn, *COUNTERS)
+    expected_before = (current[0] - 1, current[1])
+    with _lock:
+        if _index.version == expected_before:
+            # Applied before the commit: if the write rolls back instead,
+            # rebuild rather than keep a change the database never kept.
+            db.on_rollback(reset)
+            change()
+            _index.version = current
+            _index.event_id = change_feed.latest_id(conn)
+        # Otherwise the index was already behind; the next lookup catches
+        # up through the change feed, this write included.
+
+
+def record_insert(conn, entry_id, employee_id, start_date, end_date):
+    """Call after inserting an entry, inside the same transaction."""
+    with _lock:
+        _index.team_of(conn, employee_id)
+        _apply(conn, lambda: _index._add(entry_id, employee_id, *_ordinals(start_date, end_date)))
+
+
+def record_delete(conn, entry_id):
+    """Call after deleting an entry, inside the same transaction."""
+    _apply(conn, lambda: _index._remove(entry_id))
+
+
+def _conflicts(index, conn, employee_id, start, end, max_people_out, allow_overlap):
+    errors = []
+    if not allow_overlap and index.employee_overlaps(employee_id, start, end):
+        errors.append("This PTO overlaps PTO already booked for this employee.")
+    if max_people_out:
+        team = index.team_of(conn, employee_id)
+        already_out = index.max_team_out(team, start, end)
+        if already_out + 1 > max_people_out:
+            who = f"team {team}" if team else "employees without a team"
+            errors.append(
+                f"Too many people out: {already_out} from {who} already have PTO "
+                f"on at least one of these days (limit {max_people_out})."
+            )
+    return errors
+
+
+def find_conflicts(conn, employee_id, start_date, end_date, max_people_out=None,
+                   allow_overlap=False):
+    """Reasons a new entry for employee_id over the dates can't be booked."""
+    start, end = _ordinals(start_date, end_date)
+    with _lock:
+        index = get_index(conn)
+        return _conflicts(index, conn, employee_id, start, end, max_people_out, allow_overlap)
+
+
+class BulkBooking:
+    """
+    Conflict checks for many entries written in one transaction.
+
+    Each accepted entry is added to the index straight away so later rows
+    in the same batch are checked against it. Use via bulk_booking().
+    """
+
+    def __init__(self, index, conn, max_people_out, allow_overlap):
+        self.index = index
+        self.conn = conn
+        self.max_people_out = max_people_out
+        self.allow_overlap = allow_overlap
+
+    def try_add(self, entry_id, employee_id, start_date, end_date):
+        """Add the entry and return [] if it fits; otherwise return the reasons."""
+        start, end = _ordinals(start_date, end_date)
+        errors = _conflicts(
+            self.index, self.conn, employee_id, start, end, self.max_people_out, self.allow_overlap
+        )
+        if not errors:
+            self.index.team_of(self.conn, employee_id)
+            self.index._add(entry_id, employee_id, start, end)
+        return errors
+
+
+@contextmanager
+def bulk_booking(conn, max_people_out=None, allow_overlap=False):
+    """
+    Hold the index for a bulk insert inside a write transaction.
+
+    The index is marked stale while entries are added, and re-tagged with
+    the post-insert counter versions only if the block finishes cleanly; an
+    exception (including a retried lock error), or the transaction rolling
+    back afterwards, leaves it to be rebuilt.
+    """
+    with _lock:
+        index = get_index(conn)
+        index.version = None
+        db.on_rollback(reset)
+        yield BulkBooking(index, conn, max_people_out, allow_overlap)
+        index.version = change_counters.versions(conn, *COUNTERS)
+        index.event_id = change_feed.latest_id(conn)
+
+
+def reset():
+    with _lock:
+        _index.version = None
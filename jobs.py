@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+"""
+Durable background jobs for admin operations too big for one request.
+
+A job is a row in the jobs table. Routes enqueue() it inside their own
+write, so the job exists exactly when the change that needs it commits,
+call notify() once it has, and return at once. A pool of worker threads,
+each with its own connection, claims queued jobs and runs their handler.
+
+Handlers work in chunks, one write transaction each, and record progress
+with job.checkpoint() inside the same transaction. A cursor saved with the
+progress lets a retried job pick up after the last committed chunk instead
+of starting over. A job that raises is retried with exponential backoff
+until max_attempts, then marked failed; failed jobs can be retried from
+/admin/jobs or the CLI. A running job whose worker stops checkpointing for
+JOB_LEASE seconds is handed to another worker.
+
+Handlers are registered with @handler("kind") and receive (conn, job).
+
+Usage:
+    python jobs.py work [--workers 2]
+    python jobs.py list
+    python jobs.py retry JOB_ID
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from flask import current_app, has_app_context
+
+import db
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+DB_PATH = BASE_DIR / "pto_tracker.db"
+
+STATUSES = ("queued", "running", "succeeded", "failed")
+JOB_CHUNK_SIZE = 1000  # employees per transaction
+
+DEFAULT_CONFIG = {
+    "JOB_WORKERS": 2,            # worker threads per process; 0 to run them elsewhere (jobs.py work)
+    "JOB_POLL_INTERVAL": 2.0,    # seconds between looks at an empty queue
+    "JOB_MAX_ATTEMPTS": 3,
+    "JOB_RETRY_DELAY": 10.0,     # seconds before the first retry; doubles each attempt
+    "JOB_LEASE": 300.0,          # seconds without a checkpoint before a running job is reclaimed
+}
+
+HANDLERS = {}
+
+
+def handler(kind):
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+class Job:
+    def __init__(self, row):
+        self.id = row["id"]
+        self.kind = row["kind"]
+        self.params = json.loads(row["params"])
+        self.cursor = row["cursor"]
+        self.progress_done = row["progress_done"]
+        self.progress_total = row["progress_total"]
+        self.attempts = row["attempts"]
+
+    def checkpoint(self, conn, cursor=None, done=None, total=None):
+        """Record progress inside the chunk's transaction; also renews the lease."""
+        if cursor is not None:
+            self.cursor = cursor
+        if done is not None:
+            self.progress_done = done
+        if total is not None:
+            self.progress_total = total
+        conn.execute(
+            """
+            UPDATE jobs
+            SET cursor = ?, progress_done = ?, progress_total = ?, locked_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            """,
+            (self.cursor, self.progress_done, self.progress_total, self.id),
+        )
+
+
+# --- Queue ---
+
+def enqueue(conn, kind, params=None, manager_id=None, max_attempts=None):
+    """Queue a job inside the caller's write and return its id."""
+    if kind not in HANDLERS:
+        raise ValueError(f"unknown job kind {kind!r}")
+    if max_attempts is None:
+        config = current_app.config if has_app_context() else DEFAULT_CONFIG
+        max_attempts = config["JOB_MAX_ATTEMPTS"]
+    job_id = conn.execute(
+        """
+        INSERT INTO jobs (kind, params, max_attempts, created_by_manager_id)
+        VALUES (?, ?, ?, ?)
+        """,
+        (kind, json.dumps(params or {}), max_attempts, manager_id),
+    ).lastrowid
+    return job_id
+
+
+def notify():
+    """Wake this process's idle workers; call after the enqueueing write commits."""
+    _wake.set()
+
+
+def claim(conn, worker_name, lease=DEFAULT_CONFIG["JOB_LEASE"]):
+    """Mark the next due job running for this worker and return it, or None."""
+
+    def take(conn):
+        # Jobs whose worker went away: requeue, or fail if out of attempts.
+        conn.execute(
+            """
+            UPDATE jobs
+            SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                error = 'Worker stopped responding.',
+                finished_at = CASE WHEN attempts >= max_attempts THEN CURRENT_TIMESTAMP END,
+                locked_by = NULL
+            WHERE status = 'running' AND locked_at < datetime('now', ?)
+            """,
+            (f"-{int(lease)} seconds",),
+        )
+        row = conn.execute(
+            """
+            SELECT * FROM jobs
+            WHERE status = 'queued' AND run_after <= CURRENT_TIMESTAMP
+            ORDER BY run_after, id
+            LIMIT 1
+            """
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            """
+            UPDATE jobs
+            SET status = 'running', attempts = attempts + 1, locked_by = ?,
+                locked_at = CURRENT_TIMESTAMP, started_at = COALESCE(started_at, CURRENT_TIMESTAMP)
+            WHERE id = ?
+            """,
+            (worker_name, row["id"]),
+        )
+        return Job(conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+
+    return db.run_write(conn, take)
+
+
+def execute(conn, job, retry_delay=DEFAULT_CONFIG["JOB_RETRY_DELAY"]):
+    """Run a claimed job's handler and record how it went."""
+    try:
+        HANDLERS[job.kind](conn, job)
+    except Exception as exc:
+        logger.exception("Job #%s (%s) failed on attempt %s", job.id, job.kind, job.attempts)
+        if conn.in_transaction:
+            conn.rollback()
+        delay = retry_delay * 2 ** (job.attempts - 1)
+        db.run_write(
+            conn,
+            lambda conn: conn.execute(
+                """
+                UPDATE jobs
+                SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                    finished_at = CASE WHEN attempts >= max_attempts THEN CURRENT_TIMESTAMP END,
+                    run_after = datetime('now', ?), error = ?, locked_by = NULL
+                WHERE id = ?
+                """,
+                (f"+{int(delay)} seconds", f"{type(exc).__name__}: {exc}", job.id),
+            ),
+        )
+        return False
+    db.run_write(
+        conn,
+        lambda conn: conn.execute(
+            """
+            UPDATE jobs
+            SET status = 'succeeded', finished_at = CURRENT_TIMESTAMP, error = NULL, locked_by = NULL
+            WHERE id = ?
+            """,
+            (job.id,),
+        ),
+    )
+    return True
+
+
+def run_pending(conn, worker_name="inline"):
+    """Run due jobs in this thread until the queue is empty. Returns how many ran."""
+    count = 0
+    while True:
+        job = claim(conn, worker_name)
+        if job is None:
+            return count
+        execute(conn, job)
+        count += 1
+
+
+def retry(conn, job_id):
+    """Queue a failed job again with a fresh set of attempts. Returns False if it isn't failed."""
+    def requeue(conn):
+        return conn.execute(
+            """
+            UPDATE jobs
+            SET status = 'queued', attempts = 0, run_after = CURRENT_TIMESTAMP, finished_at = NULL
+            WHERE id = ? AND status = 'failed'
+            """,
+            (job_id,),
+        ).rowcount > 0
+
+    requeued = db.run_write(conn, requeue)
+    if requeued:
+        notify()
+    return requeued
+
+
+def cancel_for_pto_type(conn, pto_type_id, reason="PTO type deleted"):
+    """
+    Fail the queued and failed jobs for a PTO type, inside the caller's
+    write. A running one stops at its next chunk when it finds the type
+    gone. Returns how many were cancelled.
+    """
+    return conn.execute(
+        """
+        UPDATE jobs
+        SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP, locked_by = NULL,
+            attempts = max_attempts
+        WHERE kind IN ('pto_type_balances', 'pto_type_allotments')
+            AND status IN ('queued', 'failed')
+            AND json_extract(params, '$.pto_type_id') = ?
+        """,
+        (reason, pto_type_id),
+    ).rowcount
+
+
+def get_job(conn, job_id):
+    return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+def recent_jobs(conn, limit=100):
+    return conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+
+
+# --- Workers ---
+
+# Set when a job is queued so idle workers in this process look right away.
+_wake = threading.Event()
+
+
+class Worker(threading.Thread):
+    """Daemon thread that claims and runs jobs until stopped."""
+
+    def __init__(self, db_path, name, config, pragmas=None):
+        super().__init__(name=name, daemon=True)
+        self.db_path = db_path
+        self.config = config
+        self.pragmas = pragmas
+        self._stop_event = threading.Event()
+
+    def run(self):
+        conn = db.connect(self.db_path, self.pragmas)
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    job = claim(conn, self.name, self.config["JOB_LEASE"])
+                except Exception:
+                    logger.exception("Claiming a job failed")
+                    job = None
+                if job is None:
+                    _wake.wait(self.config["JOB_POLL_INTERVAL"])
+                    _wake.clear()
+                    continue
+                execute(conn, job, self.config["JOB_RETRY_DELAY"])
+        finally:
+            conn.close()
+
+    def stop(self):
+        self._stop_event.set()
+        _wake.set()
+
+
+def start_workers(db_path, count, config, pragmas=None):
+    settings = {**DEFAULT_CONFIG, **config}
+    prefix = f"job-worker-{os.getpid()}"
+    workers = [Worker(db_path, f"{prefix}-{n}", settings, pragmas) for n in range(count)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+_workers_lock = threading.Lock()
+
+
+def ensure_workers(app=None):
+    """Start this app's worker threads on first use."""
+    app = app or current_app
+    if "job_workers" in app.extensions:
+        return
+    with _workers_lock:
+        if "job_workers" not in app.extensions:
+            config = app.config
+            app.extensions["job_workers"] = start_workers(
+                config["DATABASE"], config["JOB_WORKERS"],
+                {key: config[key] for key in DEFAULT_CONFIG}, db.storage_pragmas(config),
+            )
+
+
+def _reset_after_fork(app):
+    """In a forked child: the parent's worker threads didn't come along; start our own on first use."""
+    global _wake, _workers_lock
+    _wake = threading.Event()
+    _workers_lock = threading.Lock()
+    inherited = app.extensions.pop("job_workers", None)
+    if inherited:
+        # Their connections are the parent's; keep them referenced, never closed.
+        db._inherited.append(inherited)
+
+
+def init_app(app):
+    for key, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(key, value)
+    app.before_request(lambda: ensure_workers(app))
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=lambda: _reset_after_fork(app))
+
+
+# --- Handlers ---
+
+def _pto_type_exists(conn, pto_type_id):
+    return conn.execute("SELECT 1 FROM pto_types WHERE id = ?", (pto_type_id,)).fetchone() is not None
+
+
+def _employee_chunks(conn, sql, params, after):
+    """Yield lists of employee ids from sql (which takes params + after id + limit) in id order."""
+    while True:
+        ids = [row[0] for row in conn.execute(sql, (*params, after, JOB_CHUNK_SIZE))]
+        if not ids:
+            return
+        yield ids
+        after = ids[-1]
+
+
+@handler("pto_type_balances")
+def create_pto_type_balances(conn, job):
+    """Give every active employee a balance of a new PTO type at its default hours."""
+    import balance_cache
+    import change_feed
+    import ledger
+
+    pto_type_id = job.params["pto_type_id"]
+    hours = job.params["default_hours"]
+    if job.progress_total is None:
+        total = conn.execute("SELECT COUNT(*) FROM employees WHERE status = 'active'").fetchone()[0]
+        db.run_write(conn, lambda conn: job.checkpoint(conn, total=total))
+
+    chunks = _employee_chunks(
+        conn,
+        "SELECT id FROM employees WHERE status = 'active' AND id > ? ORDER BY id LIMIT ?",
+        (), job.cursor,
+    )
+    for ids in chunks:
+        done = job.progress_done + len(ids)
+
+        def write_chunk(conn):
+            if not _pto_type_exists(conn, pto_type_id):
+                return False  # deleted since the job was queued
+            # Employees added since the job was queued already have one.
+            missing = [
+                row[0] for row in conn.execute(
+                    f"""
+                    SELECT e.id FROM employees e
+                    WHERE e.id IN ({", ".join("?" * len(ids))})
+                        AND NOT EXISTS (
+                            SELECT 1 FROM pto_balances b
+                            WHERE b.employee_id = e.id AND b.pto_type_id = ?
+                        )
+                    """,
+                    (*ids, pto_type_id),
+                )
+            ]
+            with balance_cache.invalidating(conn, missing):
+                conn.executemany(
+                    """
+                    INSERT INTO pto_balances (employee_id, pto_type_id, hours_allotted, hours_used)
+                    VALUES (?, ?, ?, 0.0)
+                    """,
+                    [(employee_id, pto_type_id, hours) for employee_id in missing],
+                )
+            ledger.post(conn, [
+                {"employee_id": employee_id, "pto_type_id": pto_type_id, "kind": "opening",
+                 "allotted_delta": hours}
+                for employee_id in missing
+            ])
+            change_feed.record_type_balances(conn, pto_type_id, missing, hours, hours_used=0.0)
+            job.checkpoint(conn, cursor=ids[-1], done=done)
+            return True
+
+        if not db.run_write(conn, write_chunk):
+            return
+
+
+@handler("pto_type_allotments")
+def reset_pto_type_allotments(conn, job):
+    """Set every balance of a PTO type to the same allotment."""
+    import balance_cache
+    import change_feed
+    import ledger
+
+    pto_type_id = job.params["pto_type_id"]
+    hours = job.params["hours"]
+    if job.progress_total is None:
+        total = conn.execute(
+            "SELECT COUNT(*) FROM pto_balances WHERE pto_type_id = ?", (pto_type_id,)
+        ).fetchone()[0]
+        db.run_write(conn, lambda conn: job.checkpoint(conn, total=total))
+
+    chunks = _employee_chunks(
+        conn,
+        """
+        SELECT employee_id FROM pto_balances
+        WHERE pto_type_id = ? AND employee_id > ?
+        ORDER BY employee_id
+        LIMIT ?
+        """,
+        (pto_type_id,), job.cursor,
+    )
+    for ids in chunks:
+        first, last = ids[0], ids[-1]
+        done = job.progress_done + len(ids)
+
+        def write_chunk(conn):
+            if not _pto_type_exists(conn, pto_type_id):
+                return False
+            ledger.post_allotment_changes(
+                conn, pto_type_id, hours, manager_id=job.params.get("manager_id"),
+                note=job.params.get("note"), employee_range=(first, last),
+            )
+            with balance_cache.invalidating(conn, ids):
+                conn.execute(
+                    """
+                    UPDATE pto_balances
+                    SET hours_allotted = ?
+                    WHERE pto_type_id = ? AND employee_id BETWEEN ? AND ?
+                    """,
+                    (hours, pto_type_id, first, last),
+                )
+            change_feed.record_type_balances(conn, pto_type_id, ids, hours)
+            job.checkpoint(conn, cursor=last, done=done)
+            return True
+
+        if not db.run_write(conn, write_chunk):
+            return
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Background job queue.")
+    parser.add_argument("--db", default=str(DB_PATH), help="path to the SQLite database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    work_cmd = commands.add_parser("work", help="run worker threads until interrupted")
+    work_cmd.add_argument("--workers", type=int, default=DEFAULT_CONFIG["JOB_WORKERS"])
+    commands.add_parser("list", help="show recent jobs")
+    retry_cmd = commands.add_parser("retry", help="queue a failed job again")
+    retry_cmd.add_argument("job_id", type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "work":
+        workers = start_workers(args.db, args.workers, {})
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.stop()
+            for worker in workers:
+                worker.join()
+        return 0
+
+    conn = db.connect(args.db)
+    try:
+        if args.command == "list":
+            for job in recent_jobs(conn):
+                total = job["progress_total"]
+                progress = f"{job['progress_done']}/{total}" if total is not None else "-"
+                print(
+                    f"#{job['id']} {job['kind']} {job['status']} {progress} "
+                    f"attempt {job['attempts']}/{job['max_attempts']}"
+                    f"{': ' + job['error'] if job['error'] else ''}"
+                )
+        else:
+            if not retry(conn, args.job_id):
+                print(f"Job #{args.job_id} isn't a failed job.")
+                return 1
+            print(f"Queued job #{args.job_id} again.")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Append-only balance ledger with snapshot checkpoints.
+
+Every change to an allotment or to hours used is recorded in
+balance_ledger as a row of deltas:
+
+    opening     balance created (new employee, new PTO type, backfill)
+    accrual     hours earned by an accrual run
+    usage       a PTO entry was booked
+    reversal    a PTO entry was deleted
+    adjustment  an admin changed the allotment
+
+pto_balances stays as the current balance every page reads. The ledger is
+the record it can be checked against and rebuilt from.
+
+balance_snapshots holds per-(employee, type) totals as of a date, written
+by checkpoint(). A balance as of date X is the latest snapshot on or
+before X plus the ledger rows after it, so lookups never sum the whole
+history. Posting a row dated on or before an existing snapshot drops the
+snapshots it would make wrong.
+
+Usage:
+    python ledger.py checkpoint [--as-of 2025-06-30]
+    python ledger.py reconcile [--fix]
+    python ledger.py balance EMPLOYEE_ID [--as-of 2025-06-30]
+"""
+import argparse
+from datetime import date
+from pathlib import Path
+
+import db
+
+BASE_DIR = Path(__file__).resolve().parent
+DB_PATH = BASE_DIR / "pto_tracker.db"
+
+KINDS = ("opening", "accrual", "usage", "reversal", "adjustment")
+CHECKPOINT_BATCH_SIZE = 1000  # employees per transaction
+END_OF_TIME = "9999-12-31"
+EPSILON = 1e-6
+
+
+def post(conn, rows):
+    """
+    Append ledger rows inside the caller's write.
+
+    rows are dicts with employee_id, pto_type_id, kind and optionally
+    allotted_delta, used_delta, effective_date (default today), entry_id,
+    period, note and manager_id.
+    """
+    today = date.today().isoformat()
+    values = [
+        (
+            r["employee_id"], r["pto_type_id"], r["kind"],
+            r.get("allotted_delta", 0.0), r.get("used_delta", 0.0),
+            r.get("effective_date") or today, r.get("entry_id"), r.get("period"),
+            r.get("note"), r.get("manager_id"),
+        )
+        for r in rows
+    ]
+    if not values:
+        return
+    conn.executemany(
+        """
+        INSERT INTO balance_ledger
+            (employee_id, pto_type_id, kind, allotted_delta, used_delta, effective_date,
+             entry_id, period, note, created_by_manager_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        values,
+    )
+    conn.executemany(
+        """
+        DELETE FROM balance_snapshots
+        WHERE employee_id = ? AND pto_type_id = ? AND as_of >= ?
+        """,
+        {(v[0], v[1], v[5]) for v in values},
+    )
+
+
+def post_openings(conn, where_sql, params=()):
+    """
+    Record opening rows for balances just inserted into pto_balances, chosen
+    by a WHERE clause on pto_balances (e.g. "employee_id = ?").
+    """
+    today = date.today().isoformat()
+    conn.execute(
+        f"""
+        INSERT INTO balance_ledger
+            (employee_id, pto_type_id, kind, allotted_delta, used_delta, effective_date)
+        SELECT employee_id, pto_type_id, 'opening', hours_allotted, hours_used, ?
+        FROM pto_balances
+        WHERE {where_sql}
+        """,
+        (today, *params),
+    )
+
+
+def post_allotment_changes(conn, pto_type_id, new_hours, manager_id=None, note=None,
+                           employee_range=None):
+    """
+    Adjustment rows for setting every balance of a type to new_hours (before
+    the UPDATE), or only those of employees in employee_range (first, last).
+    """
+    today = date.today().isoformat()
+    range_sql = "AND employee_id BETWEEN ? AND ?" if employee_range else ""
+    range_params = tuple(employee_range or ())
+    conn.execute(
+        f"""
+        INSERT INTO balance_ledger
+            (employee_id, pto_type_id, kind, allotted_delta, effective_date, note, created_by_manager_id)
+        SELECT employee_id, pto_type_id, 'adjustment', ? - hours_allotted, ?, ?, ?
+        FROM pto_balances
+        WHERE pto_type_id = ? AND hours_allotted <> ? {range_sql}
+        """,
+        (new_hours, today, note, manager_id, pto_type_id, new_hours, *range_params),
+    )
+    conn.execute(
+        f"DELETE FROM balance_snapshots WHERE pto_type_id = ? AND as_of >= ? {range_sql}",
+        (pto_type_id, today, *range_params),
+    )
+
+
+# --- Reads ---
+
+_BALANCES_AS_OF = """
+    WITH latest AS (
+        SELECT employee_id, pto_type_id, MAX(as_of) AS as_of
+        FROM balance_snapshots
+        WHERE as_of <= :as_of {snapshot_filter}
+        GROUP BY employee_id, pto_type_id
+    ),
+    base AS (
+        SELECT s.employee_id, s.pto_type_id, s.as_of, s.hours_allotted, s.hours_used
+        FROM balance_snapshots s
+        JOIN latest USING (employee_id, pto_type_id, as_of)
+    ),
+    deltas AS (
+        SELECT
+            l.employee_id, l.pto_type_id,
+            SUM(l.allotted_delta) AS allotted, SUM(l.used_delta) AS used
+        FROM balance_ledger l
+        LEFT JOIN latest ON latest.employee_id = l.employee_id AND latest.pto_type_id = l.pto_type_id
+        WHERE l.effective_date <= :as_of
+            AND l.effective_date > COALESCE(latest.as_of, '')
+            {ledger_filter}
+        GROUP BY l.employee_id, l.pto_type_id
+    ),
+    balance_keys AS (
+        SELECT employee_id, pto_type_id FROM base
+        UNION
+        SELECT employee_id, pto_type_id FROM deltas
+    )
+    SELECT
+        k.employee_id, k.pto_type_id,
+        COALESCE(b.hours_allotted, 0) + COALESCE(d.allotted, 0) AS hours_allotted,
+        COALESCE(b.hours_used, 0) + COALESCE(d.used, 0) AS hours_used
+    FROM balance_keys k
+    LEFT JOIN base b ON b.employee_id = k.employee_id AND b.pto_type_id = k.pto_type_id
+    LEFT JOIN deltas d ON d.employee_id = k.employee_id AND d.pto_type_id = k.pto_type_id
+"""
+
+
+def _balances_query(employee_filter):
+    """The as-of query, optionally limited by a filter on employee_id."""
+    return _BALANCES_AS_OF.format(
+        snapshot_filter=f"AND {employee_filter}" if employee_filter else "",
+        ledger_filter=f"AND l.{employee_filter}" if employee_filter else "",
+    )
+
+
+def balances_as_of(conn, employee_id, as_of=None):
+    """
+    {pto_type_id: (hours_allotted, hours_used)} for an employee as of a date
+    (inclusive). as_of=None means including everything booked so far,
+    future-dated PTO too, which is what pto_balances holds.
+    """
+    as_of = as_of.isoformat() if isinstance(as_of, date) else (as_of or END_OF_TIME)
+    rows = conn.execute(
+        _balances_query("employee_id = :employee_id"),
+        {"as_of": as_of, "employee_id": employee_id},
+    ).fetchall()
+    return {row["pto_type_id"]: (row["hours_allotted"], row["hours_used"]) for row in rows}
+
+
+# --- Maintenance ---
+
+def checkpoint(conn, as_of=None, verbose=False):
+    """
+    Write snapshots of every balance as of a date (default today), a batch
+    of employees per transaction. Returns the number of snapshots written.
+    """
+    as_of = (as_of or date.today()).isoformat()
+    total = 0
+    last_employee_id = 0
+    while True:
+        employee_ids = [
+            row[0] for row in conn.execute(
+                """
+                SELECT DISTINCT employee_id FROM balance_ledger
+                WHERE employee_id > ?
+                ORDER BY employee_id
+                LIMIT ?
+                """,
+                (last_employee_id, CHECKPOINT_BATCH_SIZE),
+            )
+        ]
+        if not employee_ids:
+            break
+        first, last = employee_ids[0], employee_ids[-1]
+
+        def write_batch(conn):
+            return conn.execute(
+                f"""
+                INSERT OR REPLACE INTO balance_snapshots
+                    (employee_id, pto_type_id, as_of, hours_allotted, hours_used)
+                SELECT employee_id, pto_type_id, :as_of, hours_allotted, hours_used
+                FROM ({_balances_query("employee_id BETWEEN :first AND :last")})
+                """,
+                {"as_of": as_of, "first": first, "last": last},
+            ).rowcount
+
+        total += db.run_write(conn, write_batch)
+        last_employee_id = last
+        if verbose:
+            print(f"Checkpointed balances for employees up to #{last}...")
+    return total
+
+
+def drift(conn):
+    """Balances where pto_balances and the ledger disagree."""
+    return conn.execute(
+        f"""
+        SELECT
+            b.employee_id, b.pto_type_id,
+            b.hours_allotted, b.hours_used,
+            COALESCE(l.hours_allotted, 0) AS ledger_allotted,
+            COALESCE(l.hours_used, 0) AS ledger_used
+        FROM pto_balances b
+        LEFT JOIN ({_balances_query("")}) l
+            ON l.employee_id = b.employee_id AND l.pto_type_id = b.pto_type_id
+        WHERE abs(b.hours_allotted - COALESCE(l.hours_allotted, 0)) > {EPSILON}
+            OR abs(b.hours_used - COALESCE(l.hours_used, 0)) > {EPSILON}
+        ORDER BY b.employee_id, b.pto_type_id
+        """,
+        {"as_of": END_OF_TIME},
+    ).fetchall()
+
+
+def reconcile(conn, fix=False):
+    """
+    Find balances that drifted from the ledger and, with fix=True, reset
+    them to the ledger's totals in one statement. Returns the drifted rows.
+    """
+    rows = drift(conn)
+    if fix and rows:
+        import balance_cache
+
+        def apply_fix(conn):
+            with balance_cache.invalidating(conn, {row["employee_id"] for row in rows}):
+                conn.executemany(
+                    """
+                    UPDATE pto_balances
+                    SET hours_allotted = ?, hours_used = ?
+                    WHERE employee_id = ? AND pto_type_id = ?
+                    """,
+                    [
+                        (row["ledger_allotted"], row["ledger_used"], row["employee_id"], row["pto_type_id"])
+                        for row in rows
+                    ],
+                )
+
+        db.run_write(conn, apply_fix)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Balance ledger maintenance.")
+    parser.add_argument("--db", default=str(DB_PATH), help="path to the SQLite database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    checkpoint_cmd = commands.add_parser("checkpoint", help="snapshot every balance as of a date")
+    checkpoint_cmd.add_argument("--as-of", help="YYYY-MM-DD (default today)")
+    reconcile_cmd = commands.add_parser("reconcile", help="compare pto_balances with the ledger")
+    reconcile_cmd.add_argument("--fix", action="store_true", help="reset drifted balances to the ledger")
+    balance_cmd = commands.add_parser("balance", help="an employee's balances as of a date")
+    balance_cmd.add_argument("employee_id", type=int)
+    balance_cmd.add_argument("--as-of", help="YYYY-MM-DD (default: everything booked)")
+    args = parser.parse_args()
+
+    conn = db.connect(args.db)
+    try:
+        if args.command == "checkpoint":
+            as_of = date.fromisoformat(args.as_of) if args.as_of else None
+            total = checkpoint(conn, as_of, verbose=True)
+            print(f"Wrote {total} snapshot(s).")
+        elif args.command == "reconcile":
+            rows = reconcile(conn, fix=args.fix)
+            for row in rows:
+                print(
+                    f"employee {row['employee_id']} type {row['pto_type_id']}: "
+                    f"balance {row['hours_allotted']:g}/{row['hours_used']:g}, "
+                    f"ledger {row['ledger_allotted']:g}/{row['ledger_used']:g}"
+                )
+            print(f"{len(rows)} drifted balance(s){' fixed' if args.fix and rows else ''}.")
+            return 2 if rows and not args.fix else 0
+        else:
+            for pto_type_id, (allotted, used) in sorted(balances_as_of(conn, args.employee_id, args.as_of).items()):
+                print(f"type {pto_type_id}: allotted {allotted:g}, used {used:g}, remaining {allotted - used:g}")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations.
+
+Each migration has a version number and is applied at most once; applied
+versions are recorded in the schema_version table. Migrations are also
+written to be safe on databases that already have the change (for example
+ones that ran the old one-off migrate_add_default_hours.py script).
+
+Usage:
+    python migrations.py              # apply pending migrations
+    python migrations.py --dry-run    # apply in a transaction, then roll back
+    python migrations.py --db other.db
+"""
+import argparse
+import sqlite3
+from collections import namedtuple
+from pathlib import Path
+
+import db
+
+BASE_DIR = Path(__file__).resolve().parent
+DB_PATH = BASE_DIR / "pto_tracker.db"
+
+Migration = namedtuple("Migration", ["version", "name", "apply"])
+
+MIGRATIONS = []
+
+
+def migration(version, name):
+    def decorator(fn):
+        MIGRATIONS.append(Migration(version, name, fn))
+        return fn
+    return decorator
+
+
+def column_names(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table});")}
+
+
+# --- Migrations (append only; never renumber) ---
+
+@migration(1, "Add pto_types.default_hours")
+def add_default_hours(conn):
+    if "default_hours" not in column_names(conn, "pto_types"):
+        conn.execute("ALTER TABLE pto_types ADD COLUMN default_hours REAL NOT NULL DEFAULT 40;")
+
+
+@migration(2, "Indexes for calendar, PTO history and employee list queries")
+def add_hot_path_indexes(conn):
+    # calendar_view: start_date <= month_end AND end_date >= month_start.
+    # Leading with end_date keeps the range scan to entries that haven't
+    # ended yet, which stays small as history grows; the trailing columns
+    # let the join to pto_types/employees run without touching the table.
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_pto_entries_end_start
+        ON pto_entries (end_date, start_date, employee_id, pto_type_id, hours)
+        """
+    )
+    # employee_detail history (WHERE employee_id = ? ORDER BY start_date DESC)
+    # and the per-employee calendar filter.
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_pto_entries_employee_start
+        ON pto_entries (employee_id, start_date)
+        """
+    )
+    # "Is this PTO type in use?" check before deleting a type.
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_pto_entries_type ON pto_entries (pto_type_id)"
+    )
+    # Active employee lists ordered by name; id rides along as the rowid,
+    # so the dropdown queries are answered from the index alone.
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_employees_status_name
+        ON employees (status, last_name, first_name)
+        """
+    )
+
+
+@migration(3, "Holiday calendars")
+def add_holiday_calendars(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS holiday_calendars (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            is_default INTEGER NOT NULL DEFAULT 0 CHECK (is_default IN (0,1)),
+            version INTEGER NOT NULL DEFAULT 1
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS holiday_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            calendar_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            kind TEXT NOT NULL CHECK (kind IN ('fixed', 'nth_weekday', 'last_weekday', 'date')),
+            month INTEGER CHECK (month BETWEEN 1 AND 12),
+            day INTEGER CHECK (day BETWEEN 1 AND 31),
+            weekday INTEGER CHECK (weekday BETWEEN 0 AND 6),
+            nth INTEGER CHECK (nth BETWEEN 1 AND 5),
+            holiday_date TEXT,
+            observed INTEGER NOT NULL DEFAULT 1 CHECK (observed IN (0,1)),
+            FOREIGN KEY (calendar_id) REFERENCES holiday_calendars(id) ON DELETE CASCADE
+        )
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_holiday_rules_calendar ON holiday_rules (calendar_id)"
+    )
+    # Start with an empty default calendar so PTO math is unchanged until
+    # an admin adds holidays to it.
+    conn.execute(
+        """
+        INSERT INTO holiday_calendars (name, is_default)
+        SELECT 'Company', 1
+        WHERE NOT EXISTS (SELECT 1 FROM holiday_calendars)
+        """
+    )
+
+
+@migration(4, "Per-day PTO occupancy table")
+def add_pto_days(conn):
+    import occupancy
+
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS pto_days (
+            entry_id INTEGER NOT NULL,
+            employee_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            hours REAL,
+            PRIMARY KEY (entry_id, day),
+            FOREIGN KEY (entry_id) REFERENCES pto_entries(id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+        """
+    )
+    # "Who is out on day X" / per-day counts, and per-employee day lookups.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pto_days_day ON pto_days (day, employee_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pto_days_employee ON pto_days (employee_id, day)")
+    occupancy.rebuild(conn)
+
+
+@migration(5, "Employee teams and change counters for PTO entries")
+def add_teams_and_change_counters(conn):
+    import change_counters
+
+    if "team" not in column_names(conn, "employees"):
+        conn.execute("ALTER TABLE employees ADD COLUMN team TEXT")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS change_counters (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT
+        )
+        """
+    )
+    change_counters.install(conn, "pto_entries", "pto_entries")
+    change_counters.install(
+        conn, "employee_teams", "employees", events=("UPDATE", "DELETE"), update_columns=("team",)
+    )
+
+
+@migration(6, "Index for exporting PTO entries in date order")
+def add_export_index(conn):
+    # exports.iter_entries pages through entries by (start_date, id); id is
+    # the rowid, so this index serves both the order and the keyset seek.
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_pto_entries_start ON pto_entries (start_date)"
+    )
+
+
+@migration(7, "Change counter for the PTO type catalog")
+def add_pto_types_counter(conn):
+    import change_counters
+
+    change_counters.install(conn, "pto_types", "pto_types")
+
+
+@migration(8, "Change counter for PTO balances")
+def add_pto_balances_counter(conn):
+    import change_counters
+
+    change_counters.install(conn, "pto_balances", "pto_balances")
+
+
+@migration(9, "Change counter for employees")
+def add_employees_counter(conn):
+    import change_counters
+
+    change_counters.install(conn, "employees", "employees")
+
+
+@migration(10, "Balance ledger and snapshots")
+def add_balance_ledger(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS balance_ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_id INTEGER NOT NULL,
+            pto_type_id INTEGER NOT NULL,
+            kind TEXT NOT NULL
+                CHECK (kind IN ('opening', 'accrual', 'usage', 'reversal', 'adjustment')),
+            allotted_delta REAL NOT NULL DEFAULT 0,
+            used_delta REAL NOT NULL DEFAULT 0,
+            effective_date TEXT NOT NULL,
+            entry_id INTEGER,
+            period TEXT,
+            note TEXT,
+            created_by_manager_id INTEGER,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (employee_id) REFERENCES employees(id),
+            FOREIGN KEY (pto_type_id) REFERENCES pto_types(id),
+            FOREIGN KEY (created_by_manager_id) REFERENCES managers(id)
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_balance_ledger_balance
+        ON balance_ledger (employee_id, pto_type_id, effective_date, allotted_delta, used_delta)
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS balance_snapshots (
+            employee_id INTEGER NOT NULL,
+            pto_type_id INTEGER NOT NULL,
+            as_of TEXT NOT NULL,
+            hours_allotted REAL NOT NULL,
+            hours_used REAL NOT NULL,
+            PRIMARY KEY (employee_id, pto_type_id, as_of)
+        ) WITHOUT ROWID
+        """
+    )
+
+    # Backfill: one usage row per existing entry, dated by its start, and an
+    # opening row per balance carrying the allotment and any used hours the
+    # entries don't explain.
+    conn.execute(
+        """
+        INSERT INTO balance_ledger
+            (employee_id, pto_type_id, kind, used_delta, effective_date, entry_id, created_by_manager_id)
+        SELECT employee_id, pto_type_id, 'usage', hours, start_date, id, created_by_manager_id
+        FROM pto_entries
+        WHERE hours IS NOT NULL
+        """
+    )
+    conn.execute(
+        """
+        INSERT INTO balance_ledger
+            (employee_id, pto_type_id, kind, allotted_delta, used_delta, effective_date, note)
+        SELECT
+            b.employee_id, b.pto_type_id, 'opening', b.hours_allotted,
+            b.hours_used - COALESCE((
+                SELECT SUM(e.hours) FROM pto_entries e
+                WHERE e.employee_id = b.employee_id AND e.pto_type_id = b.pto_type_id
+            ), 0),
+            COALESCE((SELECT MIN(start_date) FROM pto_entries), date('now')),
+            'Balance when the ledger was introduced'
+        FROM pto_balances b
+        """
+    )
+
+
+@migration(11, "Hire dates and accrual policies")
+def add_accrual_policies(conn):
+    if "hire_date" not in column_names(conn, "employees"):
+        conn.execute("ALTER TABLE employees ADD COLUMN hire_date TEXT")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS accrual_policies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pto_type_id INTEGER NOT NULL,
+            employment_type TEXT CHECK (employment_type IN ('hourly', 'salaried')),
+            min_years_service REAL NOT NULL DEFAULT 0,
+            frequency TEXT NOT NULL
+                CHECK (frequency IN ('weekly', 'biweekly', 'semimonthly', 'monthly', 'annual')),
+            hours_per_period REAL NOT NULL CHECK (hours_per_period >= 0),
+            max_balance REAL,
+            carry_over_cap REAL,
+            is_active INTEGER NOT NULL DEFAULT 1 CHECK (is_active IN (0,1)),
+            FOREIGN KEY (pto_type_id) REFERENCES pto_types(id)
+        )
+        """
+    )
+    # One accrual (or rollover) per balance per period: what makes runs
+    # safe to repeat.
+    conn.execute(
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_balance_ledger_period
+        ON balance_ledger (employee_id, pto_type_id, kind, period)
+        WHERE period IS NOT NULL
+        """
+    )
+
+
+@migration(12, "Background job queue")
+def add_jobs(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL DEFAULT '{}',
+            status TEXT NOT NULL DEFAULT 'queued'
+                CHECK (status IN ('queued', 'running', 'succeeded', 'failed')),
+            cursor INTEGER NOT NULL DEFAULT 0,
+            progress_done INTEGER NOT NULL DEFAULT 0,
+            progress_total INTEGER,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            error TEXT,
+            run_after TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            locked_by TEXT,
+            locked_at TEXT,
+            created_by_manager_id INTEGER,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            started_at TEXT,
+            finished_at TEXT,
+            FOREIGN KEY (created_by_manager_id) REFERENCES managers(id)
+        )
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, run_after, id)"
+    )
+
+
+@migration(13, "Change counters for PTO days and managers")
+def add_pto_days_and_manager_counters(conn):
+    import change_counters
+
+    # pto_days is rewritten in bulk when holidays change; a trigger would
+    # fire per row, so resync_upcoming_occupancy bumps this one by hand.
+    change_counters.install(conn, "pto_days", "pto_days", events=())
+    change_counters.install(conn, "managers", "managers")
+
+
+@migration(14, "Change feed events")
+def add_change_events(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS change_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            employee_id INTEGER,
+            start_date TEXT,
+            end_date TEXT,
+            payload TEXT NOT NULL DEFAULT '{}',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    # Streams read by id; pruning goes by age.
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_change_events_created ON change_events (created_at)"
+    )
+
+
+@migration(15, "Accrual policy start dates and progress")
+def add_accrual_policy_progress(conn):
+    columns = column_names(conn, "accrual_policies")
+    # A policy note on its accruals is "policy #<id>"; see accruals.run.
+    if "start_date" not in columns:
+        conn.execute("ALTER TABLE accrual_policies ADD COLUMN start_date TEXT")
+        # Existing policies accrue from their first posted period, or from now on.
+        conn.execute(
+            """
+            UPDATE accrual_policies
+            SET start_date = COALESCE(
+                (SELECT MIN(substr(l.period, instr(l.period, ':') + 1)) FROM balance_ledger l
+                 WHERE l.kind = 'accrual' AND l.note = 'policy #' || accrual_policies.id),
+                date('now')
+            )
+            """
+        )
+    if "posted_through" not in columns:
+        conn.execute("ALTER TABLE accrual_policies ADD COLUMN posted_through TEXT")
+        conn.execute(
+            """
+            UPDATE accrual_policies
+            SET posted_through = (
+                SELECT MAX(l.effective_date) FROM balance_ledger l
+                WHERE l.kind = 'accrual' AND l.note = 'policy #' || accrual_policies.id
+            )
+            """
+        )
+
+
+# --- Runner ---
+
+def ensure_version_table(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    if conn.in_transaction:
+        conn.commit()
+
+
+def applied_versions(conn):
+    return {row[0] for row in conn.execute("SELECT version FROM schema_version")}
+
+
+def pending_migrations(conn):
+    ensure_version_table(conn)
+    done = applied_versions(conn)
+    return [m for m in sorted(MIGRATIONS, key=lambda m: m.version) if m.version not in done]
+
+
+def migrate(conn, dry_run=False, verbose=True):
+    """
+    Apply pending migrations in version order, each in its own transaction.
+
+    With dry_run=True every pending migration is still executed, so errors
+    surface, but its transaction is rolled back instead of committed.
+
+    Returns the list of migrations that were (or would have been) applied.
+    """
+    pending = pending_migrations(conn)
+    if not pending:
+        if verbose:
+            print("Schema is up to date.")
+        return []
+
+    if dry_run:
+        # One transaction for the whole run so later migrations see the
+        # effect of earlier ones, then throw all of it away.
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for m in pending:
+                if verbose:
+                    print(f"[dry run] Applying {m.version:04d} {m.name}...")
+                m.apply(conn)
+        finally:
+            conn.rollback()
+        if verbose:
+            print(f"{len(pending)} migration(s) would be applied.")
+        return pending
+
+    for m in pending:
+        if verbose:
+            print(f"Applying {m.version:04d} {m.name}...")
+
+        def apply(conn, m=m):
+            m.apply(conn)
+            conn.execute(
+                "INSERT INTO schema_version (version, name) VALUES (?, ?)",
+                (m.version, m.name),
+            )
+
+        db.run_write(conn, apply)
+
+    if verbose:
+        print(f"{len(pending)} migration(s) applied.")
+    return pending
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply PTO tracker schema migrations.")
+    parser.add_argument("--db", default=str(DB_PATH), help="path to the SQLite database")
+    parser.add_argument("--dry-run", action="store_true", help="run pending migrations, then roll back")
+    args = parser.parse_args()
+
+    db_path = Path(args.db)
+    if not db_path.exists():
+        print(f"Database not found at {db_path}")
+        return 1
+
+    conn = db.connect(db_path)
+    try:
+        migrate(conn, dry_run=args.dry_run)
+    except sqlite3.Error as e:
+        print(f"Migration failed: {e}")
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Per-day PTO occupancy.
+
+pto_days holds one row per PTO entry per day it takes someone out: the
+working days in the entry's range (weekends and default-calendar holidays
+skipped), or every day of the range if it has no working days at all, so
+each entry has at least one row. Rows are keyed by day and by employee,
+which turns "who is out on X" and per-day staffing counts into index range
+reads instead of overlap scans over pto_entries.
+
+Rows are written by sync_entry() whenever an entry is inserted or edited
+(see entries.py) and disappear with the entry via ON DELETE CASCADE.
+
+Usage:
+    python occupancy.py --rebuild             # resync every entry
+    python occupancy.py --rebuild --since 2025-01-01
+"""
+import argparse
+from datetime import date, timedelta
+from pathlib import Path
+
+import db
+import holiday_calendar
+
+BASE_DIR = Path(__file__).resolve().parent
+DB_PATH = BASE_DIR / "pto_tracker.db"
+
+REBUILD_BATCH_SIZE = 500
+
+
+def entry_days(start_date, end_date, holidays=None):
+    """Days an entry from start_date to end_date takes someone out."""
+    days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+    if holidays is not None:
+        working = [d for d in days if holidays.is_working_day(d)]
+    else:
+        working = [d for d in days if d.weekday() < 5]
+    return working or days
+
+
+def day_rows(entry, holidays):
+    """pto_days rows for an entry row (id, employee_id, start_date, end_date, hours)."""
+    start_date = date.fromisoformat(entry["start_date"])
+    end_date = date.fromisoformat(entry["end_date"])
+    days = entry_days(start_date, end_date, holidays)
+    hours_per_day = entry["hours"] / len(days) if entry["hours"] is not None else None
+    return [(entry["id"], entry["employee_id"], d.isoformat(), hours_per_day) for d in days]
+
+
+def sync_entry(conn, entry_id, holidays=None):
+    """Rewrite pto_days for one entry; call inside the write that changed it."""
+    if holidays is None:
+        holidays = holiday_calendar.load_calendar(conn)
+    conn.execute("DELETE FROM pto_days WHERE entry_id = ?", (entry_id,))
+    entry = conn.execute(
+        "SELECT id, employee_id, start_date, end_date, hours FROM pto_entries WHERE id = ?",
+        (entry_id,),
+    ).fetchone()
+    if entry is None:
+        return
+    conn.executemany(
+        "INSERT INTO pto_days (entry_id, employee_id, day, hours) VALUES (?, ?, ?, ?)",
+        day_rows(entry, holidays),
+    )
+
+
+def rebuild(conn, since=None, verbose=False):
+    """
+    Resync pto_days for every entry ending on or after `since` (all entries
+    if None), in batches of REBUILD_BATCH_SIZE per transaction.
+    """
+    holidays = holiday_calendar.load_calendar(conn)
+    since = since.isoformat() if since else ""
+    last_id = 0
+    total = 0
+    while True:
+        entries = conn.execute(
+            """
+            SELECT id, employee_id, start_date, end_date, hours
+            FROM pto_entries
+            WHERE id > ? AND end_date >= ?
+            ORDER BY id
+            LIMIT ?
+            """,
+            (last_id, since, REBUILD_BATCH_SIZE),
+        ).fetchall()
+        if not entries:
+            break
+
+        def write_batch(conn, entries=entries):
+            conn.executemany(
+                "DELETE FROM pto_days WHERE entry_id = ?", [(e["id"],) for e in entries]
+            )
+            conn.executemany(
+                "INSERT INTO pto_days (entry_id, employee_id, day, hours) VALUES (?, ?, ?, ?)",
+                [row for e in entries for row in day_rows(e, holidays)],
+            )
+
+        if conn.in_transaction:
+            # Called from inside a larger write (e.g. a migration).
+            write_batch(conn)
+        else:
+            db.run_write(conn, write_batch)
+        last_id = entries[-1]["id"]
+        total += len(entries)
+        if verbose:
+            print(f"Synced {total} entries...")
+    return total
+
+
+def daily_counts(conn, start_date, end_date, employee_id=None):
+    """{ 'YYYY-MM-DD': number of people out } for days with anyone out."""
+    params = [start_date.isoformat(), end_date.isoformat()]
+    employee_sql = ""
+    if employee_id is not None:
+        employee_sql = "AND employee_id = ?"
+        params.append(employee_id)
+    rows = conn.execute(
+        f"""
+        SELECT day, COUNT(DISTINCT employee_id) AS people_out
+        FROM pto_days
+        WHERE day BETWEEN ? AND ?
+            {employee_sql}
+        GROUP BY day
+        """,
+        params,
+    ).fetchall()
+    return {row["day"]: row["people_out"] for row in rows}
+
+
+def who_is_out(conn, day, employee_id=None):
+    """Employees out on a given day, with the PTO type of each entry."""
+    params = [day.isoformat()]
+    employee_sql = ""
+    if employee_id is not None:
+        employee_sql = "AND d.employee_id = ?"
+        params.append(employee_id)
+    return conn.execute(
+        f"""
+        SELECT
+            emp.id AS employee_id,
+            emp.first_name AS emp_first,
+            emp.last_name AS emp_last,
+            pt.display_name AS pto_name,
+            d.hours,
+            e.start_date,
+            e.end_date
+        FROM pto_days d
+        JOIN pto_entries e ON e.id = d.entry_id
+        JOIN pto_types pt ON pt.id = e.pto_type_id
+        JOIN employees emp ON emp.id = d.employee_id
+        WHERE d.day = ?
+            {employee_sql}
+        ORDER BY emp.last_name, emp.first_name
+        """,
+        params,
+    ).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the pto_days occupancy table.")
+    parser.add_argument("--db", default=str(DB_PATH), help="path to the SQLite database")
+    parser.add_argument("--rebuild", action="store_true", help="resync pto_days from pto_entries")
+    parser.add_argument("--since", help="only entries ending on or after this date (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    if not args.rebuild:
+        parser.print_help()
+        return 1
+
+    conn = db.connect(args.db)
+    try:
+        since = date.fromisoformat(args.since) if args.since else None
+        total = rebuild(conn, since=since, verbose=True)
+        print(f"Rebuilt occupancy for {total} entries.")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
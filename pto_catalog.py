@@ -0,0 +1,85 @@
+"""
+In-process cache of the PTO type catalog.
+
+The catalog is tiny and almost never changes, but nearly every page needs
+it. It is loaded once per process and tagged with the pto_types change
+counter, which triggers bump on any write to pto_types (see
+change_counters.py). Each lookup costs one primary-key read of the
+counter. A write from another worker process shows up as a new version
+and the next lookup reloads. The admin routes also call invalidate() after
+their own writes.
+
+The returned lists and dicts are shared between requests; don't mutate them.
+"""
+import os
+import threading
+
+import change_counters
+
+COUNTER = "pto_types"
+
+
+class PtoTypeCatalog:
+    def __init__(self, version, rows):
+        self.version = version
+        # Admin order: active types first, then by name.
+        self.all = [dict(row) for row in rows]
+        self.active = [t for t in self.all if t["is_active"]]
+        self.by_id = {t["id"]: t for t in self.all}
+        self.by_code = {t["code"]: t for t in self.all}
+
+
+_catalog = None
+_lock = threading.Lock()
+
+
+def get_catalog(conn):
+    """The cached catalog, reloaded first if pto_types changed since it was built."""
+    global _catalog
+    # Read the version before the rows: a write landing in between leaves
+    # newer rows under an older tag, which only costs one extra reload.
+    version = change_counters.versions(conn, COUNTER)[0]
+    catalog = _catalog
+    if catalog is not None and catalog.version == version:
+        return catalog
+    with _lock:
+        if _catalog is None or _catalog.version != version:
+            rows = conn.execute(
+                """
+                SELECT id, code, display_name, is_active, default_hours
+                FROM pto_types
+                ORDER BY is_active DESC, display_name
+                """
+            ).fetchall()
+            _catalog = PtoTypeCatalog(version, rows)
+        return _catalog
+
+
+def active_types(conn):
+    """Active PTO types ordered by display name."""
+    return get_catalog(conn).active
+
+
+def all_types(conn):
+    return get_catalog(conn).all
+
+
+def get_type(conn, pto_type_id):
+    return get_catalog(conn).by_id.get(pto_type_id)
+
+
+def invalidate():
+    """Drop the cached catalog; call after writing to pto_types."""
+    global _catalog
+    with _lock:
+        _catalog = None
+
+
+def _reset_after_fork():
+    global _catalog, _lock
+    _lock = threading.Lock()
+    _catalog = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Read/write split: read-only pages and reports read from a replica so they
+don't compete with booking writes on the primary database.
+
+DB_READ_REPLICA picks the replica:
+
+    None        everything uses the primary (the default)
+    "readonly"  a separate pool of mode=ro connections to the primary
+                file. Never stale; reads can't take write locks or hold
+                slots in the main pool.
+    "snapshot"  a copy of the database at DB_SNAPSHOT_PATH, taken with
+                SQLite's online backup API every DB_SNAPSHOT_INTERVAL
+                seconds and opened immutable, so readers never touch the
+                primary's WAL or locks.
+
+Only GET and HEAD requests for DB_REPLICA_ENDPOINTS are routed, and the
+whole request then reads from the replica: change counters, ETags and
+cached fragments come from the same data as the page. Those endpoints
+must not write.
+
+A snapshot request goes to the primary instead when the snapshot is older
+than DB_REPLICA_MAX_STALENESS, or when the session wrote something after
+the snapshot was taken (run_write records the time in the session), so a
+manager always sees the PTO they just booked.
+
+Each worker refreshes the shared snapshot file when it's due; a copy is
+written next to it and renamed into place, so readers only ever see whole
+snapshots. With DB_SNAPSHOT_INTERVAL = 0, refresh from cron instead:
+
+    python read_replica.py snapshot [--db pto_tracker.db] [--out pto_tracker.db-snapshot]
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from flask import current_app, request, session
+
+import db
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+DB_PATH = BASE_DIR / "pto_tracker.db"
+
+DEFAULT_CONFIG = {
+    "DB_READ_REPLICA": None,           # None, "readonly" or "snapshot"
+    "DB_REPLICA_ENDPOINTS": (
+        "calendar_view",
+        "employees_list",
+        "admin_export_entries",
+        "admin_export_balances",
+        "api.calendar",
+        "api.employee_list",
+    ),
+    "DB_REPLICA_POOL_SIZE": 8,
+    "DB_SNAPSHOT_PATH": None,          # default: the database path + "-snapshot"
+    "DB_SNAPSHOT_INTERVAL": 30.0,      # seconds between refreshes; 0 to refresh from cron
+    "DB_REPLICA_MAX_STALENESS": 120.0,  # older snapshots aren't used
+}
+
+MODES = ("readonly", "snapshot")
+
+
+def read_pragmas(config):
+    """The storage pragmas that apply to a reader, plus query_only."""
+    pragmas = [
+        pragma for pragma in db.storage_pragmas(config)
+        if not pragma.startswith(("PRAGMA journal_mode", "PRAGMA synchronous", "PRAGMA wal_autocheckpoint"))
+    ]
+    return pragmas + ["PRAGMA query_only = ON;"]
+
+
+def snapshot_path(config):
+    return config["DB_SNAPSHOT_PATH"] or f"{config['DATABASE']}-snapshot"
+
+
+def take_snapshot(db_path, out_path, pragmas=None):
+    """Copy db_path to out_path with the backup API; returns the time the copy reflects."""
+    taken_at = time.time()
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    source = db.connect(db_path, pragmas)
+    target = sqlite3.connect(tmp_path)
+    try:
+        # One step: a single read transaction, so the copy is consistent.
+        # Under WAL, writers carry on while it runs.
+        source.backup(target)
+        target.execute("PRAGMA journal_mode = DELETE;")
+    finally:
+        target.close()
+        source.close()
+    # The mtime says which commits the snapshot includes: all of those
+    # before the copy began.
+    os.utime(tmp_path, (taken_at, taken_at))
+    os.replace(tmp_path, out_path)
+    return taken_at
+
+
+class ReadOnlyReplica:
+    """mode=ro connections to the primary file."""
+
+    def __init__(self, config):
+        uri = Path(config["DATABASE"]).resolve().as_uri() + "?mode=ro"
+        self.pool = _reader_pool(config, uri)
+
+    def current(self):
+        """(pool, time its data is from, or None for live)."""
+        return self.pool, None
+
+    def close(self):
+        self.pool.close_all()
+
+
+class SnapshotReplica:
+    """Immutable connections to the latest snapshot file."""
+
+    def __init__(self, config):
+        self.config = config
+        self.path = snapshot_path(config)
+        self._pool = None
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        """(pool, time its data is from), or (None, None) before the first snapshot."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None, None
+        stamp = (st.st_ino, st.st_mtime_ns)
+        with self._lock:
+            if stamp != self._stamp:
+                # A newer snapshot was renamed into place. Connections still
+                # out on the old one finish on it and close when released.
+                if self._pool is not None:
+                    self._pool.close_all()
+                uri = Path(self.path).resolve().as_uri() + "?mode=ro&immutable=1"
+                self._pool = _reader_pool(self.config, uri)
+                self._stamp = stamp
+            return self._pool, st.st_mtime
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.close_all()
+
+
+class SnapshotRefresher(threading.Thread):
+    """Daemon thread that retakes the snapshot once it's DB_SNAPSHOT_INTERVAL old."""
+
+    def __init__(self, config):
+        super().__init__(name="sqlite-snapshot", daemon=True)
+        self.db_path = config["DATABASE"]
+        self.path = snapshot_path(config)
+        self.interval = config["DB_SNAPSHOT_INTERVAL"]
+        self.pragmas = db.storage_pragmas(config)
+        self._stop_event = threading.Event()
+
+    def refresh_if_due(self):
+        try:
+            age = time.time() - os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            age = None
+        # Another worker may have just refreshed it.
+        if age is None or age >= self.interval:
+            take_snapshot(self.db_path, self.path, self.pragmas)
+
+    def run(self):
+        while True:
+            try:
+                self.refresh_if_due()
+            except (sqlite3.Error, OSError):
+                logger.exception("Taking a database snapshot failed")
+            if self._stop_event.wait(self.interval):
+                return
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def _reader_pool(config, uri):
+    return db.ConnectionPool(
+        uri,
+        size=config["DB_REPLICA_POOL_SIZE"],
+        timeout=config["DB_POOL_TIMEOUT"],
+        idle_timeout=config["DB_POOL_IDLE_TIMEOUT"],
+        health_check_interval=config["DB_POOL_HEALTH_CHECK_INTERVAL"],
+        pragmas=read_pragmas(config),
+        factory=config["DB_CONNECTION_FACTORY"],
+        uri=True,
+    )
+
+
+_init_lock = threading.Lock()
+
+
+def get_replica(app=None):
+    app = app or current_app
+    replica = app.extensions.get("sqlite_read_replica")
+    if replica is None:
+        with _init_lock:
+            replica = app.extensions.get("sqlite_read_replica")
+            if replica is None:
+                config = app.config
+                mode = config["DB_READ_REPLICA"]
+                if mode not in MODES:
+                    raise ValueError(f"DB_READ_REPLICA must be None or one of {', '.join(MODES)}; got {mode!r}.")
+                if mode == "readonly":
+                    replica = ReadOnlyReplica(config)
+                else:
+                    replica = SnapshotReplica(config)
+                    if config["DB_SNAPSHOT_INTERVAL"]:
+                        refresher = SnapshotRefresher(config)
+                        refresher.start()
+                        app.extensions["sqlite_snapshot_refresher"] = refresher
+                app.extensions["sqlite_read_replica"] = replica
+    return replica
+
+
+def route_request():
+    """The replica pool for this request, or None for the primary (db.request_pool calls this)."""
+    config = current_app.config
+    if not config["DB_READ_REPLICA"]:
+        return None
+    if request.method not in ("GET", "HEAD") or request.endpoint not in config["DB_REPLICA_ENDPOINTS"]:
+        return None
+    pool, taken_at = get_replica().current()
+    if pool is None:
+        return None
+    if taken_at is not None:
+        if time.time() - taken_at > config["DB_REPLICA_MAX_STALENESS"]:
+            return None
+        # Read your own writes: the snapshot must include this session's last one.
+        if session.get(db.LAST_WRITE_SESSION_KEY, 0) >= taken_at:
+            return None
+    return pool
+
+
+# Replicas inherited across a fork; see db._inherited.
+_inherited = []
+
+
+def _reset_after_fork(app):
+    global _init_lock
+    _init_lock = threading.Lock()
+    for key in ("sqlite_read_replica", "sqlite_snapshot_refresher"):
+        inherited = app.extensions.pop(key, None)
+        if inherited is not None:
+            _inherited.append(inherited)
+
+
+def init_app(app):
+    for key, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(key, value)
+    app.extensions["sqlite_read_router"] = route_request
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=lambda: _reset_after_fork(app))
+
+
+# --- CLI ---
+
+def main():
+    parser = argparse.ArgumentParser(description="Take a read-replica snapshot of the database.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    snapshot = commands.add_parser("snapshot", help="copy the database to the snapshot file")
+    snapshot.add_argument("--db", default=str(DB_PATH), help="database path")
+    snapshot.add_argument("--out", help="snapshot path (default: the database path + '-snapshot')")
+    args = parser.parse_args()
+
+    out = args.out or snapshot_path({"DB_SNAPSHOT_PATH": None, "DATABASE": args.db})
+    taken_at = take_snapshot(args.db, out)
+    print(f"Snapshot of {args.db} written to {out} ({time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(taken_at))}).")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
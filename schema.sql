@@ -1,11 +1,24 @@
 PRAGMA foreign_keys = ON;
 
+-- Base schema. Indexes and later changes live in migrations.py, which
+-- init_db.py runs after this file (and which upgrades existing databases).
+
 -- Drop tables if you re-run during dev (reverse dependency order)
+DROP TABLE IF EXISTS change_events;
+DROP TABLE IF EXISTS jobs;
+DROP TABLE IF EXISTS accrual_policies;
+DROP TABLE IF EXISTS balance_snapshots;
+DROP TABLE IF EXISTS balance_ledger;
+DROP TABLE IF EXISTS pto_days;
 DROP TABLE IF EXISTS pto_entries;
 DROP TABLE IF EXISTS pto_balances;
 DROP TABLE IF EXISTS employees;
 DROP TABLE IF EXISTS pto_types;
 DROP TABLE IF EXISTS managers;
+DROP TABLE IF EXISTS holiday_rules;
+DROP TABLE IF EXISTS holiday_calendars;
+DROP TABLE IF EXISTS change_counters;
+DROP TABLE IF EXISTS schema_version;
 
 -- Managers (people who log into the app)
 CREATE TABLE managers (
@@ -0,0 +1,101 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as app_module  # noqa: E402
+import balance_cache  # noqa: E402
+import db  # noqa: E402
+import fragment_cache  # noqa: E402
+import holiday_calendar  # noqa: E402
+import init_db  # noqa: E402
+import interval_index  # noqa: E402
+import ledger  # noqa: E402
+import pto_catalog  # noqa: E402
+
+
+def _reset_caches():
+    """Per-process caches are keyed by change counters, not by database; every test starts afresh."""
+    interval_index.reset()
+    pto_catalog.invalidate()
+    balance_cache.clear()
+    fragment_cache.clear()
+    holiday_calendar.clear_cache()
+
+
+def _reset_process_state(flask_app):
+    for key in ("sqlite_checkpointer", "sqlite_pool"):
+        resource = flask_app.extensions.pop(key, None)
+        if key == "sqlite_checkpointer" and resource is not None:
+            resource.stop()
+        elif resource is not None:
+            resource.close_all()
+    _reset_caches()
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = tmp_path / "pto.db"
+    monkeypatch.setattr(init_db, "DB_PATH", path)
+    init_db.init_db()
+    _reset_caches()
+    yield path
+    _reset_caches()
+
+
+@pytest.fixture
+def conn(db_path):
+    connection = db.connect(db_path)
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def app(db_path):
+    flask_app = app_module.app
+    saved_config = dict(flask_app.config)
+    flask_app.config.update(DATABASE=str(db_path), TESTING=True, JOB_WORKERS=0)
+    _reset_process_state(flask_app)
+    yield flask_app
+    _reset_process_state(flask_app)
+    flask_app.config.clear()
+    flask_app.config.update(saved_config)
+
+
+@pytest.fixture
+def client(app):
+    test_client = app.test_client()
+    response = test_client.post("/login", data={"username": "admin", "password": "password"})
+    assert response.status_code == 302
+    return test_client
+
+
+def add_employee(conn, first_name, last_name, team=None, employment_type="salaried", hire_date=None,
+                 hours=40.0):
+    """An active employee with an opening balance of every active PTO type; returns the id."""
+
+    def insert(conn):
+        employee_id = conn.execute(
+            """
+            INSERT INTO employees (first_name, last_name, employment_type, team, hire_date, status)
+            VALUES (?, ?, ?, ?, ?, 'active')
+            """,
+            (first_name, last_name, employment_type, team, hire_date),
+        ).lastrowid
+        conn.execute(
+            """
+            INSERT INTO pto_balances (employee_id, pto_type_id, hours_allotted, hours_used)
+            SELECT ?, id, ?, 0 FROM pto_types WHERE is_active = 1
+            """,
+            (employee_id, hours),
+        )
+        ledger.post_openings(conn, "employee_id = ?", (employee_id,))
+        return employee_id
+
+    return db.run_write(conn, insert)
+
+
+def type_id(conn, code):
+    return conn.execute("SELECT id FROM pto_types WHERE code = ?", (code,)).fetchone()[0]
@@ -0,0 +1,117 @@
+from datetime import date
+
+import pytest
+
+import accruals
+import db
+import entries
+import ledger
+from conftest import add_employee, type_id
+
+
+@pytest.fixture
+def vacation(conn):
+    return type_id(conn, "VACATION")
+
+
+def balance(conn, employee_id, pto_type_id):
+    row = conn.execute(
+        "SELECT hours_allotted, hours_used FROM pto_balances WHERE employee_id = ? AND pto_type_id = ?",
+        (employee_id, pto_type_id),
+    ).fetchone()
+    return row["hours_allotted"], row["hours_used"]
+
+
+def accrued_periods(conn, employee_id, pto_type_id):
+    return [
+        row[0] for row in conn.execute(
+            """
+            SELECT period FROM balance_ledger
+            WHERE employee_id = ? AND pto_type_id = ? AND kind = 'accrual'
+            ORDER BY effective_date
+            """,
+            (employee_id, pto_type_id),
+        )
+    ]
+
+
+def test_rerun_posts_nothing(conn, vacation):
+    ann = add_employee(conn, "Ann", "Staff", hours=0.0)
+    accruals.add_policy(conn, vacation, 8.0, "monthly", start_date=date(2025, 1, 1))
+
+    assert accruals.run(conn, date(2025, 1, 31)) == 1
+    assert accruals.run(conn, date(2025, 1, 31)) == 0
+    # Even with the progress marker lost, the period keys stop a second posting.
+    db.run_write(conn, lambda conn: conn.execute("UPDATE accrual_policies SET posted_through = NULL"))
+    assert accruals.run(conn, date(2025, 2, 10)) == 0
+    assert balance(conn, ann, vacation) == (8.0, 0.0)
+    assert ledger.drift(conn) == []
+
+
+def test_missed_periods_are_all_posted(conn, vacation):
+    ann = add_employee(conn, "Ann", "Staff", hours=0.0)
+    accruals.add_policy(conn, vacation, 8.0, "monthly", start_date=date(2025, 1, 15))
+    accruals.add_policy(conn, vacation, 2.0, "weekly", employment_type="hourly", start_date=date(2025, 1, 1))
+
+    assert accruals.run(conn, date(2025, 4, 30)) == 3  # February to April; January started before the policy
+    assert accrued_periods(conn, ann, vacation) == [
+        "monthly:2025-02-01", "monthly:2025-03-01", "monthly:2025-04-01",
+    ]
+    assert accruals.run(conn, date(2025, 7, 1)) == 2
+    assert balance(conn, ann, vacation) == (40.0, 0.0)
+    assert [row[0] for row in conn.execute("SELECT posted_through FROM accrual_policies ORDER BY id")] == [
+        "2025-06-30", "2025-06-29",  # the last full week ends on Sunday
+    ]
+
+
+def test_hire_date_and_seniority(conn, vacation):
+    new = add_employee(conn, "New", "Hire", hours=0.0, hire_date="2025-03-10")
+    senior = add_employee(conn, "Long", "Server", hours=0.0, hire_date="2015-01-01")
+    accruals.add_policy(conn, vacation, 8.0, "monthly", start_date=date(2025, 1, 1))
+    accruals.add_policy(conn, vacation, 12.0, "monthly", min_years_service=5, start_date=date(2025, 1, 1))
+
+    accruals.run(conn, date(2025, 4, 30))
+    assert balance(conn, new, vacation) == (16.0, 0.0)  # March (hired by its end) and April
+    assert balance(conn, senior, vacation) == (48.0, 0.0)
+
+
+def test_max_balance_caps_remaining_hours(conn, vacation):
+    ann = add_employee(conn, "Ann", "Staff", hours=0.0)
+    accruals.add_policy(conn, vacation, 8.0, "monthly", max_balance=20.0, start_date=date(2025, 1, 1))
+
+    assert accruals.run(conn, date(2025, 5, 31)) == 3  # 8, 16, then 4 up to the cap
+    assert balance(conn, ann, vacation) == (20.0, 0.0)
+
+    db.run_write(conn, lambda conn: entries.insert_entry(
+        conn, ann, vacation, "2025-06-02", "2025-06-02", 6.0, None, None
+    ))
+    assert accruals.run(conn, date(2025, 7, 31)) == 1  # June tops back up; July has no room
+    assert balance(conn, ann, vacation) == (26.0, 6.0)
+    assert ledger.drift(conn) == []
+
+
+def test_rollover_carries_capped_remaining_hours(conn, vacation):
+    ann = add_employee(conn, "Ann", "Staff")
+    bob = add_employee(conn, "Bob", "Staff")
+    accruals.add_policy(conn, vacation, 0.0, "annual", carry_over_cap=10.0, start_date=date(2025, 1, 1))
+    book = lambda employee_id, day, hours: db.run_write(  # noqa: E731
+        conn, lambda conn: entries.insert_entry(conn, employee_id, vacation, day, day, hours, None, None)
+    )
+    book(ann, "2025-03-03", 12.0)
+    book(ann, "2026-01-05", 4.0)  # booked into the new year: still counts against it
+    book(bob, "2025-03-03", 36.0)
+    # Opening balances are dated today; these employees have held theirs since before 2025.
+    db.run_write(conn, lambda conn: conn.execute(
+        "UPDATE balance_ledger SET effective_date = '2025-01-01' WHERE kind = 'opening'"
+    ))
+
+    assert accruals.rollover(conn, 2025) == 2
+    assert balance(conn, ann, vacation) == (10.0, 4.0)  # 28 remaining, capped at 10
+    assert balance(conn, bob, vacation) == (4.0, 0.0)  # 4 remaining, under the cap
+    assert ledger.balances_as_of(conn, ann, date(2025, 12, 31))[vacation] == (40.0, 12.0)
+
+    assert accruals.rollover(conn, 2025) == 0
+    assert balance(conn, ann, vacation) == (10.0, 4.0)
+    assert ledger.drift(conn) == []
+    # Types without a capped policy are left alone.
+    assert balance(conn, ann, type_id(conn, "SICK")) == (40.0, 0.0)
@@ -0,0 +1,32 @@
+import pytest
+
+import db
+from conftest import add_employee
+
+SINCE = "Thu, 01 Jan 2026 00:00:00 GMT"
+
+
+@pytest.mark.parametrize("suffix", ["", "/entries", "/balances"])
+def test_missing_employee_is_404_not_304(client, conn, suffix):
+    ann = add_employee(conn, "Ann", "Able")
+    # Counters last moved well in the past, so responses carry Last-Modified.
+    db.run_write(conn, lambda conn: conn.execute("UPDATE change_counters SET updated_at = '2025-01-01 00:00:00'"))
+
+    assert client.get(f"/api/v1/employees/{ann}{suffix}", headers={"If-Modified-Since": SINCE}).status_code == 304
+    # Last-Modified comes from the tables, not the employee, so it is just as
+    # current for an id that doesn't exist.
+    missing = client.get(f"/api/v1/employees/{ann + 1}{suffix}", headers={"If-Modified-Since": SINCE})
+    assert missing.status_code == 404
+    assert missing.get_json()["error"] == "Employee not found."
+
+
+def test_deleted_employee_is_404(client, conn):
+    ann = add_employee(conn, "Ann", "Able")
+    first = client.get(f"/api/v1/employees/{ann}")
+    assert first.status_code == 200
+    db.run_write(conn, lambda conn: conn.execute("DELETE FROM pto_balances WHERE employee_id = ?", (ann,)))
+    db.run_write(conn, lambda conn: conn.execute("DELETE FROM balance_ledger WHERE employee_id = ?", (ann,)))
+    db.run_write(conn, lambda conn: conn.execute("DELETE FROM employees WHERE id = ?", (ann,)))
+
+    again = client.get(f"/api/v1/employees/{ann}", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 404
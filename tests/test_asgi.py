@@ -0,0 +1,151 @@
+import asyncio
+
+import pytest
+
+import asgi
+import async_db
+import change_feed
+from conftest import add_employee
+
+
+def call(application, method, path, query=b"", headers=(), body_chunks=(b"",), disconnect_after=None):
+    """Run one request through the ASGI app; returns (status, headers, body, chunks sent)."""
+
+    async def run():
+        messages = [
+            {"type": "http.request", "body": chunk, "more_body": n < len(body_chunks) - 1}
+            for n, chunk in enumerate(body_chunks)
+        ]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            if disconnect_after is not None:
+                await asyncio.sleep(disconnect_after)
+                return {"type": "http.disconnect"}
+            await asyncio.sleep(3600)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": "http", "method": method, "path": path, "query_string": query, "root_path": "",
+            "http_version": "1.1", "scheme": "http", "server": ("localhost", 80),
+            "client": ("127.0.0.1", 5000),
+            "headers": [(b"host", b"localhost"), *headers],
+        }
+        await asyncio.wait_for(application(scope, receive, send), timeout=10)
+        return sent
+
+    sent = asyncio.run(run())
+    start = sent[0]
+    bodies = [message.get("body", b"") for message in sent[1:]]
+    return start["status"], dict(start["headers"]), b"".join(bodies), bodies
+
+
+@pytest.fixture
+def application(app):
+    return asgi.Application(app, threads=2)
+
+
+@pytest.fixture
+def cookie(client):
+    return (b"cookie", f"session={client.get_cookie('session').value}".encode())
+
+
+@pytest.mark.parametrize("path, query", [
+    ("/employees", b""),
+    ("/employees/1", b""),
+    ("/calendar", b"month=2025-03"),
+    ("/admin/pto-types", b""),
+])
+def test_async_twins_match_the_wsgi_views(application, client, cookie, conn, path, query):
+    add_employee(conn, "Ann", "Zed")
+    status, headers, body, _ = call(application, "GET", path, query, headers=[cookie])
+    response = client.get(f"{path}?{query.decode()}")
+    assert status == response.status_code == 200
+    assert body == response.data
+    assert headers[b"etag"].decode() == response.headers["ETag"]
+
+    status, _, body, _ = call(application, "GET", path, query, headers=[cookie, (b"if-none-match", headers[b"etag"])])
+    assert (status, body) == (304, b"")
+
+
+def test_async_twin_login_redirect(application):
+    status, headers, _, _ = call(application, "GET", "/calendar")
+    assert status == 302 and headers[b"location"].endswith(b"/login")
+
+
+def test_upload_arriving_in_chunks_reaches_the_wsgi_app(application, cookie, conn):
+    boundary = b"x-boundary"
+    rows = b"first_name,last_name,employment_type\n" + b"".join(
+        b"Person%d,Chunked,hourly\n" % n for n in range(200)
+    )
+    body = (
+        b"--" + boundary + b"\r\nContent-Disposition: form-data; name=\"kind\"\r\n\r\nemployees\r\n"
+        b"--" + boundary + b"\r\nContent-Disposition: form-data; name=\"file\"; filename=\"people.csv\"\r\n"
+        b"Content-Type: text/csv\r\n\r\n" + rows + b"\r\n--" + boundary + b"--\r\n"
+    )
+    chunks = [body[n:n + 512] for n in range(0, len(body), 512)]
+    status, _, page, _ = call(
+        application, "POST", "/admin/import",
+        headers=[cookie, (b"content-type", b"multipart/form-data; boundary=" + boundary),
+                 (b"content-length", str(len(body)).encode())],
+        body_chunks=chunks,
+    )
+    assert status == 200, page[:500]
+    assert conn.execute("SELECT COUNT(*) FROM employees WHERE last_name = 'Chunked'").fetchone()[0] == 200
+
+
+def test_form_without_content_length(application, cookie, conn):
+    add_employee(conn, "Ann", "Zed")
+    status, _, _, _ = call(
+        application, "POST", "/employees/1/pto/new",
+        headers=[cookie, (b"content-type", b"application/x-www-form-urlencoded")],
+        body_chunks=[b"pto_type_id=1&start_date=2025-06-02", b"&end_date=2025-06-02"],
+    )
+    assert status == 302
+    assert conn.execute("SELECT COUNT(*) FROM pto_entries").fetchone()[0] == 1
+
+
+def test_change_feed_streams_from_the_event_loop(application, app, cookie, conn):
+    add_employee(conn, "Ann", "Zed")
+    app.config.update(FEED_POLL_INTERVAL=0.05, FEED_STREAM_SECONDS=0.3)
+    status, headers, body, chunks = call(application, "GET", "/events", b"last_event_id=0", headers=[cookie])
+    assert status == 200 and headers[b"content-type"].startswith(b"text/event-stream")
+    assert body.startswith(b"retry: ") and len(chunks) > 1
+
+
+def test_change_feed_stream_ends_when_the_client_goes(application, app, cookie):
+    app.config.update(FEED_POLL_INTERVAL=0.05, FEED_STREAM_SECONDS=60)
+    status, _, _, _ = call(application, "GET", "/events", headers=[cookie], disconnect_after=0.2)
+    assert status == 200
+    assert change_feed._open_streams["async"] == 0
+
+
+def test_change_feed_over_the_limit_is_busy(application, app, cookie):
+    app.config.update(FEED_MAX_ASYNC_STREAMS=0)
+    status, headers, body, _ = call(application, "GET", "/events", headers=[cookie])
+    assert status == 503 and body.startswith(b"retry: ") and b"retry-after" in headers
+
+
+def test_async_db_threads_default_to_the_rest_of_the_pool(app):
+    app.config.update(DB_POOL_SIZE=8, ASYNC_DB_THREADS=None)
+    asgi.Application(app, threads=3)
+    assert app.config["ASYNC_DB_THREADS"] == 5
+
+
+def test_async_db_threads_beyond_the_pool_are_reported(app, caplog):
+    app.config.update(DB_POOL_SIZE=8, ASYNC_DB_THREADS=8)
+    with caplog.at_level("WARNING", logger="async_db"):
+        async_db.configure(app, 4)
+    assert "more than DB_POOL_SIZE" in caplog.text
+
+
+def test_every_twin_shares_its_views_decorators(app):
+    from app import ASYNC_VIEWS
+
+    assert set(ASYNC_VIEWS) == {"employees_list", "employee_detail", "calendar_view", "admin_pto_types", "events"}
+    for endpoint in ASYNC_VIEWS:
+        assert app.view_functions[endpoint].twin_decorators
@@ -0,0 +1,108 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from business_days import (
+    calculate_pto_hours,
+    calculate_pto_hours_batch,
+    count_business_days,
+    count_business_days_batch,
+)
+from holiday_calendar import HolidayCalendar
+
+
+def day_by_day(start_date, end_date, skip_weekends=True, holidays=()):
+    """The count as app.py used to do it: one date at a time."""
+    days = 0
+    current = start_date
+    while current <= end_date:
+        if (not skip_weekends or current.weekday() < 5) and current not in holidays:
+            days += 1
+        current += timedelta(days=1)
+    return days
+
+
+def rule(kind, month=None, day=None, weekday=None, nth=None, holiday_date=None, observed=1):
+    return {"kind": kind, "month": month, "day": day, "weekday": weekday, "nth": nth,
+            "holiday_date": holiday_date, "observed": observed}
+
+
+@pytest.fixture
+def holidays():
+    return HolidayCalendar(1, "Test", 1, [
+        rule("fixed", month=1, day=1),  # Saturday in 2022 and 2028: observed Dec 31
+        rule("fixed", month=7, day=4),
+        rule("fixed", month=12, day=25),
+        rule("nth_weekday", month=11, weekday=3, nth=4),
+        rule("last_weekday", month=5, weekday=0),
+        rule("fixed", month=2, day=29, observed=0),
+        rule("date", holiday_date="2025-08-15"),
+    ])
+
+
+def random_ranges(seed, count=2000, longest=800):
+    rng = random.Random(seed)
+    for _ in range(count):
+        start = date(2020, 1, 1) + timedelta(days=rng.randrange(3000))
+        yield start, start + timedelta(days=rng.randrange(longest))
+
+
+@pytest.mark.parametrize("skip_weekends", [True, False])
+def test_count_matches_day_by_day(skip_weekends):
+    for start, end in random_ranges(4):
+        assert count_business_days(start, end, skip_weekends) == day_by_day(start, end, skip_weekends)
+
+
+def test_every_short_range_from_every_weekday():
+    monday = date(2025, 6, 2)
+    for first in range(7):
+        for length in range(22):
+            start = monday + timedelta(days=first)
+            end = start + timedelta(days=length - 1)
+            assert count_business_days(start, end) == day_by_day(start, end)
+
+
+def test_empty_and_backwards_ranges():
+    day = date(2025, 6, 2)
+    assert count_business_days(day, day - timedelta(days=1)) == 0
+    assert count_business_days(day, day - timedelta(days=30)) == 0
+    assert calculate_pto_hours(day, day - timedelta(days=1)) is None
+
+
+@pytest.mark.parametrize("skip_weekends", [True, False])
+def test_batch_matches_single(skip_weekends):
+    ranges = list(random_ranges(5, count=500)) + [(date(2025, 6, 9), date(2025, 6, 2))]
+    starts = [start.toordinal() for start, _ in ranges]
+    ends = [end.toordinal() for _, end in ranges]
+    assert count_business_days_batch(starts, ends, skip_weekends) == [
+        count_business_days(start, end, skip_weekends) for start, end in ranges
+    ]
+
+
+@pytest.mark.parametrize("skip_weekends", [True, False])
+def test_holidays_match_day_by_day(holidays, skip_weekends):
+    for start, end in random_ranges(6, count=500):
+        observed = set(holidays.holidays_between(start, end))
+        assert holidays.count_working_days(start, end, skip_weekends) == \
+            day_by_day(start, end, skip_weekends, observed)
+
+
+def test_observed_holidays(holidays):
+    assert date(2021, 12, 31) in holidays.holidays_between(date(2021, 12, 1), date(2022, 1, 31))
+    assert date(2022, 1, 1) not in holidays.holidays_between(date(2021, 12, 1), date(2022, 1, 31))
+    assert date(2026, 7, 3) in holidays.holidays_between(date(2026, 7, 1), date(2026, 7, 31))
+    assert date(2025, 11, 27) in holidays.holidays_between(date(2025, 11, 1), date(2025, 11, 30))
+    assert date(2025, 5, 26) in holidays.holidays_between(date(2025, 5, 1), date(2025, 5, 31))
+    assert date(2028, 2, 29) in holidays.holidays_between(date(2028, 2, 1), date(2028, 3, 1))
+    # A Christmas week with the holiday on Thursday.
+    assert calculate_pto_hours("2025-12-22", "2025-12-26", holiday_calendar=holidays) == 32
+
+
+def test_hours(holidays):
+    assert calculate_pto_hours("2025-06-02", "2025-06-15") == 80
+    assert calculate_pto_hours("2025-06-02", "2025-06-15", hours_per_day=7.5, skip_weekends=False) == 105
+    assert calculate_pto_hours("2025-06-31", "2025-07-01") is None
+    pairs = [("2025-06-30", "2025-07-06"), ("bad", "2025-07-06"), (date(2025, 7, 7), "2025-07-01")]
+    assert calculate_pto_hours_batch(pairs) == [40, None, None]
+    assert calculate_pto_hours_batch(pairs, holiday_calendar=holidays) == [32, None, None]
@@ -0,0 +1,34 @@
+import csv
+import io
+import re
+import zipfile
+
+import exports
+from conftest import add_employee
+
+HOSTILE = ["=HYPERLINK(\"http://x\")", "+1+1", "-2+3", "@SUM(A1)", "\tTab", "\rReturn"]
+
+
+def test_csv_escapes_formula_cells():
+    rows = [[1, name, None, -4.5, "O'Neil - Ops"] for name in HOSTILE]
+    text = "".join(exports.stream_csv(("ID", "Name", "Team", "Hours", "Notes"), rows))
+    parsed = list(csv.reader(io.StringIO(text, newline="")))
+    assert [row[1] for row in parsed[1:]] == ["'" + name for name in HOSTILE]
+    assert parsed[1][2:] == ["", "-4.5", "O'Neil - Ops"]  # numbers and ordinary text untouched
+
+
+def test_xlsx_escapes_formula_cells():
+    rows = [[1, name, -4.5] for name in HOSTILE]
+    workbook = b"".join(exports.stream_xlsx("Sheet", ("ID", "Name", "Hours"), rows))
+    sheet = zipfile.ZipFile(io.BytesIO(workbook)).read("xl/worksheets/sheet1.xml").decode()
+    texts = re.findall(r'<t xml:space="preserve">([^<]*)</t>', sheet)
+    assert texts[3:] == ["'" + name for name in HOSTILE]
+    assert sheet.count('<c t="n"><v>-4.5</v></c>') == len(HOSTILE)
+
+
+def test_exported_names_are_escaped(client, conn):
+    add_employee(conn, "=cmd|' /C calc'!A0", "@Evil", team="+Ops")
+    response = client.get("/admin/export/balances?format=csv")
+    assert response.status_code == 200
+    parsed = list(csv.reader(io.StringIO(response.get_data(as_text=True), newline="")))
+    assert {tuple(row[1:4]) for row in parsed[1:]} == {("'=cmd|' /C calc'!A0", "'@Evil", "'+Ops")}
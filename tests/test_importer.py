@@ -0,0 +1,80 @@
+import io
+import json
+
+import pytest
+
+import importer
+
+
+def employee_csv(count):
+    lines = ["first_name,last_name,employment_type,email"]
+    lines += [f"First{n},Last{n},salaried,person{n}@example.com" for n in range(count)]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def employee_jsonl(count):
+    return "".join(
+        json.dumps({"first_name": f"First{n}", "last_name": f"Last{n}", "employment_type": "hourly"}) + "\n"
+        for n in range(count)
+    ).encode()
+
+
+def text_stream(data, errors="surrogateescape"):
+    return io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig", errors=errors, newline="")
+
+
+def employee_count(conn):
+    return conn.execute("SELECT COUNT(*) FROM employees").fetchone()[0]
+
+
+@pytest.mark.parametrize("fmt, build, first_line", [("csv", employee_csv, 2), ("jsonl", employee_jsonl, 1)])
+def test_bad_bytes_partway_keep_the_rows_before(conn, fmt, build, first_line):
+    data = build(3000) + b"Caf\xe9,Latin-1,salaried,\n" + build(5)
+    report = importer.run_import(conn, "employees", text_stream(data), fmt, chunk_size=500)
+
+    assert report.imported == 3000
+    assert report.errors == [(first_line + 3000, [importer.NOT_UTF8])]
+    assert employee_count(conn) == 3000
+
+
+def test_bad_bytes_in_a_strict_stream(conn):
+    data = employee_csv(3000) + b"Caf\xe9,Latin-1,salaried,\n"
+    report = importer.run_import(conn, "employees", text_stream(data, errors="strict"), "csv")
+
+    # Decoding stops at the start of the block holding the bad byte.
+    assert 2000 < report.imported < 3000
+    assert report.errors == [(2 + report.imported, [importer.NOT_UTF8])]
+    assert employee_count(conn) == report.imported
+
+
+def test_bad_bytes_at_the_start(conn):
+    report = importer.run_import(conn, "employees", text_stream(b"\xff\xfe\x00h\x00i"), "csv")
+    assert (report.imported, report.errors) == (0, [(1, [importer.NOT_UTF8])])
+
+
+def test_malformed_csv_record_is_skipped(conn):
+    huge = "x" * 200_000  # over csv.field_size_limit()
+    data = (
+        "first_name,last_name,employment_type\n"
+        "Ann,Able,salaried\n"
+        f"Bob,{huge},salaried\n"
+        "Cy,Cole,hourly\n"
+    ).encode()
+    report = importer.run_import(conn, "employees", text_stream(data), "csv")
+    assert report.imported == 2
+    assert [line_no for line_no, _ in report.errors] == [3]
+    assert report.errors[0][1][0].startswith("Invalid CSV:")
+
+
+def test_upload_with_bad_bytes_shows_the_partial_report(client, conn):
+    data = employee_csv(10) + b"Caf\xe9,Latin-1,salaried,\n"
+    response = client.post(
+        "/admin/import",
+        data={"kind": "employees", "file": (io.BytesIO(data), "people.csv")},
+        content_type="multipart/form-data",
+    )
+    page = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert "Imported 10 of 11 employee rows" in page
+    assert "isn&#39;t UTF-8 text" in page
+    assert employee_count(conn) == 10
@@ -0,0 +1,39 @@
+import pytest
+
+import instrumentation
+
+
+@pytest.fixture
+def metrics_settings(monkeypatch):
+    def configure(**settings):
+        for key, value in settings.items():
+            monkeypatch.setitem(instrumentation._settings, key, value)
+
+    return configure
+
+
+def get_metrics(client, remote_addr="127.0.0.1", headers=None):
+    return client.get("/metrics", headers=headers or {}, environ_base={"REMOTE_ADDR": remote_addr})
+
+
+def test_without_a_token_only_loopback_may_read(client, metrics_settings):
+    metrics_settings(METRICS_TOKEN=None, METRICS_PUBLIC=False)
+    assert get_metrics(client).status_code == 200
+    assert get_metrics(client, "::1").status_code == 200
+    assert get_metrics(client, "10.1.2.3").status_code == 401
+    # Through a proxy on the same host: the address is local, the client isn't.
+    assert get_metrics(client, headers={"X-Forwarded-For": "203.0.113.9"}).status_code == 401
+
+
+def test_public_metrics_must_be_asked_for(client, metrics_settings):
+    metrics_settings(METRICS_TOKEN=None, METRICS_PUBLIC=True)
+    assert get_metrics(client, "10.1.2.3").status_code == 200
+
+
+def test_token_is_required_from_anywhere(client, metrics_settings):
+    metrics_settings(METRICS_TOKEN="s3cret", METRICS_PUBLIC=True)
+    assert get_metrics(client).status_code == 401
+    assert get_metrics(client, headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = get_metrics(client, "10.1.2.3", headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    assert "pto_http_request_duration_seconds" in response.get_data(as_text=True)
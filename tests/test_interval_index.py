@@ -0,0 +1,231 @@
+import random
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import pytest
+
+import change_feed
+import db
+import entries
+import interval_index
+from conftest import add_employee
+
+
+def book(conn, employee_id, start, end, pto_type_id=1):
+    return db.run_write(
+        conn,
+        lambda conn: entries.insert_entry(
+            conn, employee_id, pto_type_id, start.isoformat(), end.isoformat(), 0.0, None, None
+        ),
+    )
+
+
+def cancel(conn, entry_id):
+    db.run_write(conn, lambda conn: entries.delete_entry(conn, entry_id))
+
+
+def brute_force(conn, employee_id, team, start, end):
+    """(employee has PTO in [start, end], most of the team out on one day of it) from the rows."""
+    rows = conn.execute(
+        """
+        SELECT e.employee_id, COALESCE(emp.team, '') AS team, e.start_date, e.end_date
+        FROM pto_entries e JOIN employees emp ON emp.id = e.employee_id
+        """
+    ).fetchall()
+    spans = [
+        (row["employee_id"], row["team"], date.fromisoformat(row["start_date"]), date.fromisoformat(row["end_date"]))
+        for row in rows
+    ]
+    overlaps = any(e == employee_id and s <= end and start <= f for e, _, s, f in spans)
+    most_out = 0
+    day = start
+    while day <= end:
+        most_out = max(most_out, sum(1 for _, t, s, f in spans if t == team and s <= day <= f))
+        day += timedelta(days=1)
+    return overlaps, most_out
+
+
+@pytest.fixture
+def staff(conn):
+    teams = ["Red", "Red", "Red", "Blue", "Blue", None, None, "Green"]
+    ids = [add_employee(conn, f"E{n}", "Staff", team=team) for n, team in enumerate(teams)]
+    return list(zip(ids, [team or "" for team in teams]))
+
+
+def check_against_brute_force(conn, staff, rng, queries=150):
+    index = interval_index.get_index(conn)
+    for _ in range(queries):
+        employee_id, team = rng.choice(staff)
+        start = date(2025, 1, 1) + timedelta(days=rng.randrange(120))
+        end = start + timedelta(days=rng.randrange(15))
+        s, e = start.toordinal(), end.toordinal()
+        assert (index.employee_overlaps(employee_id, s, e), index.max_team_out(team, s, e)) == \
+            brute_force(conn, employee_id, team, start, end)
+
+
+def test_overlaps_and_people_out_match_brute_force(conn, staff):
+    rng = random.Random(8)
+    booked = []
+    for _ in range(80):
+        employee_id, _ = rng.choice(staff)
+        start = date(2025, 1, 1) + timedelta(days=rng.randrange(120))
+        booked.append(book(conn, employee_id, start, start + timedelta(days=rng.randrange(10))))
+    check_against_brute_force(conn, staff, rng)
+
+    for entry_id in rng.sample(booked, 30):
+        cancel(conn, entry_id)
+    check_against_brute_force(conn, staff, rng)
+
+
+def test_find_conflicts_reports_overlap_and_limit(conn, staff):
+    (ann, team), (bob, _) = staff[0], staff[1]
+    book(conn, ann, date(2025, 3, 3), date(2025, 3, 7))
+    assert interval_index.find_conflicts(conn, ann, "2025-03-07", "2025-03-10") == [
+        "This PTO overlaps PTO already booked for this employee."
+    ]
+    assert interval_index.find_conflicts(conn, ann, "2025-03-08", "2025-03-10") == []
+    errors = interval_index.find_conflicts(conn, bob, "2025-03-05", "2025-03-05", max_people_out=1)
+    assert len(errors) == 1 and f"team {team}" in errors[0]
+    assert interval_index.find_conflicts(conn, bob, "2025-03-05", "2025-03-05", max_people_out=2) == []
+
+
+def test_dates_at_the_ends_of_the_calendar_are_not_clamped(conn, staff):
+    employee_id, _ = staff[0]
+    book(conn, employee_id, date(2999, 12, 30), date(2999, 12, 31))
+    assert interval_index.find_conflicts(conn, employee_id, "2999-12-31", "2999-12-31")
+    assert not interval_index.find_conflicts(conn, employee_id, "2999-12-29", "2999-12-29")
+    index = interval_index.get_index(conn)
+    assert not index.employee_overlaps(employee_id, date.min.toordinal(), date(2999, 12, 29).toordinal())
+    assert index.employee_overlaps(employee_id, date(2999, 12, 31).toordinal(), date.max.toordinal())
+
+
+@pytest.fixture
+def other_process():
+    """Writes made as another process would: to the database and change feed, not to our index."""
+    @contextmanager
+    def writing():
+        with pytest.MonkeyPatch.context() as patch:
+            patch.setattr(interval_index, "record_insert", lambda *args: None)
+            patch.setattr(interval_index, "record_delete", lambda *args: None)
+            yield
+
+    return writing
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    calls = []
+    original = interval_index.PtoIntervalIndex.load
+
+    def counting_load(self, conn):
+        calls.append(1)
+        return original(self, conn)
+
+    monkeypatch.setattr(interval_index.PtoIntervalIndex, "load", counting_load)
+    return calls
+
+
+def test_catch_up_after_another_connection_writes(db_path, conn, staff, other_process, loads):
+    (ann, _), (bob, _) = staff[0], staff[1]
+    kept = book(conn, ann, date(2025, 5, 5), date(2025, 5, 6))
+    interval_index.get_index(conn)
+    assert loads == [1]
+
+    other = db.connect(db_path)
+    try:
+        with other_process():
+            new = book(other, bob, date(2025, 5, 12), date(2025, 5, 14))
+            cancel(other, kept)
+    finally:
+        other.close()
+
+    assert interval_index.find_conflicts(conn, bob, "2025-05-14", "2025-05-20")
+    assert not interval_index.find_conflicts(conn, ann, "2025-05-05", "2025-05-05")
+    assert loads == [1]  # caught up from the change feed, no rescan
+    assert interval_index.get_index(conn).entries.keys() == {new}
+
+
+def test_catch_up_falls_back_to_a_rebuild_when_events_are_gone(conn, staff, other_process, loads):
+    ann, _ = staff[0]
+    interval_index.get_index(conn)
+    with other_process():
+        book(conn, ann, date(2025, 6, 2), date(2025, 6, 2))
+    db.run_write(conn, lambda conn: conn.execute("DELETE FROM change_events"))
+
+    assert interval_index.find_conflicts(conn, ann, "2025-06-02", "2025-06-02")
+    assert len(loads) == 2
+    assert interval_index.get_index(conn).event_id == change_feed.latest_id(conn)
+
+
+def test_all_or_nothing_batch_rolls_back_the_index(conn, staff):
+    (ann, _), (bob, _) = staff[0], staff[1]
+    book(conn, bob, date(2025, 7, 7), date(2025, 7, 7))
+    candidates = [
+        {"key": 1, "employee_id": ann, "pto_type_id": 1, "start_date": "2025-07-01",
+         "end_date": "2025-07-02", "hours": 8.0, "notes": None},
+        {"key": 2, "employee_id": bob, "pto_type_id": 1, "start_date": "2025-07-07",
+         "end_date": "2025-07-07", "hours": 8.0, "notes": None},  # overlaps Bob's entry
+    ]
+    with pytest.raises(entries.BatchRejected) as rejected:
+        db.run_write(conn, lambda conn: entries.insert_entries(conn, candidates, None, [], atomic=True))
+    assert [key for key, _ in rejected.value.rejected] == [2]
+
+    assert conn.execute("SELECT COUNT(*) FROM pto_entries WHERE employee_id = ?", (ann,)).fetchone()[0] == 0
+    assert interval_index.find_conflicts(conn, ann, "2025-07-01", "2025-07-02") == []
+    book(conn, ann, date(2025, 7, 1), date(2025, 7, 2))
+
+
+def test_team_change_moves_entries_between_teams(conn, staff, loads):
+    (ann, red), (dan, blue) = staff[0], staff[3]
+    book(conn, ann, date(2025, 8, 4), date(2025, 8, 8))
+    index = interval_index.get_index(conn)
+    day = date(2025, 8, 6).toordinal()
+    assert (index.max_team_out(red, day, day), index.max_team_out(blue, day, day)) == (1, 0)
+
+    db.run_write(conn, lambda conn: conn.execute("UPDATE employees SET team = ? WHERE id = ?", (blue, ann)))
+    assert interval_index.find_conflicts(conn, dan, "2025-08-06", "2025-08-06", max_people_out=1)
+    index = interval_index.get_index(conn)
+    assert (index.max_team_out(red, day, day), index.max_team_out(blue, day, day)) == (0, 1)
+    assert loads == [1]
+    check_against_brute_force(conn, staff[:3] + [(ann, blue)] + staff[3:], random.Random(4), queries=40)
+
+
+
+def test_rolled_back_write_leaves_nothing_in_the_index(db_path, conn, staff, other_process):
+    (ann, _), (bob, _) = staff[0], staff[1]
+    interval_index.get_index(conn)
+
+    def book_then_fail(conn):
+        entries.insert_entry(conn, ann, 1, "2025-09-01", "2025-09-05", 0.0, None, None)
+        raise ValueError("later step failed")
+
+    with pytest.raises(ValueError):
+        db.run_write(conn, book_then_fail)
+    # Another process's insert brings the counters back to where the
+    # rolled-back write left the index.
+    other = db.connect(db_path)
+    try:
+        with other_process():
+            book(other, bob, date(2025, 9, 1), date(2025, 9, 1))
+    finally:
+        other.close()
+
+    assert interval_index.find_conflicts(conn, ann, "2025-09-03", "2025-09-03") == []
+    assert interval_index.find_conflicts(conn, bob, "2025-09-01", "2025-09-01")
+    check_against_brute_force(conn, staff, random.Random(9), queries=40)
+
+
+def test_rolled_back_batch_is_dropped_from_the_index(conn, staff):
+    ann, _ = staff[0]
+    candidates = [
+        {"key": 1, "employee_id": ann, "pto_type_id": 1, "start_date": "2025-10-06",
+         "end_date": "2025-10-07", "hours": 8.0, "notes": None},
+    ]
+
+    def book_batch_then_fail(conn):
+        entries.insert_entries(conn, candidates, None, None)
+        raise ValueError("later step failed")
+
+    with pytest.raises(ValueError):
+        db.run_write(conn, book_batch_then_fail)
+    assert interval_index.find_conflicts(conn, ann, "2025-10-06", "2025-10-06") == []
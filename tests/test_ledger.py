@@ -0,0 +1,121 @@
+import random
+from datetime import date, timedelta
+
+import db
+import entries
+import ledger
+from conftest import add_employee
+
+
+def summed(conn, employee_id, as_of):
+    """Balances as of a date by adding up every ledger row: what balances_as_of must equal."""
+    rows = conn.execute(
+        """
+        SELECT pto_type_id, SUM(allotted_delta) AS allotted, SUM(used_delta) AS used
+        FROM balance_ledger
+        WHERE employee_id = ? AND effective_date <= ?
+        GROUP BY pto_type_id
+        """,
+        (employee_id, as_of.isoformat() if as_of else ledger.END_OF_TIME),
+    ).fetchall()
+    return {row["pto_type_id"]: (row["allotted"], row["used"]) for row in rows}
+
+
+def post_history(conn, employee_ids, rng, count):
+    type_ids = [row[0] for row in conn.execute("SELECT id FROM pto_types WHERE is_active = 1")]
+    rows = [
+        {
+            "employee_id": rng.choice(employee_ids),
+            "pto_type_id": rng.choice(type_ids),
+            "kind": rng.choice(("accrual", "usage", "adjustment")),
+            "allotted_delta": float(rng.randrange(-8, 9)),
+            "used_delta": float(rng.randrange(0, 9)),
+            "effective_date": (date(2025, 1, 1) + timedelta(days=rng.randrange(400))).isoformat(),
+        }
+        for _ in range(count)
+    ]
+    db.run_write(conn, lambda conn: ledger.post(conn, rows))
+
+
+def check_as_of(conn, employee_ids, rng, checks=60):
+    for _ in range(checks):
+        employee_id = rng.choice(employee_ids)
+        as_of = rng.choice([None, date(2024, 12, 31), date(2025, 1, 1) + timedelta(days=rng.randrange(420))])
+        assert ledger.balances_as_of(conn, employee_id, as_of) == summed(conn, employee_id, as_of)
+
+
+def test_as_of_is_snapshot_plus_ledger_delta(conn):
+    rng = random.Random(15)
+    employee_ids = [add_employee(conn, f"E{n}", "Staff") for n in range(5)]
+    post_history(conn, employee_ids, rng, 300)
+    check_as_of(conn, employee_ids, rng)
+
+    for as_of in (date(2025, 3, 31), date(2025, 6, 30), date(2025, 12, 31)):
+        assert ledger.checkpoint(conn, as_of) > 0
+    check_as_of(conn, employee_ids, rng)
+
+    # Rows dated inside checkpointed periods drop the snapshots they would make wrong.
+    post_history(conn, employee_ids, rng, 50)
+    check_as_of(conn, employee_ids, rng)
+    stale = conn.execute(
+        """
+        SELECT COUNT(*) FROM balance_snapshots s
+        WHERE EXISTS (
+            SELECT 1 FROM balance_ledger l
+            WHERE l.employee_id = s.employee_id AND l.pto_type_id = s.pto_type_id
+                AND l.effective_date <= s.as_of AND l.id > (SELECT MAX(id) - 50 FROM balance_ledger)
+        )
+        """
+    ).fetchone()[0]
+    assert stale == 0
+
+
+def test_snapshot_values_are_used(conn):
+    employee_id = add_employee(conn, "Ann", "Staff")
+    ledger.checkpoint(conn, date(2099, 1, 1))
+    # Edit the snapshot directly: the result must come from it, not from a full sum.
+    db.run_write(conn, lambda conn: conn.execute(
+        "UPDATE balance_snapshots SET hours_allotted = hours_allotted + 1000 WHERE employee_id = ?",
+        (employee_id,),
+    ))
+    balances = ledger.balances_as_of(conn, employee_id, date(2099, 6, 1))
+    assert balances and all(allotted == 1040.0 for allotted, _ in balances.values())
+
+
+def test_bookings_keep_balances_and_ledger_in_step(conn):
+    ann, bob = add_employee(conn, "Ann", "Staff"), add_employee(conn, "Bob", "Staff")
+    book = lambda employee_id, start, end, hours: db.run_write(  # noqa: E731
+        conn, lambda conn: entries.insert_entry(conn, employee_id, 1, start, end, hours, None, None)
+    )
+    first = book(ann, "2025-03-03", "2025-03-04", 16.0)
+    book(bob, "2025-04-07", "2025-04-07", 8.0)
+    db.run_write(conn, lambda conn: entries.delete_entry(conn, first))
+    book(ann, "2025-05-05", "2025-05-05", 8.0)
+    assert ledger.drift(conn) == []
+    assert ledger.balances_as_of(conn, ann)[1] == (40.0, 8.0)
+    assert ledger.balances_as_of(conn, ann, date(2025, 3, 31))[1][1] == 0.0
+
+
+def test_reconcile_reports_and_fixes_drift(conn):
+    ann, bob = add_employee(conn, "Ann", "Staff"), add_employee(conn, "Bob", "Staff")
+    db.run_write(conn, lambda conn: conn.execute(
+        "UPDATE pto_balances SET hours_used = 12 WHERE employee_id = ? AND pto_type_id = 1", (ann,)
+    ))
+    db.run_write(conn, lambda conn: ledger.post(conn, [
+        {"employee_id": bob, "pto_type_id": 2, "kind": "accrual", "allotted_delta": 4.0},
+    ]))
+
+    rows = ledger.reconcile(conn)
+    assert [(row["employee_id"], row["pto_type_id"]) for row in rows] == [(ann, 1), (bob, 2)]
+    assert conn.execute(
+        "SELECT hours_used FROM pto_balances WHERE employee_id = ? AND pto_type_id = 1", (ann,)
+    ).fetchone()[0] == 12  # reported, not changed
+
+    assert len(ledger.reconcile(conn, fix=True)) == 2
+    assert ledger.drift(conn) == []
+    balances = {
+        (row["employee_id"], row["pto_type_id"]): (row["hours_allotted"], row["hours_used"])
+        for row in conn.execute("SELECT * FROM pto_balances")
+    }
+    assert balances[(ann, 1)] == (40.0, 0.0)
+    assert balances[(bob, 2)] == (44.0, 0.0)
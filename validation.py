@@ -0,0 +1,112 @@
+"""
+Field validation shared by the form routes and the bulk importer, so a row
+in an import file is held to exactly the rules of the matching form.
+
+Each function returns a list of error messages (empty when valid) and, where
+the form derives values, the parsed values as well.
+"""
+from datetime import date, datetime
+
+from business_days import calculate_pto_hours
+
+EMPLOYMENT_TYPES = ("hourly", "salaried")
+
+# Dates a PTO entry may fall on, checked before any holiday calendar work.
+EARLIEST_ENTRY_DATE = date(1900, 1, 1)
+LATEST_ENTRY_DATE = date(2999, 12, 31)
+
+# Longest PTO entry, in calendar days. Each day of an entry is a pto_days
+# row and part of its change feed event, so ranges can't be open-ended.
+MAX_ENTRY_DAYS = 366
+
+
+def validate_employee(first_name, last_name, employment_type, hire_date=""):
+    errors = []
+    if not first_name:
+        errors.append("First name is required.")
+    if not last_name:
+        errors.append("Last name is required.")
+    if employment_type not in EMPLOYMENT_TYPES:
+        errors.append("Employment type must be hourly or salaried.")
+    if hire_date:
+        try:
+            if datetime.strptime(hire_date, "%Y-%m-%d").date() > date.today():
+                errors.append("Hire date cannot be in the future.")
+        except ValueError:
+            errors.append("Hire date must be YYYY-MM-DD.")
+    return errors
+
+
+def validate_pto_entry(pto_type_id, start_date, end_date, hours_str, holidays=None):
+    """
+    Validate a PTO entry's fields (everything but the balance check).
+
+    Hours are calculated from the dates when hours_str is blank.
+
+    Returns:
+        (errors, pto_type_id_int, hours)
+    """
+    errors = []
+
+    # Validate pto_type_id exists
+    try:
+        pto_type_id_int = int(pto_type_id)
+    except (TypeError, ValueError):
+        pto_type_id_int = None
+    if not pto_type_id_int:
+        errors.append("Please select a PTO type.")
+
+    if not start_date:
+        errors.append("Start date is required.")
+    if not end_date:
+        errors.append("End date is required.")
+
+    # Validate date range if both dates are present
+    if start_date and end_date:
+        try:
+            start_dt = datetime.strptime(start_date, "%Y-%m-%d").date()
+            end_dt = datetime.strptime(end_date, "%Y-%m-%d").date()
+            if not all(EARLIEST_ENTRY_DATE <= d <= LATEST_ENTRY_DATE for d in (start_dt, end_dt)):
+                errors.append(
+                    f"Dates must be between {EARLIEST_ENTRY_DATE.isoformat()} "
+                    f"and {LATEST_ENTRY_DATE.isoformat()}."
+                )
+            elif end_dt < start_dt:
+                errors.append("End date cannot be before start date.")
+            elif (end_dt - start_dt).days + 1 > MAX_ENTRY_DAYS:
+                errors.append(f"PTO entries can cover at most {MAX_ENTRY_DAYS} days.")
+        except ValueError:
+            errors.append("Invalid date format.")
+
+    # Auto-calculate hours if not provided
+    hours = None
+    if hours_str:
+        # User provided hours - validate it
+        try:
+            hours = float(hours_str)
+            if hours <= 0:
+                errors.append("Hours must be greater than 0.")
+        except ValueError:
+            errors.append("Hours must be a valid number (e.g. 8 or 4.5).")
+    elif start_date and end_date and not errors:
+        # No hours provided - calculate from dates
+        calculated_hours = calculate_pto_hours(start_date, end_date, holiday_calendar=holidays)
+        if calculated_hours is not None and calculated_hours > 0:
+            hours = calculated_hours
+        else:
+            errors.append("Could not calculate hours from the provided dates.")
+
+    # Ensure hours is set
+    if hours is None:
+        errors.append("Hours must be a valid number (e.g. 8 or 4.5).")
+
+    return errors, pto_type_id_int, hours
+
+
+def balance_error(remaining, hours):
+    """The form's balance message, or None when the hours fit."""
+    if remaining is None:
+        return "No PTO balance found for this PTO type."
+    if hours > remaining:
+        return f"Not enough PTO remaining. Remaining: {remaining:.2f} hours."
+    return None
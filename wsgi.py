@@ -0,0 +1,43 @@
+"""
+Production entry point.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Settings come from the environment so the same build runs anywhere:
+
+    PTO_SECRET_KEY   session signing key (required outside development)
+    PTO_DATABASE     path to the SQLite database (default: pto_tracker.db here)
+    PTO_READ_REPLICA "readonly" or "snapshot" to serve read-only pages from a
+                     read replica (see read_replica.py)
+
+Importing this module loads the app and compiles every template. With
+gunicorn's preload_app that happens once in the master, and workers fork
+with the code and templates already in memory. Nothing here opens the
+database: connections, caches and background threads are per process and
+start in each worker (see the register_at_fork hooks in db, jobs and the
+cache modules).
+"""
+import os
+
+from app import app
+
+
+def configure(app):
+    secret_key = os.environ.get("PTO_SECRET_KEY")
+    if secret_key:
+        app.secret_key = secret_key
+    if os.environ.get("PTO_DATABASE"):
+        app.config["DATABASE"] = os.environ["PTO_DATABASE"]
+    if os.environ.get("PTO_READ_REPLICA"):
+        app.config["DB_READ_REPLICA"] = os.environ["PTO_READ_REPLICA"]
+    app.config["TEMPLATES_AUTO_RELOAD"] = False
+
+
+def preload_templates(app):
+    """Compile every template now rather than on each worker's first request."""
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+
+configure(app)
+preload_templates(app)